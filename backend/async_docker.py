@@ -0,0 +1,568 @@
+"""
+Asyncio client for the Docker Engine API.
+
+AsyncDockerPlugin covers the container operations of docker_plugin.DockerPlugin
+(run, pulling the image when the host lacks it, stop, restart, inspect, exec,
+logs, events and readiness) without the blocking docker SDK, so ASGI views can
+await them on the event loop instead of holding a thread each. It speaks HTTP/1.1 to the daemon itself over
+
+- unix:///path/to/docker.sock  the local socket
+- tcp://host:port              a daemon listening on TCP
+- ssh://user@host[:port]       `ssh ... docker system dial-stdio`, the tunnel the
+                               docker CLI uses; key_file is passed to ssh -i
+
+Request/response calls reuse keep-alive connections, at most max_size at a
+time per daemon. Streaming calls (logs, events) get a connection of their own
+that is closed when the stream ends, so long-lived streams never starve the
+request slots. Like DockerPlugin, methods log daemon errors and return None or
+False rather than raising.
+"""
+import asyncio
+import json
+import logging
+import shlex
+import struct
+import time
+import weakref
+from collections import deque
+from contextlib import aclosing
+from urllib.parse import quote, urlencode, urlparse
+
+from docker.utils import parse_bytes, parse_repository_tag
+
+from docker_plugin import CONTAINER_RESOURCES, MANAGED_LABEL, generate_password
+
+API_VERSION = "1.41"
+
+# Seconds an image pull may take, including the download
+PULL_TIMEOUT = 600
+
+# Errors that mean the connection to the daemon is unusable
+CONNECTION_ERRORS = (ConnectionError, asyncio.IncompleteReadError, EOFError, OSError)
+
+
+class DockerAPIError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+
+class _Connection:
+    def __init__(self, reader, writer, process=None):
+        self.reader = reader
+        self.writer = writer
+        self.process = process
+
+    def usable(self):
+        return not self.reader.at_eof() and not self.writer.is_closing()
+
+    async def close(self):
+        try:
+            self.writer.close()
+            if self.process is not None:
+                if self.process.returncode is None:
+                    self.process.kill()
+                await self.process.wait()
+        except (OSError, ProcessLookupError) as error:
+            logging.error(error)
+
+
+class _Response:
+    def __init__(self, status: int, headers: dict, connection: _Connection):
+        self.status = status
+        self.headers = headers
+        self.connection = connection
+        # False when the body runs to EOF, so the connection cannot be reused
+        self.reusable = headers.get("connection", "").lower() != "close"
+
+    async def chunks(self):
+        """The body as it arrives"""
+        reader = self.connection.reader
+        if self.status in (204, 304):
+            return
+        if self.headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    await reader.readline()
+                    return
+                chunk = await reader.readexactly(size)
+                await reader.readexactly(2)
+                yield chunk
+        elif "content-length" in self.headers:
+            remaining = int(self.headers["content-length"])
+            while remaining:
+                chunk = await reader.read(min(remaining, 65536))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            self.reusable = False
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                yield chunk
+
+    async def read(self):
+        return b"".join([chunk async for chunk in self.chunks()])
+
+    async def lines(self):
+        """Newline-delimited body, as the events endpoint sends it"""
+        buffer = b""
+        async for chunk in self.chunks():
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+
+
+def _error_message(body: bytes):
+    try:
+        return json.loads(body).get("message", "")
+    except ValueError:
+        return body.decode(errors="replace")
+
+
+class AsyncDockerPlugin:
+    def __init__(self, base_url: str = "unix:///var/run/docker.sock", key_file: str = None,
+                 max_size: int = 32, timeout: float = 60):
+        self.base_url = base_url
+        self.key_file = key_file
+        self.timeout = timeout
+        self._idle = deque()
+        self._slots = asyncio.Semaphore(max_size)
+
+    # Transport
+
+    async def _open(self):
+        url = urlparse(self.base_url)
+        if url.scheme in ("unix", "http+unix"):
+            # unix://var/run/docker.sock is how docker-py spells the absolute path too
+            path = "/" + (url.netloc + url.path).lstrip("/")
+            reader, writer = await asyncio.open_unix_connection(path)
+            return _Connection(reader, writer)
+        if url.scheme in ("tcp", "http"):
+            reader, writer = await asyncio.open_connection(url.hostname, url.port or 2375)
+            return _Connection(reader, writer)
+        if url.scheme == "ssh":
+            command = ["ssh", "-o", "BatchMode=yes", "-o", "ConnectTimeout=10"]
+            if url.port:
+                command += ["-p", str(url.port)]
+            if self.key_file:
+                command += ["-i", self.key_file]
+            destination = f"{url.username}@{url.hostname}" if url.username else url.hostname
+            process = await asyncio.create_subprocess_exec(
+                *command, destination, "docker", "system", "dial-stdio",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            return _Connection(process.stdout, process.stdin, process)
+        raise ValueError(f"Unsupported Docker host URL {self.base_url}")
+
+    async def _send(self, connection, method: str, path: str, params: dict = None, body=None):
+        query = f"?{urlencode(params)}" if params else ""
+        payload = b"" if body is None else json.dumps(body).encode()
+        head = [
+            f"{method} /v{API_VERSION}{path}{query} HTTP/1.1",
+            "Host: docker",
+            "User-Agent: atlas",
+            f"Content-Length: {len(payload)}",
+        ]
+        if body is not None:
+            head.append("Content-Type: application/json")
+        connection.writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + payload)
+        await connection.writer.drain()
+
+        status_line = await connection.reader.readline()
+        if not status_line:
+            raise ConnectionError("Docker daemon closed the connection")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await connection.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return _Response(status, headers, connection)
+
+    async def _request(self, method: str, path: str, params: dict = None, body=None, timeout: float = None):
+        """(status, body bytes) of a request over a pooled connection"""
+        async with self._slots:
+            # A reused connection may have been closed by the daemon while idle; retry once on a new one
+            for attempt in range(2):
+                connection = None
+                while self._idle and connection is None:
+                    candidate = self._idle.pop()
+                    if candidate.usable():
+                        connection = candidate
+                    else:
+                        await candidate.close()
+                reused = connection is not None
+                if connection is None:
+                    connection = await self._open()
+                try:
+                    response = await asyncio.wait_for(
+                        self._exchange(connection, method, path, params, body), timeout or self.timeout
+                    )
+                except (*CONNECTION_ERRORS, asyncio.TimeoutError):
+                    await connection.close()
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                status, data, reusable = response
+                if reusable:
+                    self._idle.append(connection)
+                else:
+                    await connection.close()
+                return status, data
+
+    async def _exchange(self, connection, method, path, params, body):
+        response = await self._send(connection, method, path, params, body)
+        data = await response.read()
+        return response.status, data, response.reusable
+
+    async def _call(self, method: str, path: str, params: dict = None, body=None, timeout: float = None,
+                    ok=(200, 201, 204, 304)):
+        """Decoded JSON of a successful call; DockerAPIError otherwise"""
+        status, data = await self._request(method, path, params, body, timeout)
+        if status not in ok:
+            raise DockerAPIError(status, _error_message(data))
+        if not data:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return data
+
+    async def _stream(self, path: str, params: dict = None):
+        """Response of a streaming GET, on a connection that is closed when it is done with"""
+        connection = await self._open()
+        try:
+            response = await asyncio.wait_for(self._send(connection, "GET", path, params), self.timeout)
+        except BaseException:
+            await connection.close()
+            raise
+        if response.status != 200:
+            data = await response.read()
+            await connection.close()
+            raise DockerAPIError(response.status, _error_message(data))
+        return response
+
+    async def close(self):
+        idle, self._idle = list(self._idle), deque()
+        for connection in idle:
+            await connection.close()
+
+    # Containers
+
+    async def ping(self):
+        try:
+            status, _ = await self._request("GET", "/_ping")
+            return status == 200
+        except (*CONNECTION_ERRORS, asyncio.TimeoutError) as error:
+            logging.error(error)
+        return False
+
+    async def inspect_container(self, container_id: str):
+        try:
+            return await self._call("GET", f"/containers/{quote(container_id)}/json")
+        except (DockerAPIError, *CONNECTION_ERRORS, asyncio.TimeoutError) as error:
+            logging.error(error)
+        return None
+
+    async def get_container_ports(self, container_id: str):
+        container = await self.inspect_container(container_id)
+        if not container:
+            return None
+        return container.get("NetworkSettings", {}).get("Ports") or None
+
+    async def run_container(self, image: str, port: int, container_name: str = None, labels: dict = None,
+                            resources: dict = None, host_port: int = None):
+        password = generate_password()
+        resources = {**CONTAINER_RESOURCES, **(resources or {})}
+        host_config = {
+            "AutoRemove": True,
+            # An empty HostPort lets the daemon pick an ephemeral port
+            "PortBindings": {f"{port}/tcp": [{"HostPort": str(host_port) if host_port else ""}]},
+            "CpuQuota": resources["cpu_quota"],
+            "CpuPeriod": resources["cpu_period"],
+            "Memory": parse_bytes(resources["memory"]),
+        }
+        if resources["pids_limit"]:
+            host_config["PidsLimit"] = resources["pids_limit"]
+        if resources["cpuset_cpus"]:
+            host_config["CpusetCpus"] = resources["cpuset_cpus"]
+        if resources["tmpfs"]:
+            host_config["Tmpfs"] = resources["tmpfs"]
+
+        def create():
+            return self._call(
+                "POST", "/containers/create",
+                params={"name": container_name} if container_name else None,
+                body={
+                    "Image": image,
+                    "Tty": True,
+                    "Labels": {MANAGED_LABEL: "true", **(labels or {})},
+                    "Env": [f"PASS={password}"],
+                    "ExposedPorts": {f"{port}/tcp": {}},
+                    "HostConfig": host_config,
+                },
+            )
+
+        try:
+            try:
+                created = await create()
+            except DockerAPIError as error:
+                # The image is not on this host yet; containers.run() pulls it on the sync path too
+                if error.status_code != 404 or not await self.pull_image(image):
+                    raise
+                created = await create()
+        except (DockerAPIError, *CONNECTION_ERRORS, asyncio.TimeoutError) as error:
+            logging.error(error)
+            return None
+
+        container_id = created["Id"]
+        try:
+            await self._call("POST", f"/containers/{container_id}/start")
+        except (DockerAPIError, *CONNECTION_ERRORS, asyncio.TimeoutError) as error:
+            logging.error(error)
+            await self.remove_container(container_id)
+            return None
+        return container_id, password
+
+    async def pull_image(self, image: str):
+        """Pull image from its registry, True once the daemon has it"""
+        repository, tag = parse_repository_tag(image)
+        try:
+            status, data = await self._request(
+                "POST", "/images/create", params={"fromImage": repository, "tag": tag or "latest"},
+                timeout=PULL_TIMEOUT,
+            )
+        except (*CONNECTION_ERRORS, asyncio.TimeoutError) as error:
+            logging.error(error)
+            return False
+        if status != 200:
+            logging.error(DockerAPIError(status, _error_message(data)))
+            return False
+        # A pull that fails once it has started still answers 200, with the error in its progress stream
+        for line in data.splitlines():
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(message, dict) and "error" in message:
+                logging.error(message["error"])
+                return False
+        return True
+
+    async def remove_container(self, container_id: str):
+        try:
+            await self._call("DELETE", f"/containers/{quote(container_id)}", params={"force": 1}, ok=(204, 404))
+            return True
+        except (DockerAPIError, *CONNECTION_ERRORS, asyncio.TimeoutError) as error:
+            logging.error(error)
+        return False
+
+    async def stop_container(self, container_id: str, timeout: int = None):
+        params = {"t": timeout} if timeout is not None else None
+        try:
+            # A 404 means the container is already gone, which is what was asked for
+            await self._call(
+                "POST", f"/containers/{quote(container_id)}/stop", params=params,
+                timeout=self.timeout + (timeout or 10), ok=(204, 304, 404),
+            )
+            return True
+        except (DockerAPIError, *CONNECTION_ERRORS, asyncio.TimeoutError) as error:
+            logging.error(error)
+        return False
+
+    async def restart_container(self, container_id: str):
+        try:
+            await self._call("POST", f"/containers/{quote(container_id)}/restart", timeout=self.timeout + 10)
+            return True
+        except (DockerAPIError, *CONNECTION_ERRORS, asyncio.TimeoutError) as error:
+            logging.error(error)
+        return False
+
+    async def list_managed_containers(self):
+        try:
+            return await self._call(
+                "GET", "/containers/json",
+                params={"filters": json.dumps({"label": [f"{MANAGED_LABEL}=true"]})},
+            )
+        except (DockerAPIError, *CONNECTION_ERRORS, asyncio.TimeoutError) as error:
+            logging.error(error)
+        return None
+
+    async def exec_run(self, container_id: str, command: list, user: str = ""):
+        """(exit code, output) of a command run inside the container, None on errors"""
+        try:
+            created = await self._call(
+                "POST", f"/containers/{quote(container_id)}/exec",
+                body={"Cmd": command, "User": user, "AttachStdout": True, "AttachStderr": True},
+            )
+            output = await self._call(
+                "POST", f"/exec/{created['Id']}/start", body={"Detach": False, "Tty": False},
+            )
+            result = await self._call("GET", f"/exec/{created['Id']}/json")
+        except (DockerAPIError, *CONNECTION_ERRORS, asyncio.TimeoutError) as error:
+            logging.error(error)
+            return None
+        return result.get("ExitCode"), output
+
+    async def set_password(self, container_id: str, user: str, password: str):
+        """Change a user's password inside a running container"""
+        result = await self.exec_run(
+            container_id,
+            ["sh", "-c", f"echo {shlex.quote(f'{user}:{password}')} | chpasswd"],
+            user="root",
+        )
+        if result is None:
+            return False
+        exit_code, output = result
+        if exit_code == 0:
+            return True
+        logging.error(f"chpasswd failed in {container_id}: {output}")
+        return False
+
+    # Streams
+
+    async def events(self, filters: dict = None, since: int = None, until: int = None):
+        """Async iterator of the daemon's events as dicts"""
+        params = {}
+        if filters:
+            params["filters"] = json.dumps({key: [value] for key, value in filters.items()})
+        if since is not None:
+            params["since"] = since
+        if until is not None:
+            params["until"] = until
+        response = await self._stream("/events", params)
+        try:
+            async for line in response.lines():
+                yield json.loads(line)
+        finally:
+            await response.connection.close()
+
+    async def logs(self, container_id: str, follow: bool = False, tail=None, since: int = None,
+                   timestamps: bool = False):
+        """
+        Async iterator of the container's log output in chunks of bytes. With
+        follow the iterator keeps going until the container stops or the caller
+        stops iterating.
+        """
+        container = await self.inspect_container(container_id)
+        if container is None:
+            return
+        params = {"stdout": 1, "stderr": 1, "follow": int(follow), "timestamps": int(timestamps)}
+        if tail is not None:
+            params["tail"] = tail
+        if since is not None:
+            params["since"] = since
+        response = await self._stream(f"/containers/{quote(container_id)}/logs", params)
+        try:
+            if container.get("Config", {}).get("Tty"):
+                async for chunk in response.chunks():
+                    yield chunk
+                return
+            # Without a TTY stdout and stderr are multiplexed behind 8 byte frame headers
+            buffer = b""
+            async for chunk in response.chunks():
+                buffer += chunk
+                while len(buffer) >= 8:
+                    size = struct.unpack(">I", buffer[4:8])[0]
+                    if len(buffer) < 8 + size:
+                        break
+                    yield buffer[8:8 + size]
+                    buffer = buffer[8 + size:]
+        finally:
+            await response.connection.close()
+
+    # Readiness
+
+    async def wait_until_ready(self, container_id: str, port: int, timeout: float = 30,
+                               probe_host: str = None, banner: bytes = None, host_port: int = None):
+        """Same contract as DockerPlugin.wait_until_ready, without blocking the loop"""
+        deadline = time.time() + timeout
+        if host_port is not None:
+            ports = {f"{port}/tcp": [{"HostIp": "0.0.0.0", "HostPort": str(host_port)}]}
+        else:
+            ports = await self.get_container_ports(container_id)
+            if not ports:
+                try:
+                    ports = await asyncio.wait_for(
+                        self._wait_for_start(container_id, deadline), max(deadline - time.time(), 0)
+                    )
+                except asyncio.TimeoutError:
+                    ports = None
+        if not ports:
+            return None
+
+        if probe_host:
+            mapping = ports.get(f"{port}/tcp") or []
+            if not mapping:
+                return None
+            if not await self._probe(probe_host, int(mapping[0]["HostPort"]), deadline, banner):
+                return None
+        return ports
+
+    async def _wait_for_start(self, container_id: str, deadline: float):
+        # Events since a few seconds ago are replayed, as in DockerPlugin._wait_for_start
+        stream = self.events(
+            filters={"type": "container", "container": container_id},
+            since=int(time.time()) - 5,
+            until=int(deadline) + 1,
+        )
+        try:
+            async with aclosing(stream):
+                async for event in stream:
+                    action = event.get("Action") or event.get("status")
+                    if action == "start":
+                        ports = await self.get_container_ports(container_id)
+                        if ports:
+                            return ports
+                    elif action in ("die", "destroy", "oom"):
+                        return None
+        except (DockerAPIError, *CONNECTION_ERRORS) as error:
+            logging.error(error)
+        return None
+
+    async def _probe(self, host: str, port: int, deadline: float, banner: bytes = None):
+        delay = 0.05
+        while time.time() < deadline:
+            writer = None
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 0.5)
+                if banner is None:
+                    return True
+                if (await asyncio.wait_for(reader.read(len(banner)), 0.5)).startswith(banner):
+                    return True
+            except (OSError, asyncio.TimeoutError):
+                pass
+            finally:
+                if writer is not None:
+                    writer.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+        return False
+
+
+# One client per daemon per event loop: the connections and the semaphore
+# belong to the loop they were created on
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client(base_url: str, key_file: str = None, **kwargs):
+    """AsyncDockerPlugin for a host on the running event loop, created on first use"""
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get((base_url, key_file))
+    if client is None:
+        client = AsyncDockerPlugin(base_url, key_file, **kwargs)
+        clients[(base_url, key_file)] = client
+    return client
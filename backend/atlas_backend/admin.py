@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Team, Challenge, Container, Submission, HintPurchase
+from .models import User, Team, Challenge, Container, Submission, HintPurchase, ScoreboardEntry, WarmContainer, ImageUpload
 
 
 class CustomUserAdmin(UserAdmin):
@@ -22,3 +22,6 @@ admin.site.register(Challenge)
 admin.site.register(Container)
 admin.site.register(Submission)
 admin.site.register(HintPurchase)
+admin.site.register(ScoreboardEntry)
+admin.site.register(WarmContainer)
+admin.site.register(ImageUpload)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AtlasBackendConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'atlas_backend'
+
+    def ready(self):
+        from . import reaper, sampler, signals  # noqa: F401
+        reaper.connect_scheduler()
+        sampler.connect_scheduler()
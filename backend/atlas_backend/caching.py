@@ -0,0 +1,93 @@
+"""
+Namespaced caching with model-driven invalidation.
+
+Cached values live under keys that embed a per-namespace version token kept
+in the shared cache. Invalidating a namespace replaces the token, so every
+worker stops seeing the old entries at once and they simply expire.
+
+Models are linked to namespaces with register(); signals.py connects the
+post_save/post_delete receivers that call invalidate_instance(). Invalidation
+runs after the surrounding transaction commits so a concurrent reader cannot
+cache pre-commit data under the new token.
+"""
+import logging
+import uuid
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger('atlas_backend')
+
+DEFAULT_TIMEOUT = 60 * 60
+_MISSING = object()
+_resolvers = defaultdict(list)
+
+
+def register(model, resolver):
+    """resolver(instance) returns the namespaces affected by a change to instance"""
+    _resolvers[model].append(resolver)
+
+
+def registered_models():
+    return list(_resolvers)
+
+
+def _version_key(namespace):
+    return f'ns:{namespace}'
+
+
+def _version(namespace):
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def make_key(namespace, *parts):
+    return ':'.join([namespace, _version(namespace), *map(str, parts)])
+
+
+def get_or_build(namespace, builder, *parts, timeout=DEFAULT_TIMEOUT):
+    """Return the cached value for (namespace, parts), building it on a miss"""
+    try:
+        key = make_key(namespace, *parts)
+        value = cache.get(key, _MISSING)
+    except Exception as e:
+        # A cache outage degrades to uncached reads instead of failing requests
+        logger.error(f"Cache read failed for {namespace}: {str(e)}")
+        return builder()
+
+    if value is _MISSING:
+        value = builder()
+        try:
+            cache.set(key, value, timeout)
+        except Exception as e:
+            logger.error(f"Cache write failed for {namespace}: {str(e)}")
+    return value
+
+
+def invalidate(*namespaces):
+    def _swap():
+        for namespace in namespaces:
+            try:
+                cache.set(_version_key(namespace), uuid.uuid4().hex, None)
+            except Exception as e:
+                logger.error(f"Cache invalidation failed for {namespace}: {str(e)}")
+    transaction.on_commit(_swap)
+
+
+def namespaces_for(instance):
+    """Namespaces affected by a change to instance"""
+    namespaces = set()
+    for resolver in _resolvers.get(type(instance), []):
+        namespaces.update(resolver(instance))
+    return namespaces
+
+
+def invalidate_instance(instance):
+    namespaces = namespaces_for(instance)
+    if namespaces:
+        invalidate(*namespaces)
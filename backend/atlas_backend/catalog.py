@@ -0,0 +1,66 @@
+"""
+Public challenge catalog and per-team progress.
+
+The list of visible challenges is the same for every team, so it is built
+once and cached in the 'challenge_catalog' namespace. Team progress and hint
+purchases are cached per team. All of them are invalidated by model signals
+(see signals.py), so reads never need to aggregate raw rows on a warm cache.
+"""
+import json
+
+from django.db.models import Count, Q
+
+from . import caching
+from .models import Challenge, HintPurchase, Submission
+
+PUBLIC_FIELDS = (
+    'id',
+    'title',
+    'description',
+    'category',
+    'max_points',
+    'file_links',
+    'docker_image',
+    'max_attempts',
+    'hints',
+)
+
+
+def _build_catalog():
+    catalog = []
+    for chal in Challenge.objects.filter(is_hidden=False).order_by('id').values(*PUBLIC_FIELDS):
+        hints = chal.pop('hints')
+        if isinstance(hints, str):
+            hints = json.loads(hints)
+        chal['hint_count'] = len(hints)
+        catalog.append(chal)
+    return catalog
+
+
+def get_public_catalog():
+    """Visible challenges with hint counts but no hint content"""
+    return caching.get_or_build('challenge_catalog', _build_catalog)
+
+
+def get_team_progress(team):
+    """Map of challenge id -> (tries, solved) for a team, from one grouped query"""
+    def build():
+        rows = Submission.objects.filter(team=team).order_by().values('challenge_id').annotate(
+            tries=Count('id'),
+            solves=Count('id', filter=Q(is_correct=True)),
+        )
+        return {row['challenge_id']: (row['tries'], row['solves'] > 0) for row in rows}
+
+    return caching.get_or_build(f'team_progress:{team.id}', build)
+
+
+def get_hint_purchases(team, challenge):
+    """Map of hint index -> points deducted for the hints a team bought on a challenge"""
+    def build():
+        return dict(
+            HintPurchase.objects.filter(team=team, challenge=challenge).values_list(
+                'hint_index', 'points_deducted'
+            )
+        )
+
+    return caching.get_or_build(f'team_hints:{team.id}:{challenge.id}', build)
@@ -0,0 +1,235 @@
+"""
+Live event feed served as Server-Sent Events.
+
+Writers call publish(), which stores a LiveEvent row once the surrounding
+transaction commits. Every ASGI process runs a single poller task that reads
+new rows and fans them out to the process's subscribers through in-memory
+queues, so the database sees one small query per poll interval no matter how
+many browser tabs are connected.
+
+Ids are assigned when a row is inserted but become visible when it commits,
+so a lower id can show up after a higher one. The poller only moves past a
+missing id once it appears or has stayed missing for LIVE_EVENTS_GAP_TIMEOUT
+(its insert failed), so events go out in id order and none is skipped.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .auth import CustomJWTAuthentication
+from .models import LiveEvent
+
+logger = logging.getLogger('atlas_backend')
+
+FETCH_LIMIT = 500
+PRUNE_INTERVAL = 300  # seconds
+
+
+def publish(kind, payload, team=None):
+    """
+    Queue an event for delivery. Events with a team are only sent to that
+    team's members, events without one are broadcast.
+    """
+    team_id = getattr(team, 'id', team)
+
+    def store():
+        # Runs after the caller's data has committed, so a failure must not reach the caller
+        try:
+            LiveEvent.objects.create(kind=kind, team_id=team_id, payload=payload)
+        except Exception as e:
+            logger.error(f"Live event {kind} not published: {str(e)}")
+
+    transaction.on_commit(store)
+
+
+class Event:
+    __slots__ = ('id', 'team_id', 'frame')
+
+    def __init__(self, id, kind, team_id, payload):
+        self.id = id
+        self.team_id = team_id
+        # Serialized once here and shared by every subscriber
+        data = json.dumps(payload, cls=DjangoJSONEncoder)
+        self.frame = f"id: {id}\nevent: {kind}\ndata: {data}\n\n"
+
+    def visible_to(self, team_id):
+        return self.team_id is None or self.team_id == team_id
+
+
+class Subscription:
+    def __init__(self, team_id):
+        self.team_id = team_id
+        self.queue = asyncio.Queue(maxsize=settings.LIVE_EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+
+class EventBroker:
+    """Per-process fan-out of LiveEvent rows to connected streams"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.recent = deque(maxlen=settings.LIVE_EVENTS_BUFFER)
+        self.last_id = None
+        # (missing id, monotonic time it was first noticed) holding the cursor back
+        self._gap = None
+        self._task = None
+        self._last_prune = None
+
+    def subscribe(self, team_id):
+        subscription = Subscription(team_id)
+        self.subscribers.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    async def replay(self, last_event_id, team_id):
+        """Events after last_event_id, from memory when the buffer covers them"""
+        if self.recent and self.recent[0].id <= last_event_id + 1:
+            events = [event for event in self.recent if event.id > last_event_id]
+        else:
+            # Capped at the cursor so nothing past a gap still being waited on goes out early
+            events = await sync_to_async(_fetch_since)(last_event_id, self.last_id)
+        return [event for event in events if event.visible_to(team_id)]
+
+    def _deliver(self, event):
+        for subscription in list(self.subscribers):
+            if not event.visible_to(subscription.team_id):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # The client reconnects with Last-Event-ID and catches up from the buffer
+                subscription.overflowed = True
+                self.subscribers.discard(subscription)
+
+    async def _run(self):
+        self.last_id = await sync_to_async(_latest_id)()
+        while self.subscribers:
+            try:
+                events = await sync_to_async(_fetch_since)(self.last_id)
+                await self._maybe_prune()
+            except DatabaseError as e:
+                logger.error(f"Live event poll failed: {str(e)}")
+                await sync_to_async(connection.close)()
+                events = []
+
+            for event in self._in_order(events):
+                self.recent.append(event)
+                self.last_id = event.id
+                self._deliver(event)
+
+            await asyncio.sleep(settings.LIVE_EVENTS_POLL_INTERVAL)
+
+        # Idle: the next subscriber restarts the poller from the current head
+        self.recent.clear()
+        self._gap = None
+        self._task = None
+
+    def _in_order(self, events):
+        """The leading events the cursor can move over, stopping at an id that may still commit"""
+        ready = []
+        expected = self.last_id + 1
+        for event in events:
+            if event.id > expected:
+                now = time.monotonic()
+                if self._gap is None or self._gap[0] != expected:
+                    self._gap = (expected, now)
+                    break
+                if now - self._gap[1] < settings.LIVE_EVENTS_GAP_TIMEOUT:
+                    break
+            self._gap = None
+            ready.append(event)
+            expected = event.id + 1
+        return ready
+
+    async def _maybe_prune(self):
+        now = timezone.now()
+        if self._last_prune and (now - self._last_prune).total_seconds() < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        await sync_to_async(_prune)(now - settings.LIVE_EVENTS_RETENTION)
+
+
+def _latest_id():
+    return LiveEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def _fetch_since(last_id, until=None):
+    rows = LiveEvent.objects.filter(id__gt=last_id)
+    if until is not None:
+        rows = rows.filter(id__lte=until)
+    rows = rows.order_by('id').values(
+        'id', 'kind', 'team_id', 'payload'
+    )[:FETCH_LIMIT]
+    return [Event(row['id'], row['kind'], row['team_id'], row['payload']) for row in rows]
+
+
+def _prune(before):
+    LiveEvent.objects.filter(created_at__lt=before).delete()
+
+
+broker = EventBroker()
+
+
+def authenticate_stream(request):
+    """
+    Resolve the user for a stream request. EventSource cannot set headers, so
+    the access token may also be passed as ?token=.
+    """
+    auth = CustomJWTAuthentication()
+    try:
+        raw_token = request.GET.get('token')
+        if raw_token:
+            return auth.get_user(auth.get_validated_token(raw_token))
+        result = auth.authenticate(request)
+        return result[0] if result else None
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+def parse_last_event_id(request):
+    value = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+async def stream(team_id, last_event_id=None):
+    """Async iterator of SSE frames for one client"""
+    subscription = broker.subscribe(team_id)
+    try:
+        yield "retry: 3000\n\n"
+        sent_id = last_event_id or 0
+        if last_event_id is not None:
+            for event in await broker.replay(last_event_id, team_id):
+                sent_id = event.id
+                yield event.frame
+
+        while not subscription.overflowed:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.queue.get(), timeout=settings.LIVE_EVENTS_HEARTBEAT
+                )
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event.id <= sent_id:
+                continue
+            sent_id = event.id
+            yield event.frame
+    finally:
+        broker.unsubscribe(subscription)
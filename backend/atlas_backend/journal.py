@@ -0,0 +1,253 @@
+"""
+Write-behind journal for incorrect flag submissions.
+
+With settings.SUBMISSION_JOURNAL_DIR set, submissions.submit() still reserves
+every attempt synchronously on its SubmissionCounter (so attempt limits hold),
+but an incorrect attempt's Submission row is appended to a local journal
+instead of being inserted. A flusher thread bulk inserts the journal into
+the database every SUBMISSION_JOURNAL_FLUSH_INTERVAL seconds, or as soon as
+a batch fills up. Correct submissions are always written synchronously.
+
+Each process appends JSON lines to its own segment file and holds an
+exclusive flock on it, taken before the file gets its .jsonl name. A flush
+seals the current segment, starts a new one, inserts the sealed segment's
+rows and deletes the file. A segment left
+behind by a process that crashed is unlocked, and replay() inserts and
+deletes it: it runs when a process opens its journal and from the
+replay_submission_journal command. Inserts ignore conflicts on
+(team, challenge, attempt_number), so replaying a segment twice is harmless.
+"""
+import atexit
+import fcntl
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils.dateparse import parse_datetime
+
+from . import caching
+from .models import Challenge, Submission, Team, User
+
+logger = logging.getLogger('atlas_backend')
+
+_journal = None
+_journal_pid = None
+_journal_lock = threading.Lock()
+
+
+def enabled():
+    return bool(settings.SUBMISSION_JOURNAL_DIR)
+
+
+def _encode(submission):
+    return json.dumps({
+        'team': submission.team_id,
+        'challenge': submission.challenge_id,
+        'user': submission.user_id,
+        'flag': submission.flag_submitted,
+        'attempt': submission.attempt_number,
+        'at': submission.timestamp.isoformat(),
+    }) + '\n'
+
+
+def _decode(line):
+    entry = json.loads(line)
+    return Submission(
+        team_id=entry['team'],
+        challenge_id=entry['challenge'],
+        user_id=entry['user'],
+        flag_submitted=entry['flag'],
+        is_correct=False,
+        points_awarded=0,
+        attempt_number=entry['attempt'],
+        timestamp=parse_datetime(entry['at']),
+    )
+
+
+def _referenced(submissions):
+    """The submissions whose team, challenge and user have not been deleted since they were journaled"""
+    existing = {
+        field: set(model.objects.filter(id__in={getattr(s, f'{field}_id') for s in submissions})
+                   .values_list('id', flat=True))
+        for field, model in (('team', Team), ('challenge', Challenge), ('user', User))
+    }
+    kept = [
+        s for s in submissions
+        if s.team_id in existing['team'] and s.challenge_id in existing['challenge'] and s.user_id in existing['user']
+    ]
+    if len(kept) < len(submissions):
+        logger.error(f"Dropped {len(submissions) - len(kept)} journaled submissions of deleted teams, challenges or users")
+    return kept
+
+
+def insert(submissions):
+    """
+    Bulk insert journaled submissions, skipping ones already in the database
+    and ones whose team, challenge or user is gone.
+    """
+    submissions = _referenced(submissions)
+    try:
+        with transaction.atomic():
+            Submission.objects.bulk_create(
+                submissions, batch_size=settings.SUBMISSION_JOURNAL_BATCH_SIZE, ignore_conflicts=True
+            )
+    except IntegrityError:
+        # Something was deleted after _referenced() looked; insert row by row so only its rows are lost
+        for submission in submissions:
+            try:
+                with transaction.atomic():
+                    Submission.objects.bulk_create([submission], ignore_conflicts=True)
+            except IntegrityError as e:
+                logger.error(f"Dropped journaled submission of team {submission.team_id}: {str(e)}")
+    # bulk_create sends no post_save signals, so cached team progress is invalidated here
+    caching.invalidate(*{namespace for submission in submissions for namespace in caching.namespaces_for(submission)})
+
+
+class Segment:
+    """One journal file, exclusively locked by the process writing it"""
+
+    def __init__(self, path, file):
+        self.path = path
+        self.file = file
+        self.submissions = []
+
+    @classmethod
+    def create(cls, path):
+        # Locked under a name replay() does not look at, so it never sees the file unlocked
+        partial = path.with_suffix('.partial')
+        file = open(partial, 'a', encoding='utf-8')
+        fcntl.flock(file, fcntl.LOCK_EX)
+        os.rename(partial, path)
+        return cls(path, file)
+
+    def append(self, submission, fsync):
+        self.file.write(_encode(submission))
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+        self.submissions.append(submission)
+
+    def remove(self):
+        os.unlink(self.path)
+        self.file.close()
+
+
+class Journal:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._prefix = f"{os.getpid()}-{int(time.time() * 1000)}"
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._segment = self._new_segment()
+        self._sealed = []
+
+    def _new_segment(self):
+        return Segment.create(self.directory / f"{self._prefix}-{next(self._sequence)}.jsonl")
+
+    def append(self, submission):
+        with self._lock:
+            self._segment.append(submission, settings.SUBMISSION_JOURNAL_FSYNC)
+            if len(self._segment.submissions) >= settings.SUBMISSION_JOURNAL_BATCH_SIZE:
+                self._wake.set()
+
+    def flush(self):
+        """Insert everything appended so far. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                if self._segment.submissions:
+                    self._sealed.append(self._segment)
+                    self._segment = self._new_segment()
+            written = 0
+            while self._sealed:
+                segment = self._sealed[0]
+                try:
+                    insert(segment.submissions)
+                except Exception as e:
+                    # Kept, with its file, for the next flush
+                    logger.error(f"Submission journal flush failed: {str(e)}")
+                    break
+                segment.remove()
+                self._sealed.pop(0)
+                written += len(segment.submissions)
+            return written
+
+    def run(self):
+        while True:
+            self._wake.wait(settings.SUBMISSION_JOURNAL_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # The thread must outlive any one failure, or nothing is flushed again
+                logger.error(f"Submission journal flusher failed: {str(e)}")
+            finally:
+                connections.close_all()
+
+
+def get_journal():
+    """This process's journal, opened (and its flusher started) on first use"""
+    global _journal, _journal_pid
+    with _journal_lock:
+        if _journal is None or _journal_pid != os.getpid():
+            _journal = Journal(settings.SUBMISSION_JOURNAL_DIR)
+            _journal_pid = os.getpid()
+            threading.Thread(target=_journal.run, name='submission-journal', daemon=True).start()
+            threading.Thread(target=_recover, name='submission-journal-replay', daemon=True).start()
+            atexit.register(_journal.flush)
+        return _journal
+
+
+def append(submission):
+    get_journal().append(submission)
+
+
+def _recover():
+    try:
+        replay()
+    except Exception as e:
+        logger.error(f"Submission journal replay failed: {str(e)}")
+    finally:
+        connections.close_all()
+
+
+def replay(directory=None):
+    """
+    Insert and delete the segments no running process holds, left behind by
+    a crash. Returns (segments, rows) replayed.
+    """
+    directory = Path(directory or settings.SUBMISSION_JOURNAL_DIR)
+    segments = rows = 0
+    for path in sorted(directory.glob('*.jsonl')):
+        try:
+            file = open(path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            continue
+        with file:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            submissions = []
+            for line in file:
+                try:
+                    submissions.append(_decode(line))
+                except (ValueError, KeyError, TypeError):
+                    # The last line of a segment can be cut short by the crash
+                    logger.error(f"Skipped a damaged entry in submission journal {path.name}")
+            if submissions:
+                insert(submissions)
+            if not os.path.exists(path):
+                continue
+            os.unlink(path)
+        segments += 1
+        rows += len(submissions)
+    return segments, rows
@@ -0,0 +1,94 @@
+"""
+Host port leases for challenge containers.
+
+Rather than letting Docker pick an ephemeral port, each container is published
+on a port leased from its host's configured ranges (DOCKER_HOSTS "ports", or
+CONTAINER_PORT_RANGES). The PortLease row is unique per host and port, so two
+workers can never hand out the same port, and the port is known before the
+container starts, so nothing has to inspect it afterwards.
+
+A lease is taken before the container is run, bound to its id once it is
+running, and released when its Container or WarmContainer row is deleted (see
+signals.py). Leases that never got bound are dropped once they are as old as a
+stale provisioning job, and the reaper drops bound ones whose container is
+gone.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import PortLease
+
+logger = logging.getLogger('atlas_backend')
+
+
+def parse_port_ranges(ranges):
+    """[(low, high), ...] from "30000-39999,40100" """
+    parsed = []
+    for part in str(ranges).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        low, _, high = part.partition('-')
+        low, high = int(low), int(high or low)
+        if not 0 < low <= high <= 65535:
+            raise ValueError(f"Invalid port range {part}")
+        parsed.append((low, high))
+    return parsed
+
+
+def _candidates(port_ranges):
+    """Every port in the ranges, starting from a random one so workers spread out"""
+    size = sum(high - low + 1 for low, high in port_ranges)
+    if not size:
+        return
+    start = random.randrange(size)
+    for i in range(size):
+        index = (start + i) % size
+        for low, high in port_ranges:
+            if index <= high - low:
+                yield low + index
+                break
+            index -= high - low + 1
+
+
+def allocate(host):
+    """Lease a free port on host, or None when its ranges are used up"""
+    stale_before = timezone.now() - timedelta(seconds=settings.PROVISION_TIMEOUT * 4)
+    PortLease.objects.filter(
+        docker_host=host.name, container_id__isnull=True, created_at__lt=stale_before
+    ).delete()
+
+    leased = set(PortLease.objects.filter(docker_host=host.name).values_list('port', flat=True))
+    for port in _candidates(host.port_ranges):
+        if port in leased:
+            continue
+        try:
+            with transaction.atomic():
+                return PortLease.objects.create(docker_host=host.name, port=port)
+        except IntegrityError:
+            # Another worker leased it since the ports were read
+            continue
+    logger.error(f"No free ports left on Docker host {host.name}")
+    return None
+
+
+def bind(lease, container_id):
+    lease.container_id = container_id
+    lease.save(update_fields=['container_id'])
+
+
+def discard(lease):
+    """Give back a lease whose container never started or was stopped"""
+    PortLease.objects.filter(pk=lease.pk).delete()
+
+
+def release(container_ids):
+    """Give back the ports of containers that are gone"""
+    if container_ids:
+        PortLease.objects.filter(container_id__in=container_ids).delete()
+
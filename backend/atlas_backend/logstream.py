@@ -0,0 +1,125 @@
+"""
+Live container logs for the admin dashboard.
+
+stream() relays a container's output from the Docker host through
+async_docker, as Server-Sent Events or as plain chunked text. A reader task
+splits the output into lines and puts them on a bounded queue, waiting while
+it is full, so a slow viewer slows down the read from Docker instead of
+growing memory, and a viewer never holds a worker thread.
+"""
+import asyncio
+import json
+import logging
+from contextlib import aclosing
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from .models import Container, WarmContainer
+
+logger = logging.getLogger('atlas_backend')
+
+_END = object()
+
+
+def parse_options(params):
+    """logs() keyword arguments from the query string; ValueError on bad input"""
+    follow = params.get('follow', 'true').lower() not in ('0', 'false', 'no')
+    timestamps = params.get('timestamps', 'false').lower() in ('1', 'true', 'yes')
+
+    tail = params.get('tail', str(settings.LOG_STREAM_DEFAULT_TAIL))
+    if tail != 'all':
+        tail = int(tail)
+        if tail < 0:
+            raise ValueError('tail must be a number of lines or "all"')
+
+    since = params.get('since')
+    if since:
+        try:
+            since = int(float(since))
+        except ValueError:
+            parsed = parse_datetime(since)
+            if parsed is None:
+                raise ValueError('since must be a unix timestamp or an ISO 8601 datetime')
+            since = int(parsed.timestamp())
+    return {'follow': follow, 'tail': tail, 'since': since or None, 'timestamps': timestamps}
+
+
+def find_host(container_id):
+    """Name of the Docker host a tracked container runs on, None if it is not tracked"""
+    for model in (Container, WarmContainer):
+        row = model.objects.filter(container_id=container_id).values_list('docker_host', flat=True).first()
+        if row is not None:
+            return row
+    return None
+
+
+class LineSplitter:
+    """Splits chunks of output into lines, breaking up lines longer than max_length"""
+
+    def __init__(self, max_length):
+        self.max_length = max_length
+        self._partial = b''
+
+    def feed(self, chunk):
+        *complete, self._partial = (self._partial + chunk).split(b'\n')
+        lines = []
+        for line in complete:
+            lines.extend(line[i:i + self.max_length] for i in range(0, len(line), self.max_length))
+            if not line:
+                lines.append(line)
+        # An unterminated line is not buffered past max_length
+        while len(self._partial) > self.max_length:
+            lines.append(self._partial[:self.max_length])
+            self._partial = self._partial[self.max_length:]
+        return lines
+
+    def flush(self):
+        partial, self._partial = self._partial, b''
+        return [partial] if partial else []
+
+
+async def _read(client, container_id, options, queue):
+    splitter = LineSplitter(settings.LOG_STREAM_MAX_LINE)
+    try:
+        async with aclosing(client.logs(container_id, **options)) as chunks:
+            async for chunk in chunks:
+                for line in splitter.feed(chunk):
+                    await queue.put(line)
+        for line in splitter.flush():
+            await queue.put(line)
+    except Exception as e:
+        logger.error(f"Log stream of {container_id} failed: {str(e)}")
+    await queue.put(_END)
+
+
+def _frame(line, sse):
+    text = line.decode(errors='replace').rstrip('\r')
+    if not sse:
+        return text + '\n'
+    # SSE data lines cannot carry a bare carriage return
+    return f"event: log\ndata: {text.replace(chr(13), '')}\n\n"
+
+
+async def stream(client, container_id, options, sse=True):
+    """Async iterator of log frames, ending when the container's output does"""
+    queue = asyncio.Queue(maxsize=settings.LOG_STREAM_BUFFER)
+    reader = asyncio.get_running_loop().create_task(_read(client, container_id, options, queue))
+    try:
+        if sse:
+            yield "retry: 3000\n\n"
+        while True:
+            try:
+                line = await asyncio.wait_for(queue.get(), settings.LOG_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if sse:
+                    yield ": keep-alive\n\n"
+                continue
+            if line is _END:
+                if sse:
+                    yield f"event: end\ndata: {json.dumps({'container_id': container_id})}\n\n"
+                return
+            yield _frame(line, sse)
+    finally:
+        # Stops the read from Docker when the viewer disconnects
+        reader.cancel()
@@ -0,0 +1,24 @@
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+
+from atlas_backend import orchestrator
+from atlas_backend.models import Challenge
+
+
+class Command(BaseCommand):
+    help = "Start containers until every challenge's warm pool and shared instances are at their configured size"
+
+    def handle(self, *args, **options):
+        futures = []
+        for challenge_id in Challenge.objects.values_list('id', flat=True):
+            futures.extend(orchestrator.refill(challenge_id))
+            futures.extend(orchestrator.ensure_replicas(challenge_id))
+        wait(futures)
+
+        metrics = orchestrator.get_metrics(
+            list(Challenge.objects.filter(warm_pool_size__gt=0).values_list('id', flat=True))
+        )
+        for challenge_id, pool in metrics.items():
+            self.stdout.write(f"Challenge {challenge_id}: {pool['ready']} ready, {pool['starting']} starting")
+        self.stdout.write(self.style.SUCCESS(f"Started {len(futures)} warm and shared containers"))
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from atlas_backend import scheduler
+from atlas_backend.models import Challenge
+
+
+class Command(BaseCommand):
+    help = "Copy every published challenge image to every Docker host and report which hosts are ready"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--challenge', type=int, action='append', dest='challenges',
+                            help="Only prewarm this challenge (may be repeated)")
+        parser.add_argument('--concurrency', type=int, default=settings.IMAGE_PREWARM_CONCURRENCY,
+                            help="Image transfers running at the same time")
+
+    def handle(self, *args, **options):
+        challenges = Challenge.objects.filter(is_hidden=False).exclude(docker_image='')
+        if options['challenges']:
+            challenges = challenges.filter(id__in=options['challenges'])
+        titles = {}
+        for title, image in challenges.values_list('title', 'docker_image'):
+            titles.setdefault(image, []).append(title)
+        if not titles:
+            self.stdout.write("No published challenge images")
+            return
+
+        report = scheduler.prewarm(list(titles), concurrency=options['concurrency'])
+
+        failed = 0
+        for image, hosts in report.items():
+            self.stdout.write(f"{image} ({', '.join(titles[image])})")
+            for host_name, host_status in hosts.items():
+                style = self.style.ERROR if host_status == 'failed' else self.style.SUCCESS
+                self.stdout.write(f"  {host_name}: {style(host_status)}")
+                failed += host_status == 'failed'
+
+        if failed:
+            raise CommandError(f"{failed} image/host pairs are not ready")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(report)} images ready on {len(scheduler.get_hosts())} hosts"
+        ))
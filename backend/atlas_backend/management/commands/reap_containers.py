@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from atlas_backend import reaper
+
+
+class Command(BaseCommand):
+    help = "Stop expired and orphaned challenge containers and delete stale Container rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be done without doing it")
+        parser.add_argument('--batch-size', type=int, default=settings.REAPER_BATCH_SIZE,
+                            help="Containers stopped concurrently per batch")
+
+    def handle(self, *args, **options):
+        stats = reaper.reap(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        if stats is None:
+            raise CommandError("Could not list containers on any Docker host")
+
+        prefix = "Would reap" if options['dry_run'] else "Reaped"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}: {stats['expired']} expired, {stats['dead']} dead, {stats['orphans']} orphaned "
+            f"({stats['running']} running, {stats['stop_failures']} stop failures, "
+            f"{stats['skipped_hosts']} hosts skipped)"
+        ))
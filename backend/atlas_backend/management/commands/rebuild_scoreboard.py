@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from atlas_backend import scoreboard, submissions
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized scoreboard and solve aggregates from submissions and team data"
+
+    def handle(self, *args, **options):
+        count = scoreboard.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt scoreboard for {count} teams"))
+        count = submissions.rebuild_aggregates()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt solve counts and hint totals for {count} challenges"))
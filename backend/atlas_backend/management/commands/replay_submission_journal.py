@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from atlas_backend import journal
+
+
+class Command(BaseCommand):
+    help = "Insert submissions left in the write-behind journal by a crashed process"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.SUBMISSION_JOURNAL_DIR,
+                            help="Journal directory (SUBMISSION_JOURNAL_DIR by default)")
+
+    def handle(self, *args, **options):
+        if not options['dir']:
+            raise CommandError("No journal directory: set SUBMISSION_JOURNAL_DIR or pass --dir")
+
+        segments, rows = journal.replay(options['dir'])
+        self.stdout.write(self.style.SUCCESS(f"Replayed {rows} submissions from {segments} journal segments"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from atlas_backend import sampler
+
+
+class Command(BaseCommand):
+    help = "Sample CPU, memory, network and OOM kills of running challenge containers"
+
+    def handle(self, *args, **options):
+        stats = sampler.sample()
+        if stats is None:
+            raise CommandError("Could not list containers on any Docker host")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sampled {stats['sampled']} containers ({stats['oom_kills']} OOM kills since the last sample)"
+        ))
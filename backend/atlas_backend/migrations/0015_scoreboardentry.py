@@ -0,0 +1,56 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def populate_scoreboard(apps, schema_editor):
+    Team = apps.get_model('atlas_backend', 'Team')
+    ScoreboardEntry = apps.get_model('atlas_backend', 'ScoreboardEntry')
+    teams = Team.objects.annotate(
+        member_total=Count('members', distinct=True),
+        solve_total=Count('submissions', filter=Q(submissions__is_correct=True), distinct=True),
+        last_solve_at=Max('submissions__timestamp', filter=Q(submissions__is_correct=True)),
+    )
+    ScoreboardEntry.objects.bulk_create([
+        ScoreboardEntry(
+            team_id=team.id,
+            score=team.team_score,
+            solve_count=team.solve_total,
+            last_solve=team.last_solve_at,
+            member_count=team.member_total,
+        )
+        for team in teams
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0014_remove_team_description_alter_team_password'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$eaefdTa5oJEDfpnpm515kM$6UTeNZUUDkN8gzahDY6wLJXkXrjMCP2eRI2rzsJYqAM=', max_length=128),
+        ),
+        migrations.CreateModel(
+            name='ScoreboardEntry',
+            fields=[
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='scoreboard_entry', serialize=False, to='atlas_backend.team')),
+                ('score', models.IntegerField(default=0)),
+                ('solve_count', models.IntegerField(default=0)),
+                ('last_solve', models.DateTimeField(blank=True, null=True)),
+                ('member_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-score', 'last_solve'],
+                'indexes': [models.Index(fields=['-score', 'last_solve'], name='scoreboard_rank_idx')],
+            },
+        ),
+        migrations.RunPython(populate_scoreboard, migrations.RunPython.noop),
+    ]
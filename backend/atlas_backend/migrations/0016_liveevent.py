@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:35
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0015_scoreboardentry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$XJSlvq6vlGw9OHLuoDu0d5$rvncWHOslK+m78WkZmQ1AJ0S24bURWcVGtCW8rmX8ek=', max_length=128),
+        ),
+        migrations.CreateModel(
+            name='LiveEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50)),
+                ('payload', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('team', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='live_events', to='atlas_backend.team')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
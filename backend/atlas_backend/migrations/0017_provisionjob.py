@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:38
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0016_liveevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$perVT3FKd0ySI8c9rZYG2t$3uEsWH1yS23O7HbTSfYirPeHAcH1bYqwIEEQMYd4Qt4=', max_length=128),
+        ),
+        migrations.CreateModel(
+            name='ProvisionJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('challenge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='provision_jobs', to='atlas_backend.challenge')),
+                ('container', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='provision_jobs', to='atlas_backend.container')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='provision_jobs', to='atlas_backend.team')),
+            ],
+        ),
+    ]
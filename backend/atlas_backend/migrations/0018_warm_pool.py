@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:40
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0017_provisionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='warm_pool_size',
+            field=models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$wzz6cZK1Tfm1EqXyl1AEol$zWvjLpVOnMK0sL2Enm/nAgosGTKyzK6nHH4E0tgBgmg=', max_length=128),
+        ),
+        migrations.CreateModel(
+            name='WarmContainer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('starting', 'Starting'), ('ready', 'Ready')], default='starting', max_length=20)),
+                ('container_id', models.CharField(blank=True, max_length=100, null=True, unique=True)),
+                ('ssh_host', models.CharField(blank=True, default='', max_length=200)),
+                ('ssh_port', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('challenge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='warm_containers', to='atlas_backend.challenge')),
+            ],
+        ),
+    ]
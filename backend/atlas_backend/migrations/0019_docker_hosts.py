@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0018_warm_pool'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='container',
+            name='docker_host',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='provisionjob',
+            name='docker_host',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='warmcontainer',
+            name='docker_host',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$c04cnG0o87JmIQj4jNAPsj$WqoQH7OXXrwrqnj7HN/jartROUc9MPxTUzcAoMyYoe4=', max_length=128),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:49
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0019_docker_hosts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$7LVXdzXmiVZF62CxeEGgVk$ptB5xNmZVmO5i3VD9Ouis34W/1xDi61O7E2WG83TjeU=', max_length=128),
+        ),
+        migrations.CreateModel(
+            name='ImageUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(default=0)),
+                ('expected_sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('sha256', models.CharField(blank=True, db_index=True, default='', max_length=64)),
+                ('image_id', models.CharField(blank=True, default='', max_length=200)),
+                ('status', models.CharField(choices=[('uploading', 'Uploading'), ('loading', 'Loading'), ('committed', 'Committed'), ('failed', 'Failed')], default='uploading', max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('challenge', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='image_uploads', to='atlas_backend.challenge')),
+            ],
+        ),
+    ]
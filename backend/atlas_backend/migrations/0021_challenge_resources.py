@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:52
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0020_imageupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='cpu_quota',
+            field=models.IntegerField(default=50000, help_text='CPU time in microseconds per 100ms period (100000 = one core)', validators=[django.core.validators.MinValueValidator(1000)]),
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='cpuset_cpus',
+            field=models.CharField(blank=True, default='', help_text='CPUs to pin containers to, e.g. "0-1" or "2,3"', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='memory_limit',
+            field=models.IntegerField(default=128, help_text='MiB', validators=[django.core.validators.MinValueValidator(6)]),
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='pids_limit',
+            field=models.IntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='tmpfs',
+            field=models.JSONField(blank=True, default=dict, help_text='tmpfs mounts, e.g. {"/tmp": "size=64m,noexec"}'),
+        ),
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$LcQom4uY7cv6q9XPXO6z5b$oamTP0LGPoAnUggmL1sxkmFN1jI/9qdwcaj1gwu67f8=', max_length=128),
+        ),
+    ]
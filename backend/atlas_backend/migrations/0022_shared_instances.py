@@ -0,0 +1,50 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:54
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0021_challenge_resources'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='instance_mode',
+            field=models.CharField(choices=[('per_team', 'One container per team'), ('shared', 'One container shared by all teams'), ('pool', 'Pool of shared containers')], default='per_team', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='replica_count',
+            field=models.IntegerField(default=1, help_text='Shared containers in pool mode', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='container',
+            name='shared',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='container',
+            name='teams',
+            field=models.ManyToManyField(blank=True, related_name='shared_containers', to='atlas_backend.team'),
+        ),
+        migrations.AlterField(
+            model_name='container',
+            name='team',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='containers', to='atlas_backend.team'),
+        ),
+        migrations.AlterField(
+            model_name='provisionjob',
+            name='team',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='provision_jobs', to='atlas_backend.team'),
+        ),
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$KFesZrVuWrOOpGq9Eo36Jt$jut1zp/Mem/ezX6UNhwwepx7w34uMK1vQ9btlG5scDA=', max_length=128),
+        ),
+    ]
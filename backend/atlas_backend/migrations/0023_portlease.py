@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0022_shared_instances'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$k2e284CTMhzCBXSWXBK8eY$7xHUJSUQ407qz5RaPSgatRqhEk9Yp4lbo9gKEAp/9MQ=', max_length=128),
+        ),
+        migrations.CreateModel(
+            name='PortLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('docker_host', models.CharField(max_length=100)),
+                ('port', models.IntegerField()),
+                ('container_id', models.CharField(blank=True, db_index=True, max_length=100, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('docker_host', 'port'), name='unique_port_per_host')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0023_portlease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContainerStats',
+            fields=[
+                ('container', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='atlas_backend.container')),
+                ('samples', models.IntegerField(default=0)),
+                ('cpu_percent', models.FloatField(blank=True, null=True)),
+                ('cpu_percent_avg', models.FloatField(blank=True, null=True)),
+                ('cpu_percent_max', models.FloatField(blank=True, null=True)),
+                ('memory_usage', models.BigIntegerField(default=0)),
+                ('memory_avg', models.BigIntegerField(default=0)),
+                ('memory_max', models.BigIntegerField(default=0)),
+                ('memory_limit', models.BigIntegerField(default=0)),
+                ('network_rx', models.BigIntegerField(default=0)),
+                ('network_tx', models.BigIntegerField(default=0)),
+                ('network_rx_rate', models.FloatField(blank=True, null=True)),
+                ('network_tx_rate', models.FloatField(blank=True, null=True)),
+                ('oom_kills', models.IntegerField(default=0)),
+                ('cpu_total', models.BigIntegerField(default=0)),
+                ('system_total', models.BigIntegerField(default=0)),
+                ('sampled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$QQY6uHUC4s1hi1dWdNByHG$PGPhsyVvDvaTcoy/Hla3FpHAbPZF0xSUapY1aQFK1Pw=', max_length=128),
+        ),
+    ]
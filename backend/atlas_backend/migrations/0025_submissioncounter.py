@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def populate_counters(apps, schema_editor):
+    Submission = apps.get_model('atlas_backend', 'Submission')
+    SubmissionCounter = apps.get_model('atlas_backend', 'SubmissionCounter')
+    rows = Submission.objects.order_by().values('team_id', 'challenge_id').annotate(
+        last_attempt=Max('attempt_number'),
+        solves=Count('id', filter=Q(is_correct=True)),
+    )
+    SubmissionCounter.objects.bulk_create([
+        SubmissionCounter(
+            team_id=row['team_id'],
+            challenge_id=row['challenge_id'],
+            attempts=row['last_attempt'],
+            solved=row['solves'] > 0,
+        )
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0024_containerstats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$X8eEteS2vnwHzrZuxbRA0G$ILJ/TAp4Ie4tUUszQCHa05AoRD+RnL09NjplilN1U+A=', max_length=128),
+        ),
+        migrations.CreateModel(
+            name='SubmissionCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.IntegerField(default=0)),
+                ('solved', models.BooleanField(default=False)),
+                ('challenge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submission_counters', to='atlas_backend.challenge')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submission_counters', to='atlas_backend.team')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('team', 'challenge'), name='unique_submission_counter')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
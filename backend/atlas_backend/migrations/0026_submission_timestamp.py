@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:17
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0025_submissioncounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='submission',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$onxS1JccM1qkveJMcZCrRS$y81cST2gsLLNVstGBfOv4JcaPXvMv/7BIE/8e2Tda7E=', max_length=128),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0026_submission_timestamp'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$D7IwriKdXjznhng3DJCbyU$AgUOQiSC5IqrmQ1yMNakC+6uzdSnCzLGDUn1rexO3E4=', max_length=128),
+        ),
+        migrations.AddIndex(
+            model_name='container',
+            index=models.Index(fields=['team', 'challenge', '-created_at'], name='container_team_chal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='container',
+            index=models.Index(fields=['-created_at'], name='container_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['challenge', '-timestamp'], name='submission_challenge_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['-timestamp'], name='submission_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(condition=models.Q(('is_correct', True)), fields=['team', '-timestamp'], name='submission_team_solves_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(condition=models.Q(('is_correct', True)), fields=['challenge', 'timestamp'], name='submission_chal_solves_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['-team_score', 'created_at'], name='team_rank_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_aggregates(apps, schema_editor):
+    Challenge = apps.get_model('atlas_backend', 'Challenge')
+    HintPurchase = apps.get_model('atlas_backend', 'HintPurchase')
+    Submission = apps.get_model('atlas_backend', 'Submission')
+    SubmissionCounter = apps.get_model('atlas_backend', 'SubmissionCounter')
+
+    hint_totals = HintPurchase.objects.order_by().values('team_id', 'challenge_id').annotate(total=Sum('points_deducted'))
+    for row in hint_totals:
+        SubmissionCounter.objects.update_or_create(
+            team_id=row['team_id'], challenge_id=row['challenge_id'], defaults={'hints_deducted': row['total']}
+        )
+
+    challenges = Challenge.objects.in_bulk()
+    solves = Submission.objects.filter(is_correct=True).order_by('challenge_id', 'timestamp', 'id')
+    for challenge_id, team_id, timestamp in solves.values_list('challenge_id', 'team_id', 'timestamp'):
+        challenge = challenges[challenge_id]
+        if not challenge.solve_count:
+            challenge.first_blood_id = team_id
+            challenge.first_blood_at = timestamp
+        challenge.solve_count += 1
+    Challenge.objects.bulk_update(challenges.values(), ['solve_count', 'first_blood', 'first_blood_at'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0027_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='first_blood',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='first_bloods', to='atlas_backend.team'),
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='first_blood_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='solve_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='submissioncounter',
+            name='hints_deducted',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$ntoyOxwRp1m3yvCCgwbHZy$p/YlNkyfQnYskZSV6VTGcNno7BQ7LjkIsqoI8AuPJTI=', max_length=128),
+        ),
+        migrations.RunPython(populate_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0028_solve_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$X9e6zdetrIYYc4Ag4ykKYg$/bnyuEqRgP04rs6D1pXevmbJM99Vjo4h01CY2n8LynA=', max_length=128),
+        ),
+        migrations.AlterField(
+            model_name='warmcontainer',
+            name='status',
+            field=models.CharField(choices=[('starting', 'Starting'), ('ready', 'Ready'), ('claimed', 'Claimed')], default='starting', max_length=20),
+        ),
+    ]
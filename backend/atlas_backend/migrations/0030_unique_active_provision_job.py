@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:32
+
+from django.db import migrations, models
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    ProvisionJob = apps.get_model('atlas_backend', 'ProvisionJob')
+    seen = set()
+    active = ProvisionJob.objects.filter(status__in=['pending', 'running'], team__isnull=False)
+    for job in active.order_by('-created_at'):
+        if (job.team_id, job.challenge_id) in seen:
+            job.status = 'failed'
+            job.error = 'Provisioning was interrupted'
+            job.save(update_fields=['status', 'error'])
+        seen.add((job.team_id, job.challenge_id))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atlas_backend', '0029_warm_container_claimed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='team',
+            name='password',
+            field=models.CharField(default='pbkdf2_sha256$870000$Ao1RBCNh9Fim00d2pKcKpu$7kYxIXb32adfguOTVhw2Zo5e18tggf5jQpg7lZX75RY=', max_length=128),
+        ),
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='provisionjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('team', 'challenge'), name='unique_active_provision_job'),
+        ),
+    ]
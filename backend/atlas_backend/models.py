@@ -4,6 +4,8 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.hashers import make_password, check_password
 from django.db.models import CharField, TextField, IntegerField, BooleanField, DateTimeField
 from django.core.validators import RegexValidator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 import re
 import uuid
 
@@ -32,6 +34,12 @@ class Team(models.Model):
     is_banned = models.BooleanField(default=False)
     is_hidden = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Team ranking (team listing order and rank lookups on team_score)
+            models.Index(fields=['-team_score', 'created_at'], name='team_rank_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -59,7 +67,10 @@ class Team(models.Model):
         self.name = self.name.lower()
         if not self.access_code:
             self.access_code = self.generate_access_code()
+        created = self._state.adding
         super().save(*args, **kwargs)
+        if created:
+            ScoreboardEntry.objects.get_or_create(team=self)
 
 class User(AbstractUser):
     username = models.CharField(max_length=100, unique=True)
@@ -151,17 +162,48 @@ class Challenge(models.Model):
     file_links = models.JSONField(default=list, blank=True)
     port = models.IntegerField(blank=True, null=True)
     ssh_user = models.CharField(max_length=100, blank=True, null=True)
+    INSTANCE_MODE_CHOICES = [
+        ('per_team', 'One container per team'),
+        ('shared', 'One container shared by all teams'),
+        ('pool', 'Pool of shared containers'),
+    ]
+    # Stateless challenges can be served by shared containers instead of one per team
+    instance_mode = models.CharField(max_length=20, choices=INSTANCE_MODE_CHOICES, default='per_team')
+    replica_count = models.IntegerField(
+        default=1, validators=[MinValueValidator(1)], help_text="Shared containers in pool mode")
+    # Idle containers kept running so start_challenge can hand one out instantly
+    warm_pool_size = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    # Resource profile applied to the challenge's containers and reserved on their host
+    cpu_quota = models.IntegerField(
+        default=50000, validators=[MinValueValidator(1000)],
+        help_text="CPU time in microseconds per 100ms period (100000 = one core)")
+    memory_limit = models.IntegerField(default=128, validators=[MinValueValidator(6)], help_text="MiB")
+    pids_limit = models.IntegerField(blank=True, null=True, validators=[MinValueValidator(1)])
+    cpuset_cpus = models.CharField(
+        max_length=100, blank=True, default="", help_text='CPUs to pin containers to, e.g. "0-1" or "2,3"')
+    tmpfs = models.JSONField(
+        default=dict, blank=True, help_text='tmpfs mounts, e.g. {"/tmp": "size=64m,noexec"}')
+    # Kept up to date by correct submissions (see submissions.py)
+    solve_count = models.IntegerField(default=0)
+    first_blood = models.ForeignKey(
+        Team, on_delete=models.SET_NULL, null=True, blank=True, related_name="first_bloods")
+    first_blood_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return self.title
 
 
 class Container(models.Model):
+    # Per-team containers have a team; shared ones have none and list their teams instead
     team = models.ForeignKey(
-        Team, on_delete=models.CASCADE, related_name="containers")
+        Team, on_delete=models.CASCADE, null=True, blank=True, related_name="containers")
+    shared = models.BooleanField(default=False)
+    teams = models.ManyToManyField(Team, blank=True, related_name="shared_containers")
     challenge = models.ForeignKey(
         Challenge, on_delete=models.CASCADE, related_name="containers")
     container_id = models.CharField(max_length=100, primary_key=True)
+    # Name of the Docker host it runs on (blank for the first configured host)
+    docker_host = models.CharField(max_length=100, blank=True, default="")
     ssh_host = models.CharField(max_length=200)
     ssh_port = models.IntegerField()
     ssh_user = models.CharField(max_length=100)
@@ -169,8 +211,150 @@ class Container(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # A team's live container for a challenge (start/stop)
+            models.Index(fields=['team', 'challenge', '-created_at'], name='container_team_chal_idx'),
+            # Admin listing order and live container counts
+            models.Index(fields=['-created_at'], name='container_recent_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.team.name} - {self.challenge.title}"
+        owner = self.team.name if self.team_id else "shared"
+        return f"{owner} - {self.challenge.title}"
+
+class WarmContainer(models.Model):
+    """Pre-started container waiting to be assigned to a team (see orchestrator.py)"""
+    STATUS_CHOICES = [
+        ('starting', 'Starting'),
+        ('ready', 'Ready'),
+        # Taken by a team, kept until its Container row exists so the reaper never sees it unowned
+        ('claimed', 'Claimed'),
+    ]
+
+    challenge = models.ForeignKey(
+        Challenge, on_delete=models.CASCADE, related_name="warm_containers")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='starting')
+    container_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    docker_host = models.CharField(max_length=100, blank=True, default="")
+    ssh_host = models.CharField(max_length=200, blank=True, default="")
+    ssh_port = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.challenge.title} - {self.container_id or 'starting'}"
+
+class PortLease(models.Model):
+    """
+    Host port handed out to a challenge container (see leases.py). Bound to the
+    container's id once it runs and released when its row goes away.
+    """
+    docker_host = models.CharField(max_length=100)
+    port = models.IntegerField()
+    container_id = models.CharField(max_length=100, null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['docker_host', 'port'], name='unique_port_per_host'),
+        ]
+
+    def __str__(self):
+        return f"{self.docker_host}:{self.port} - {self.container_id or 'starting'}"
+
+class ContainerStats(models.Model):
+    """
+    Rolling resource usage of a running Container, updated by sampler.py.
+    Averages are exponentially weighted, peaks are since the container started.
+    """
+    container = models.OneToOneField(
+        Container, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    samples = models.IntegerField(default=0)
+    cpu_percent = models.FloatField(null=True, blank=True)
+    cpu_percent_avg = models.FloatField(null=True, blank=True)
+    cpu_percent_max = models.FloatField(null=True, blank=True)
+    memory_usage = models.BigIntegerField(default=0)  # bytes
+    memory_avg = models.BigIntegerField(default=0)
+    memory_max = models.BigIntegerField(default=0)
+    memory_limit = models.BigIntegerField(default=0)
+    network_rx = models.BigIntegerField(default=0)  # bytes since the container started
+    network_tx = models.BigIntegerField(default=0)
+    network_rx_rate = models.FloatField(null=True, blank=True)  # bytes per second
+    network_tx_rate = models.FloatField(null=True, blank=True)
+    oom_kills = models.IntegerField(default=0)
+    # Raw counters of the last sample, for the next sample's deltas
+    cpu_total = models.BigIntegerField(default=0)
+    system_total = models.BigIntegerField(default=0)
+    sampled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.container_id}: {self.cpu_percent}% CPU, {self.memory_usage} bytes"
+
+class ProvisionJob(models.Model):
+    """Background container launch requested through start_challenge"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    ACTIVE_STATUSES = ('pending', 'running')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # No team for launches of a challenge's shared containers
+    team = models.ForeignKey(
+        Team, on_delete=models.CASCADE, null=True, blank=True, related_name="provision_jobs")
+    challenge = models.ForeignKey(
+        Challenge, on_delete=models.CASCADE, related_name="provision_jobs")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    container = models.ForeignKey(
+        Container, on_delete=models.SET_NULL, null=True, blank=True, related_name="provision_jobs")
+    # Host chosen for the launch, counted against its capacity until the container exists
+    docker_host = models.CharField(max_length=100, blank=True, default="")
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # One launch in flight per team and challenge; shared launches have no team and are not limited
+            models.UniqueConstraint(
+                fields=['team', 'challenge'], condition=models.Q(status__in=['pending', 'running']),
+                name='unique_active_provision_job',
+            ),
+        ]
+
+    def __str__(self):
+        owner = self.team.name if self.team_id else "shared"
+        return f"{owner} - {self.challenge.title} ({self.status})"
+
+class ImageUpload(models.Model):
+    """Resumable challenge image upload, appended to in chunks (see uploads.py)"""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('loading', 'Loading'),
+        ('committed', 'Committed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    challenge = models.ForeignKey(
+        Challenge, on_delete=models.SET_NULL, null=True, blank=True, related_name="image_uploads")
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    # Digest the client expects, checked on commit when given
+    expected_sha256 = models.CharField(max_length=64, blank=True, default="")
+    sha256 = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    image_id = models.CharField(max_length=200, blank=True, default="")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
 
 class Submission(models.Model):
     team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name="submissions")
@@ -180,15 +364,46 @@ class Submission(models.Model):
     is_correct = models.BooleanField(default=False)
     points_awarded = models.IntegerField(validators=[MinValueValidator(0)])
     attempt_number = models.IntegerField(default=1)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: journaled submissions keep the time they were made (see journal.py)
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ["-timestamp"]
+        # Also serves (team) and (team, challenge) lookups
         unique_together = [['team', 'challenge', 'attempt_number']]
+        indexes = [
+            models.Index(fields=['challenge', '-timestamp'], name='submission_challenge_idx'),
+            models.Index(fields=['-timestamp'], name='submission_recent_idx'),
+            # Correct submissions only, a small fraction of all attempts
+            models.Index(fields=['team', '-timestamp'], condition=models.Q(is_correct=True),
+                         name='submission_team_solves_idx'),
+            models.Index(fields=['challenge', 'timestamp'], condition=models.Q(is_correct=True),
+                         name='submission_chal_solves_idx'),
+        ]
 
     def __str__(self):
         return f"{self.team.name} - {self.challenge.title}"
 
+class SubmissionCounter(models.Model):
+    """
+    Attempts a team has made on a challenge, whether it has solved it and the
+    points its hints cost. Flag submissions reserve their attempt number here
+    (see submissions.py).
+    """
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name="submission_counters")
+    challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, related_name="submission_counters")
+    attempts = models.IntegerField(default=0)
+    solved = models.BooleanField(default=False)
+    hints_deducted = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['team', 'challenge'], name='unique_submission_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.team.name} - {self.challenge.title}: {self.attempts}"
+
 class HintPurchase(models.Model):
     team = models.ForeignKey(Team, on_delete=models.CASCADE)
     challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE)
@@ -199,3 +414,39 @@ class HintPurchase(models.Model):
 
     class Meta:
         unique_together = ('team', 'challenge', 'hint_index')
+
+
+class ScoreboardEntry(models.Model):
+    """Precomputed scoreboard row for a team, kept in sync at write time"""
+    team = models.OneToOneField(
+        Team, on_delete=models.CASCADE, primary_key=True, related_name="scoreboard_entry")
+    score = models.IntegerField(default=0)
+    solve_count = models.IntegerField(default=0)
+    last_solve = models.DateTimeField(null=True, blank=True)
+    member_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-score", "last_solve"]
+        indexes = [
+            models.Index(fields=["-score", "last_solve"], name="scoreboard_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.team.name} - {self.score}"
+
+
+class LiveEvent(models.Model):
+    """Event pushed to connected clients over the live stream (see events.py)"""
+    kind = models.CharField(max_length=50)
+    # Events without a team are broadcast to every subscriber
+    team = models.ForeignKey(
+        Team, on_delete=models.CASCADE, null=True, blank=True, related_name="live_events")
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.id} - {self.kind}"
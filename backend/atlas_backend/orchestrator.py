@@ -0,0 +1,339 @@
+"""
+Warm pools of pre-started challenge containers, and shared instances.
+
+A challenge with warm_pool_size > 0 keeps that many idle containers running
+with their ports already mapped. start_challenge claims one (rotating the SSH
+password so the team gets a fresh credential) and a background refill starts
+a replacement. Pool membership lives in WarmContainer rows, so every worker
+shares the same pools, and hit/miss/refill metrics live in the shared cache.
+
+Challenges in the shared or pool instance mode are instead served by one or
+replica_count long-lived shared Containers, and teams are assigned to them
+round-robin.
+"""
+import logging
+import random
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from docker_plugin import generate_password
+
+from . import leases, provisioning, scheduler
+from .models import Challenge, Container, ProvisionJob, WarmContainer
+from .provisioning import docker_connection, run_in_background
+
+logger = logging.getLogger('atlas_backend')
+
+METRIC_NAMES = ('hits', 'misses', 'refills', 'refill_failures', 'refill_ms_total', 'last_refill_ms')
+
+
+def _metric_key(challenge_id, name):
+    return f'warm_pool:{challenge_id}:{name}'
+
+
+def _incr(challenge_id, name, delta=1):
+    key = _metric_key(challenge_id, name)
+    try:
+        cache.add(key, 0, None)
+        cache.incr(key, delta)
+    except Exception as e:
+        logger.error(f"Warm pool metric {name} not recorded: {str(e)}")
+
+
+def get_metrics(challenge_ids):
+    """Per-challenge pool sizes and counters for the admin dashboard"""
+    counts = {
+        row['challenge_id']: row
+        for row in WarmContainer.objects.filter(challenge_id__in=challenge_ids).order_by()
+        .values('challenge_id').annotate(
+            ready=Count('id', filter=Q(status='ready')),
+            starting=Count('id', filter=Q(status='starting')),
+        )
+    }
+    keys = [_metric_key(cid, name) for cid in challenge_ids for name in METRIC_NAMES]
+    try:
+        values = cache.get_many(keys)
+    except Exception as e:
+        logger.error(f"Warm pool metrics unavailable: {str(e)}")
+        values = {}
+
+    metrics = {}
+    for cid in challenge_ids:
+        counters = {name: values.get(_metric_key(cid, name), 0) for name in METRIC_NAMES}
+        refills = counters.pop('refills')
+        refill_ms_total = counters.pop('refill_ms_total')
+        metrics[cid] = {
+            'ready': counts.get(cid, {}).get('ready', 0),
+            'starting': counts.get(cid, {}).get('starting', 0),
+            'refills': refills,
+            'avg_refill_ms': round(refill_ms_total / refills) if refills else None,
+            **counters,
+        }
+    return metrics
+
+
+def claim(team, challenge):
+    """
+    Hand a ready warm container to team. Returns the new Container, or None on
+    a miss, in which case the caller falls back to a cold start.
+    """
+    warm = _take(challenge)
+    if warm is None:
+        return None
+
+    password = generate_password()
+    if challenge.ssh_user:
+        with docker_connection(warm.docker_host) as client:
+            if not client.set_password(warm.container_id, challenge.ssh_user, password):
+                client.stop_container(warm.container_id)
+                _discard_claimed(challenge, warm)
+                return None
+    return _hand_over(team, challenge, warm, password)
+
+
+async def claim_async(team, challenge):
+    """claim() for the async views, rotating the password through async_docker"""
+    warm = await sync_to_async(_take)(challenge)
+    if warm is None:
+        return None
+
+    password = generate_password()
+    if challenge.ssh_user:
+        client = scheduler.get_host(warm.docker_host).async_client()
+        if not await client.set_password(warm.container_id, challenge.ssh_user, password):
+            await client.stop_container(warm.container_id)
+            await sync_to_async(_discard_claimed)(challenge, warm)
+            return None
+    return await sync_to_async(_hand_over)(team, challenge, warm, password)
+
+
+def _take(challenge):
+    """Claim the oldest ready container from the challenge's pool, None on a miss"""
+    if challenge.warm_pool_size <= 0:
+        return None
+
+    with transaction.atomic():
+        warm = WarmContainer.objects.select_for_update(skip_locked=True).filter(
+            challenge=challenge, status='ready'
+        ).order_by('created_at').first()
+        if warm is not None:
+            # Its row stays until _hand_over() creates the team's, so the container always has an owner
+            warm.status = 'claimed'
+            warm.save(update_fields=['status', 'updated_at'])
+
+    schedule_refill(challenge.id)
+    if warm is None:
+        _incr(challenge.id, 'misses')
+    return warm
+
+
+def _discard_claimed(challenge, warm):
+    # Its password could not be rotated, so the container was stopped instead; the delete releases its port
+    warm.delete()
+    _incr(challenge.id, 'misses')
+
+
+def _hand_over(team, challenge, warm, password):
+    _incr(challenge.id, 'hits')
+    with transaction.atomic():
+        # The container, and with it its port lease, moves to the team's Container row
+        warm._keep_port = True
+        warm.delete()
+        return Container.objects.create(
+            team=team,
+            challenge=challenge,
+            container_id=warm.container_id,
+            docker_host=warm.docker_host,
+            ssh_host=warm.ssh_host,
+            ssh_port=warm.ssh_port,
+            ssh_user=challenge.ssh_user or '',
+            ssh_password=password,
+        )
+
+
+def schedule_refill(challenge_id):
+    transaction.on_commit(lambda: run_in_background(refill, challenge_id))
+    transaction.on_commit(lambda: run_in_background(ensure_replicas, challenge_id))
+
+
+def refill(challenge_id):
+    """
+    Bring a challenge's pool back to its target size. Placeholder rows are
+    inserted under a lock on the challenge so concurrent refills from other
+    workers do not overshoot. Returns the futures of the launches started.
+    """
+    surplus = []
+    with transaction.atomic():
+        challenge = Challenge.objects.select_for_update().filter(id=challenge_id).first()
+        if challenge is None:
+            return []
+
+        # Placeholders left behind by a worker that died mid-launch or mid-claim; the reaper stops their containers
+        stuck_before = timezone.now() - timedelta(seconds=settings.PROVISION_TIMEOUT * 4)
+        challenge.warm_containers.filter(status__in=['starting', 'claimed'], updated_at__lt=stuck_before).delete()
+
+        target = challenge.warm_pool_size
+        if challenge.is_hidden or not challenge.docker_image or challenge.instance_mode != 'per_team':
+            target = 0
+        deficit = target - challenge.warm_containers.exclude(status='claimed').count()
+        placeholders = []
+        for _ in range(max(deficit, 0)):
+            host = scheduler.place(challenge)
+            if host is None:
+                logger.error(f"No Docker host has capacity to refill the pool of challenge {challenge.id}")
+                break
+            placeholders.append(WarmContainer.objects.create(challenge=challenge, docker_host=host.name))
+        if deficit < 0:
+            surplus = list(challenge.warm_containers.filter(status='ready').order_by('created_at')[:-deficit])
+            WarmContainer.objects.filter(id__in=[warm.id for warm in surplus]).delete()
+
+    for warm in surplus:
+        with docker_connection(warm.docker_host) as client:
+            client.stop_container(warm.container_id)
+
+    return [run_in_background(_start_warm_container, warm.id) for warm in placeholders]
+
+
+def _start_warm_container(warm_id):
+    started = time.monotonic()
+    warm = WarmContainer.objects.select_related('challenge').filter(id=warm_id).first()
+    if warm is None:
+        return
+    challenge = warm.challenge
+    host = scheduler.get_host(warm.docker_host)
+    lease = leases.allocate(host)
+    if lease is None:
+        warm.delete()
+        _incr(challenge.id, 'refill_failures')
+        return
+
+    try:
+        with host.connection() as client:
+            result = client.run_container(
+                challenge.docker_image,
+                port=challenge.port,
+                container_name=f"warm-{challenge.id}-{warm.id}",
+                labels={'atlas.challenge': str(challenge.id), 'atlas.warm': 'true'},
+                resources=scheduler.challenge_resources(challenge),
+                host_port=lease.port,
+            )
+            ports = None
+            if result is not None:
+                leases.bind(lease, result[0])
+                ports = client.wait_until_ready(
+                    result[0],
+                    challenge.port,
+                    timeout=settings.PROVISION_TIMEOUT,
+                    probe_host=host.probe_host,
+                    banner=b'SSH-' if challenge.ssh_user else None,
+                    host_port=lease.port,
+                )
+                if not ports:
+                    client.stop_container(result[0])
+    except Exception as e:
+        logger.error(f"Warm container for challenge {challenge.id} failed: {str(e)}")
+        result = ports = None
+
+    if not ports:
+        leases.discard(lease)
+        warm.delete()
+        _incr(challenge.id, 'refill_failures')
+        return
+
+    updated = WarmContainer.objects.filter(id=warm.id).update(
+        status='ready',
+        container_id=result[0],
+        ssh_host=host.ssh_host,
+        ssh_port=lease.port,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        # The placeholder was dropped (pool shrunk or challenge deleted) while starting
+        with host.connection() as client:
+            client.stop_container(result[0])
+        leases.discard(lease)
+        return
+
+    elapsed_ms = round((time.monotonic() - started) * 1000)
+    _incr(challenge.id, 'refills')
+    _incr(challenge.id, 'refill_ms_total', elapsed_ms)
+    try:
+        cache.set(_metric_key(challenge.id, 'last_refill_ms'), elapsed_ms, None)
+    except Exception as e:
+        logger.error(f"Warm pool metric last_refill_ms not recorded: {str(e)}")
+
+
+def replica_target(challenge):
+    """Number of shared containers the challenge should have running"""
+    if challenge.is_hidden or not challenge.docker_image:
+        return 0
+    if challenge.instance_mode == 'shared':
+        return 1
+    if challenge.instance_mode == 'pool':
+        return challenge.replica_count
+    return 0
+
+
+def ensure_replicas(challenge_id):
+    """
+    Start or stop shared containers until the challenge has replica_target()
+    of them. Launches in flight are ProvisionJob rows without a team and are
+    counted under a lock on the challenge, like warm pool placeholders.
+    Returns the futures of the launches started.
+    """
+    surplus = []
+    with transaction.atomic():
+        challenge = Challenge.objects.select_for_update().filter(id=challenge_id).first()
+        if challenge is None:
+            return []
+
+        target = replica_target(challenge)
+        replicas = list(challenge.containers.filter(shared=True).order_by('created_at'))
+        starting = [
+            job for job in challenge.provision_jobs.filter(team__isnull=True, status__in=ProvisionJob.ACTIVE_STATUSES)
+            if not provisioning.is_stale(job)
+        ]
+        deficit = target - len(replicas) - len(starting)
+        jobs = [ProvisionJob.objects.create(challenge=challenge) for _ in range(max(deficit, 0))]
+        if len(replicas) > target:
+            surplus = replicas[target:]
+            Container.objects.filter(pk__in=[container.pk for container in surplus]).delete()
+
+    for container in surplus:
+        with docker_connection(container.docker_host) as client:
+            client.stop_container(container.container_id)
+
+    return [run_in_background(provisioning.run_job, job.id) for job in jobs]
+
+
+def _next_replica(challenge_id):
+    key = f'shared_replica:{challenge_id}'
+    try:
+        cache.add(key, 0, None)
+        return cache.incr(key)
+    except Exception as e:
+        logger.error(f"Round-robin counter unavailable: {str(e)}")
+        return random.randrange(1 << 30)
+
+
+def assign_shared(team, challenge):
+    """
+    Assign team to one of the challenge's shared containers, round-robin.
+    Returns None while none is running yet; the missing ones are started.
+    """
+    replicas = list(challenge.containers.filter(shared=True).order_by('created_at'))
+    if len(replicas) < replica_target(challenge):
+        schedule_refill(challenge.id)
+    if not replicas:
+        return None
+
+    container = replicas[_next_replica(challenge.id) % len(replicas)]
+    container.teams.add(team)
+    return container
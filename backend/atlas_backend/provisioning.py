@@ -0,0 +1,326 @@
+"""
+Background container provisioning.
+
+start_challenge records a ProvisionJob and returns straight away; the launch
+itself (run the container, wait for its ports, store the Container row) runs
+on a per-process thread pool. Job state lives in the database so any worker
+can answer status requests, and a team-scoped live event is published when
+the container is ready or the launch fails.
+
+Under ASGI the async views can instead run launches as tasks on the event
+loop, see run_job_async().
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from . import events, leases, scheduler
+from .models import Container, ProvisionJob
+
+logger = logging.getLogger('atlas_backend')
+
+ACTIVE_STATUSES = ProvisionJob.ACTIVE_STATUSES
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def docker_connection(host=None):
+    """Pooled connection to the named Docker host, the first configured one by default"""
+    return scheduler.get_host(host).connection()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PROVISION_WORKERS, thread_name_prefix='provision'
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def run_in_background(fn, *args):
+    """Run fn on this process's provisioning thread pool"""
+    def task():
+        try:
+            return fn(*args)
+        finally:
+            # Worker threads own their database connections
+            connections.close_all()
+    return _get_executor().submit(task)
+
+
+def container_details(container):
+    """Connection details shown to the team, same shape start_challenge always returned"""
+    details = {
+        'host': container.ssh_host,
+        'port': container.ssh_port,
+        'created_at': container.created_at,
+    }
+    if container.ssh_user:
+        details['ssh_user'] = container.ssh_user
+        details['ssh_password'] = container.ssh_password
+    return details
+
+
+def job_payload(job):
+    payload = {
+        'job_id': str(job.id),
+        'challenge_id': job.challenge_id,
+        'status': job.status,
+        'created_at': job.created_at,
+        'updated_at': job.updated_at,
+    }
+    if job.status == 'ready' and job.container is not None:
+        payload['container'] = container_details(job.container)
+    if job.status == 'failed':
+        payload['error'] = job.error
+    return payload
+
+
+def submit(team, challenge, runner=None):
+    """
+    Queue a launch for team/challenge, reusing one that is already in flight.
+    runner(job_id) starts a new job once it is committed, on the thread pool
+    by default.
+    """
+    runner = runner or partial(run_in_background, run_job)
+    try:
+        with transaction.atomic():
+            job = ProvisionJob.objects.select_for_update().filter(
+                team=team, challenge=challenge, status__in=ACTIVE_STATUSES
+            ).first()
+            if job is not None:
+                if not is_stale(job):
+                    return job
+                _interrupted(job)
+
+            job = ProvisionJob.objects.create(team=team, challenge=challenge)
+            transaction.on_commit(lambda: runner(job.id))
+        return job
+    except IntegrityError:
+        # A concurrent request queued the team's launch first (unique_active_provision_job)
+        return ProvisionJob.objects.filter(team=team, challenge=challenge).order_by('-created_at').first()
+
+
+def is_stale(job):
+    """A job left active well past the timeout belonged to a worker that died"""
+    deadline = timedelta(seconds=settings.PROVISION_TIMEOUT * 4)
+    return job.status in ACTIVE_STATUSES and timezone.now() - job.updated_at > deadline
+
+
+def get_job(job_id, team):
+    job = ProvisionJob.objects.select_related('container').filter(id=job_id, team=team).first()
+    if job is not None and is_stale(job):
+        _interrupted(job)
+    return job
+
+
+def _interrupted(job):
+    job.status = 'failed'
+    job.error = 'Provisioning was interrupted'
+    job.save(update_fields=['status', 'error', 'updated_at'])
+
+
+def _fail(job, message):
+    job.status = 'failed'
+    job.error = message
+    job.save(update_fields=['status', 'error', 'updated_at'])
+    if job.team_id is None:
+        logger.error(f"Shared container for challenge {job.challenge_id} failed: {message}")
+        return
+    events.publish('container_failed', {
+        'job_id': str(job.id),
+        'challenge_id': job.challenge_id,
+        'error': message,
+    }, team=job.team_id)
+
+
+def _start(job_id):
+    job = ProvisionJob.objects.select_related('team', 'challenge').get(id=job_id)
+    job.status = 'running'
+    job.save(update_fields=['status', 'updated_at'])
+    return job
+
+
+def _crashed(job_id, error):
+    logger.error(f"Provisioning job {job_id} failed: {str(error)}")
+    job = ProvisionJob.objects.filter(id=job_id).first()
+    if job is not None:
+        _fail(job, str(error))
+
+
+def run_job(job_id):
+    try:
+        _provision(_start(job_id))
+    except Exception as e:
+        _crashed(job_id, e)
+
+
+def _prepare(job):
+    """
+    Place the job on a host and lease it a port. Returns (host, lease, run
+    arguments for run_container), or None once the job has been failed.
+    """
+    team, challenge = job.team, job.challenge
+
+    host = scheduler.place(challenge)
+    if host is None:
+        _fail(job, 'No Docker host has capacity for another container')
+        return None
+    # Saved before launching so concurrent placements count it against the host
+    job.docker_host = host.name
+    job.save(update_fields=['docker_host', 'updated_at'])
+
+    lease = leases.allocate(host)
+    if lease is None:
+        _fail(job, f'No free ports left on Docker host {host.name}')
+        return None
+
+    if team is not None:
+        container_name = f"{team.name.replace(' ', '_')}-{challenge.title.replace(' ', '_')}"
+        labels = {'atlas.team': str(team.id), 'atlas.challenge': str(challenge.id)}
+    else:
+        container_name = f"shared-{challenge.title.replace(' ', '_')}-{job.id.hex[:8]}"
+        labels = {'atlas.shared': 'true', 'atlas.challenge': str(challenge.id)}
+
+    run_args = {
+        'port': challenge.port,
+        'container_name': container_name,
+        'labels': labels,
+        'resources': scheduler.challenge_resources(challenge),
+        'host_port': lease.port,
+    }
+    return host, lease, run_args
+
+
+def _ready_args(job, host, lease):
+    return {
+        'timeout': settings.PROVISION_TIMEOUT,
+        'probe_host': host.probe_host,
+        'banner': b'SSH-' if job.challenge.ssh_user else None,
+        'host_port': lease.port,
+    }
+
+
+def _abort(job, lease, message):
+    leases.discard(lease)
+    _fail(job, message)
+
+
+def _provision(job):
+    prepared = _prepare(job)
+    if prepared is None:
+        return
+    host, lease, run_args = prepared
+    challenge = job.challenge
+
+    with host.connection() as client:
+        result = client.run_container(challenge.docker_image, **run_args)
+        if result is None:
+            _abort(job, lease, 'Failed to start container')
+            return
+        container_id, password = result
+        leases.bind(lease, container_id)
+
+        ports = client.wait_until_ready(container_id, challenge.port, **_ready_args(job, host, lease))
+        if not ports:
+            client.stop_container(container_id)
+            _abort(job, lease, 'Timeout waiting for container ports')
+            return
+
+    _record(job, host, lease, container_id, password)
+
+
+def _record(job, host, lease, container_id, password):
+    team, challenge = job.team, job.challenge
+    with transaction.atomic():
+        container = Container.objects.create(
+            team=team,
+            shared=team is None,
+            challenge=challenge,
+            container_id=container_id,
+            docker_host=host.name,
+            ssh_host=host.ssh_host,
+            ssh_port=lease.port,
+            ssh_user=challenge.ssh_user or '',
+            ssh_password=password,
+        )
+        job.container = container
+        job.status = 'ready'
+        job.save(update_fields=['container', 'status', 'updated_at'])
+        if team is None:
+            return
+        events.publish('container_ready', {
+            'job_id': str(job.id),
+            'challenge_id': challenge.id,
+            **container_details(container),
+        }, team=team)
+
+
+# Launches for the async views (settings.DOCKER_ASYNC_VIEWS) run as tasks on
+# the ASGI event loop and await the Docker daemon through async_docker instead
+# of taking a thread from the pool above; the database work around them is the
+# same and still runs through sync_to_async.
+
+_tasks = set()
+
+
+def _spawn(coroutine):
+    task = asyncio.get_running_loop().create_task(coroutine)
+    # The loop only keeps weak references to its tasks
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+def run_on_loop(loop, job_id):
+    """submit() runner that starts run_job_async on loop, from whichever thread committed the job"""
+    # A fresh context so the task does not inherit the committing request's sync_to_async state
+    loop.call_soon_threadsafe(_spawn, run_job_async(job_id), context=contextvars.Context())
+
+
+async def run_job_async(job_id):
+    try:
+        job = await sync_to_async(_start)(job_id)
+        await _provision_async(job)
+    except Exception as e:
+        await sync_to_async(_crashed)(job_id, e)
+
+
+async def _provision_async(job):
+    prepared = await sync_to_async(_prepare)(job)
+    if prepared is None:
+        return
+    host, lease, run_args = prepared
+    challenge = job.challenge
+    client = host.async_client()
+
+    result = await client.run_container(challenge.docker_image, **run_args)
+    if result is None:
+        await sync_to_async(_abort)(job, lease, 'Failed to start container')
+        return
+    container_id, password = result
+    await sync_to_async(leases.bind)(lease, container_id)
+
+    ports = await client.wait_until_ready(container_id, challenge.port, **_ready_args(job, host, lease))
+    if not ports:
+        await client.stop_container(container_id)
+        await sync_to_async(_abort)(job, lease, 'Timeout waiting for container ports')
+        return
+
+    await sync_to_async(_record)(job, host, lease, container_id, password)
@@ -0,0 +1,209 @@
+"""
+Token bucket rate limiting for the endpoints bots hammer.
+
+Each budget in settings.RATE_LIMITS is a bucket of `burst` requests refilled
+evenly over `period` seconds, kept per user, team or client IP. With
+settings.REDIS_URL set a bucket is a Redis hash updated by one Lua script, so
+every worker draws from the same bucket in a single round trip. Without
+Redis, or while it is unreachable, buckets are kept in this process instead.
+
+limit() checks the buckets before the view runs, so a rejected request costs
+no database work beyond authentication. A request takes a token from each of
+its buckets only if every one of them has a token, so a request rejected by
+one budget does not drain the others. Rejections are counted per budget in
+the shared cache for the admin dashboard.
+"""
+import logging
+import math
+import threading
+import time
+from functools import wraps
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger('atlas_backend')
+
+# ARGV is now followed by burst, rate for each key. Takes a token from every
+# bucket when all have one and returns {0, '0'}, otherwise takes none and
+# returns {position of the bucket with the longest wait, seconds to wait}.
+_TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tokens = {}
+local blocked, wait = 0, 0
+for i, key in ipairs(KEYS) do
+    local burst = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+    local available = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens[i] = math.min(burst, available + math.max(0, now - updated) * rate)
+    if tokens[i] < 1 and (1 - tokens[i]) / rate > wait then
+        blocked, wait = i, (1 - tokens[i]) / rate
+    end
+end
+if blocked == 0 then
+    for i, key in ipairs(KEYS) do
+        local burst = tonumber(ARGV[i * 2])
+        local rate = tonumber(ARGV[i * 2 + 1])
+        redis.call('HSET', key, 'tokens', tostring(tokens[i] - 1), 'updated', tostring(now))
+        redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+    end
+end
+return {blocked, tostring(wait)}
+"""
+
+# Full buckets are dropped from the in-process store once it grows this large
+_LOCAL_SWEEP_SIZE = 10000
+
+
+class LocalBuckets:
+    """Token buckets kept in this process, for when no shared Redis is available"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, buckets, now):
+        """_take() for (key, burst, rate) buckets kept in this process"""
+        with self._lock:
+            tokens = []
+            blocked, wait = None, 0.0
+            for i, (key, burst, rate) in enumerate(buckets):
+                available, updated, _ = self._buckets.get(key, (burst, now, now))
+                tokens.append(min(burst, available + max(0.0, now - updated) * rate))
+                if tokens[i] < 1 and (1 - tokens[i]) / rate > wait:
+                    blocked, wait = i, (1 - tokens[i]) / rate
+            if blocked is None:
+                for (key, burst, rate), available in zip(buckets, tokens):
+                    self._buckets[key] = (available - 1, now, now + (burst - available + 1) / rate)
+            if len(self._buckets) > _LOCAL_SWEEP_SIZE:
+                # A bucket that has refilled completely is the same as no bucket
+                self._buckets = {k: b for k, b in self._buckets.items() if b[2] > now}
+            return blocked, wait
+
+
+_local = LocalBuckets()
+
+_script = None
+_script_lock = threading.Lock()
+
+
+def _shared_script():
+    """_TAKE_SCRIPT registered on a client for settings.REDIS_URL, None without Redis"""
+    global _script
+    if not settings.REDIS_URL:
+        return None
+    with _script_lock:
+        if _script is None:
+            _script = redis.Redis.from_url(settings.REDIS_URL).register_script(_TAKE_SCRIPT)
+        return _script
+
+
+def _take(scopes):
+    """
+    Take a token from the bucket of every (scope, ident) in scopes, or from
+    none of them. Returns (None, 0), or the scope that ran out and the
+    seconds until it has a token again.
+    """
+    buckets = []
+    for scope, ident in scopes:
+        burst, period = settings.RATE_LIMITS[scope]
+        buckets.append((f'ratelimit:{scope}:{ident}', burst, burst / period))
+    now = time.time()
+    script = _shared_script()
+    if script is not None:
+        try:
+            position, wait = script(
+                keys=[key for key, _, _ in buckets],
+                args=[now, *(value for _, burst, rate in buckets for value in (burst, rate))],
+            )
+            position = int(position)
+            return (scopes[position - 1][0], float(wait)) if position else (None, 0)
+        except Exception as e:
+            logger.error(f"Shared rate limit unavailable, limiting per process: {str(e)}")
+    blocked, wait = _local.take(buckets, now)
+    return (scopes[blocked][0], wait) if blocked is not None else (None, 0)
+
+
+def _count_rejection(scope):
+    key = f'ratelimit:rejected:{scope}'
+    try:
+        cache.add(key, 0, None)
+        cache.incr(key)
+    except Exception as e:
+        logger.error(f"Rate limit rejection of {scope} not counted: {str(e)}")
+
+
+def get_metrics():
+    """Rejected requests per budget, for the admin dashboard"""
+    keys = {f'ratelimit:rejected:{scope}': scope for scope in settings.RATE_LIMITS}
+    try:
+        values = cache.get_many(list(keys))
+    except Exception as e:
+        logger.error(f"Rate limit metrics unavailable: {str(e)}")
+        values = {}
+    return {scope: values.get(key, 0) for key, scope in keys.items()}
+
+
+def client_ip(request):
+    header = settings.RATE_LIMIT_IP_HEADER
+    if header and request.META.get(header):
+        # The last entry is the one added by our own proxy, the rest are client supplied
+        return request.META[header].split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _identity(request, kind):
+    if kind == 'ip':
+        return client_ip(request)
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    if kind == 'team':
+        return user.team_id
+    return user.id
+
+
+def retry_after(request, endpoint, kinds):
+    """Seconds the client must wait before calling endpoint again, 0 if it may go ahead"""
+    scopes = []
+    for kind in kinds:
+        scope = f'{endpoint}:{kind}'
+        if scope not in settings.RATE_LIMITS:
+            continue
+        ident = _identity(request, kind)
+        if ident is None:
+            continue
+        scopes.append((scope, ident))
+    if not scopes:
+        return 0
+    scope, wait = _take(scopes)
+    if scope is None:
+        return 0
+    _count_rejection(scope)
+    return max(1, math.ceil(wait))
+
+
+def limit(endpoint, *kinds):
+    """
+    Rate limit a view by the settings.RATE_LIMITS budgets '<endpoint>:<kind>'
+    for each kind ('user', 'team' or 'ip'), answering 429 with Retry-After.
+    Goes below @api_view so request.user is already authenticated.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            wait = retry_after(request, endpoint, kinds)
+            if wait:
+                return Response(
+                    {'error': f'Too many requests, try again in {wait} seconds'},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                    headers={'Retry-After': str(wait)},
+                )
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,198 @@
+"""
+Container reaper.
+
+Reconciles Container and WarmContainer rows with what is actually running on
+the Docker host:
+
+- containers older than CONTAINER_TTL are stopped and their rows deleted
+  (shared containers have no TTL)
+- rows whose container is no longer running (it exited or was removed by
+  hand) are deleted, and dead shared containers are replaced
+- managed containers with no row at all are stopped
+- port leases whose container is no longer running are released
+
+Each Docker host is listed once per run and stops are issued concurrently in
+batches, so a run costs one list call per host plus one stop call per
+container that actually has to go.
+
+reap() is used both by the reap_containers management command and by the
+in-process scheduler, started on a process's first request (see
+connect_scheduler()).
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import connections
+from django.utils import timezone
+
+from . import orchestrator, scheduler
+from .models import Container, PortLease, WarmContainer
+from .provisioning import run_in_background
+
+logger = logging.getLogger('atlas_backend')
+
+LOCK_KEY = 'reaper:lock'
+
+
+def reap(batch_size=None, dry_run=False):
+    """
+    Run one reconciliation pass over every Docker host and return counts of
+    what was done, or None if no host could be listed. Hosts that could not
+    be reaped are counted as skipped_hosts.
+    """
+    batch_size = batch_size or settings.REAPER_BATCH_SIZE
+    totals = None
+    skipped = 0
+    for host in scheduler.get_hosts():
+        try:
+            stats = _reap_host(host, batch_size, dry_run)
+        except Exception as e:
+            # One unreachable host must not keep the others from being reaped
+            logger.error(f"Reaper skipped Docker host {host.name}: {str(e)}")
+            stats = None
+        if stats is None:
+            skipped += 1
+            continue
+        if totals is None:
+            totals = dict.fromkeys(stats, 0)
+        for key, value in stats.items():
+            totals[key] += value
+    if totals is not None:
+        totals['skipped_hosts'] = skipped
+
+    if totals and any(totals[key] for key in ('expired', 'dead', 'orphans')):
+        logger.info(f"Reaper: {totals}")
+    return totals
+
+
+def _reap_host(host, batch_size, dry_run):
+    now = timezone.now()
+    cutoff = now - settings.CONTAINER_TTL
+    # A container this young may belong to a launch that has not written its row yet
+    grace_cutoff = time.time() - settings.PROVISION_TIMEOUT * 2
+
+    # Rows are read before the host is listed: a row committed after the listing
+    # would otherwise look dead. Warm rows go first, since a claim moves a
+    # container from its warm row to a Container row in one transaction.
+    host_names = scheduler.stored_names(host)
+    warm_ids = set(
+        WarmContainer.objects.filter(docker_host__in=host_names, container_id__isnull=False)
+        .values_list('container_id', flat=True)
+    )
+    rows = {
+        container_id: (created_at, shared, challenge_id)
+        for container_id, created_at, shared, challenge_id in Container.objects.filter(
+            docker_host__in=host_names
+        ).values_list('container_id', 'created_at', 'shared', 'challenge_id')
+    }
+
+    with host.connection() as client:
+        running = client.list_managed_containers()
+    if running is None:
+        logger.error(f"Reaper skipped Docker host {host.name}: could not list containers")
+        return None
+    running = {container['Id']: container for container in running}
+
+    # Shared containers serve many teams and have no TTL
+    expired = [cid for cid, (created_at, shared, _) in rows.items() if created_at < cutoff and not shared]
+    dead = [
+        cid for cid, (created_at, shared, _) in rows.items()
+        if cid not in running and (created_at >= cutoff or shared)
+    ]
+    dead_warm = [cid for cid in warm_ids if cid not in running]
+    orphans = [
+        cid for cid, container in running.items()
+        if cid not in rows and cid not in warm_ids and container.get('Created', 0) < grace_cutoff
+    ]
+
+    stats = {
+        'running': len(running),
+        'expired': len(expired),
+        'dead': len(dead) + len(dead_warm),
+        'orphans': len(orphans),
+        'stop_failures': 0,
+    }
+    if dry_run:
+        return stats
+
+    to_stop = [cid for cid in expired if cid in running] + orphans
+    stats['stop_failures'] = len(_stop_all(host, to_stop, batch_size))
+
+    # Rows go even if the stop failed; a container that survives is picked up as an orphan next run
+    to_delete = expired + dead
+    for start in range(0, len(to_delete), batch_size):
+        Container.objects.filter(container_id__in=to_delete[start:start + batch_size]).delete()
+    if dead_warm:
+        WarmContainer.objects.filter(container_id__in=dead_warm).delete()
+
+    # Leases of containers that are gone without a row to release them
+    PortLease.objects.filter(
+        docker_host=host.name, container_id__isnull=False,
+        created_at__lt=now - timedelta(seconds=settings.PROVISION_TIMEOUT * 2),
+    ).exclude(container_id__in=list(running)).delete()
+
+    # Replace shared containers that died
+    for challenge_id in {rows[cid][2] for cid in dead if rows[cid][1]}:
+        run_in_background(orchestrator.ensure_replicas, challenge_id)
+    return stats
+
+
+def _stop_all(host, container_ids, batch_size):
+    """Stop containers on host concurrently, returning the ids that failed"""
+    if not container_ids:
+        return []
+
+    def stop(container_id):
+        with host.connection() as client:
+            return client.stop_container(container_id, timeout=settings.REAPER_STOP_TIMEOUT)
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=batch_size, thread_name_prefix='reaper') as executor:
+        for start in range(0, len(container_ids), batch_size):
+            batch = container_ids[start:start + batch_size]
+            for container_id, stopped in zip(batch, executor.map(stop, batch)):
+                if not stopped:
+                    failures.append(container_id)
+    return failures
+
+
+_scheduler_started = False
+_scheduler_lock = threading.Lock()
+
+
+def _run_scheduler():
+    interval = settings.REAPER_INTERVAL
+    while True:
+        time.sleep(interval)
+        try:
+            # One process per interval does the work when several workers run the scheduler
+            if cache.add(LOCK_KEY, True, interval):
+                reap()
+        except Exception as e:
+            logger.error(f"Reaper run failed: {str(e)}")
+        finally:
+            connections.close_all()
+
+
+def start_scheduler(**kwargs):
+    """Start the background reaper thread once per process (on its first request)"""
+    global _scheduler_started
+    if _scheduler_started or settings.REAPER_INTERVAL <= 0:
+        return
+    with _scheduler_lock:
+        if _scheduler_started:
+            return
+        _scheduler_started = True
+    threading.Thread(target=_run_scheduler, name='reaper', daemon=True).start()
+
+
+def connect_scheduler():
+    # Started on the first request rather than at import so management
+    # commands and migrations never spawn it
+    request_started.connect(start_scheduler, dispatch_uid='atlas_reaper_scheduler')
@@ -0,0 +1,233 @@
+"""
+Resource usage sampling of challenge containers.
+
+sample() makes one pass over every Docker host: a single list call finds the
+running managed containers, one-shot stats calls for the ones that have a
+Container row run concurrently, and a single events call counts OOM kills
+since the previous pass. Each snapshot is folded into the container's
+ContainerStats row (latest values, exponentially weighted averages and peaks;
+CPU and network rates are deltas between consecutive snapshots) and the rows
+are written back with one bulk insert and one bulk update per host.
+
+Like the reaper, sample() runs from the sample_container_stats management
+command and from an in-process scheduler, started on a process's first
+request (see connect_scheduler()). A host that cannot be reached is skipped.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import connections
+from django.utils import timezone
+from docker.errors import DockerException
+
+from . import scheduler
+from .models import Container, ContainerStats
+
+logger = logging.getLogger('atlas_backend')
+
+LOCK_KEY = 'stats_sampler:lock'
+
+UPDATE_FIELDS = [
+    'samples', 'cpu_percent', 'cpu_percent_avg', 'cpu_percent_max',
+    'memory_usage', 'memory_avg', 'memory_max', 'memory_limit',
+    'network_rx', 'network_tx', 'network_rx_rate', 'network_tx_rate',
+    'oom_kills', 'cpu_total', 'system_total', 'sampled_at',
+]
+
+
+def sample():
+    """Sample every Docker host once and return counts, or None if no host could be listed"""
+    totals = None
+    for host in scheduler.get_hosts():
+        stats = _sample_host(host)
+        if stats is None:
+            continue
+        if totals is None:
+            totals = dict.fromkeys(stats, 0)
+        for key, value in stats.items():
+            totals[key] += value
+    return totals
+
+
+def _sample_host(host):
+    try:
+        with host.connection() as client:
+            running = client.list_managed_containers()
+    except (DockerException, OSError) as e:
+        logger.error(f"Stats sampler skipped Docker host {host.name}: {str(e)}")
+        return None
+    if running is None:
+        logger.error(f"Stats sampler skipped Docker host {host.name}: could not list containers")
+        return None
+    running = [container['Id'] for container in running]
+
+    host_names = scheduler.stored_names(host)
+    container_ids = list(
+        Container.objects.filter(docker_host__in=host_names, container_id__in=running)
+        .values_list('container_id', flat=True)
+    )
+
+    snapshots = _snapshots(host, container_ids)
+    oom_kills = _oom_kills(host)
+
+    now = timezone.now()
+    existing = ContainerStats.objects.in_bulk(container_ids)
+    created, updated = [], []
+    for container_id, snapshot in snapshots.items():
+        stats = existing.get(container_id)
+        if stats is None:
+            stats = ContainerStats(container_id=container_id)
+            created.append(stats)
+        else:
+            updated.append(stats)
+        fold(stats, snapshot, oom_kills.get(container_id, 0), now)
+
+    ContainerStats.objects.bulk_create(created, ignore_conflicts=True)
+    ContainerStats.objects.bulk_update(updated, UPDATE_FIELDS)
+    return {'sampled': len(snapshots), 'oom_kills': sum(oom_kills.get(cid, 0) for cid in snapshots)}
+
+
+def _snapshots(host, container_ids):
+    def fetch(container_id):
+        try:
+            with host.connection() as client:
+                return client.container_stats(container_id)
+        except (DockerException, OSError) as e:
+            logger.error(f"Stats of container {container_id} on Docker host {host.name} unavailable: {str(e)}")
+            return None
+
+    snapshots = {}
+    with ThreadPoolExecutor(max_workers=settings.STATS_CONCURRENCY, thread_name_prefix='stats') as executor:
+        for container_id, snapshot in zip(container_ids, executor.map(fetch, container_ids)):
+            if snapshot:
+                snapshots[container_id] = snapshot
+    return snapshots
+
+
+def _oom_kills(host):
+    """OOM kills per container id since the previous pass on this host"""
+    key = f'stats_sampler:{host.name}:oom_since'
+    until = int(time.time())
+    since = cache.get(key) or until - settings.STATS_INTERVAL
+    try:
+        with host.connection() as client:
+            events = client.oom_events(since, until)
+    except (DockerException, OSError) as e:
+        logger.error(f"OOM events of Docker host {host.name} unavailable: {str(e)}")
+        events = None
+    if events is None:
+        return {}
+    cache.set(key, until, None)
+
+    counts = {}
+    for container_id in events:
+        counts[container_id] = counts.get(container_id, 0) + 1
+    return counts
+
+
+def _smooth(average, value):
+    if average is None:
+        return value
+    return average + settings.STATS_SMOOTHING * (value - average)
+
+
+def fold(stats, snapshot, oom_kills, now):
+    """Update a ContainerStats row with a Docker stats snapshot taken at now"""
+    cpu = snapshot.get('cpu_stats') or {}
+    cpu_total = (cpu.get('cpu_usage') or {}).get('total_usage') or 0
+    system_total = cpu.get('system_cpu_usage') or 0
+    online_cpus = cpu.get('online_cpus') or len((cpu.get('cpu_usage') or {}).get('percpu_usage') or []) or 1
+    if stats.samples and system_total > stats.system_total and cpu_total >= stats.cpu_total:
+        # Same formula as `docker stats`: the container's share of all CPU time, times the CPUs
+        stats.cpu_percent = (cpu_total - stats.cpu_total) / (system_total - stats.system_total) * online_cpus * 100
+        stats.cpu_percent_avg = _smooth(stats.cpu_percent_avg, stats.cpu_percent)
+        stats.cpu_percent_max = max(stats.cpu_percent_max or 0, stats.cpu_percent)
+    stats.cpu_total = cpu_total
+    stats.system_total = system_total
+
+    memory = snapshot.get('memory_stats') or {}
+    detail = memory.get('stats') or {}
+    # Inactive page cache can be reclaimed, so it is not counted (as in `docker stats`)
+    inactive = detail.get('inactive_file', detail.get('total_inactive_file', 0))
+    stats.memory_usage = max((memory.get('usage') or 0) - inactive, 0)
+    stats.memory_avg = round(_smooth(stats.memory_avg if stats.samples else None, stats.memory_usage))
+    stats.memory_max = max(stats.memory_max, stats.memory_usage)
+    stats.memory_limit = memory.get('limit') or 0
+
+    networks = (snapshot.get('networks') or {}).values()
+    network_rx = sum(network.get('rx_bytes', 0) for network in networks)
+    network_tx = sum(network.get('tx_bytes', 0) for network in networks)
+    if stats.sampled_at is not None:
+        elapsed = (now - stats.sampled_at).total_seconds()
+        if elapsed > 0:
+            stats.network_rx_rate = max(network_rx - stats.network_rx, 0) / elapsed
+            stats.network_tx_rate = max(network_tx - stats.network_tx, 0) / elapsed
+    stats.network_rx = network_rx
+    stats.network_tx = network_tx
+
+    stats.oom_kills += oom_kills
+    stats.samples += 1
+    stats.sampled_at = now
+
+
+def stats_payload(stats):
+    """ContainerStats as shown in the admin container listing"""
+    def rounded(value):
+        return round(value, 1) if value is not None else None
+
+    return {
+        'cpu_percent': rounded(stats.cpu_percent),
+        'cpu_percent_avg': rounded(stats.cpu_percent_avg),
+        'cpu_percent_max': rounded(stats.cpu_percent_max),
+        'memory_usage': stats.memory_usage,
+        'memory_avg': stats.memory_avg,
+        'memory_max': stats.memory_max,
+        'memory_limit': stats.memory_limit,
+        'memory_percent': rounded(stats.memory_usage * 100 / stats.memory_limit) if stats.memory_limit else None,
+        'network_rx': stats.network_rx,
+        'network_tx': stats.network_tx,
+        'network_rx_rate': rounded(stats.network_rx_rate),
+        'network_tx_rate': rounded(stats.network_tx_rate),
+        'oom_kills': stats.oom_kills,
+        'samples': stats.samples,
+        'sampled_at': stats.sampled_at,
+    }
+
+
+_scheduler_started = False
+_scheduler_lock = threading.Lock()
+
+
+def _run_scheduler():
+    interval = settings.STATS_INTERVAL
+    while True:
+        time.sleep(interval)
+        try:
+            # One process per interval samples when several workers run the scheduler
+            if cache.add(LOCK_KEY, True, interval):
+                sample()
+        except Exception as e:
+            logger.error(f"Stats sampling failed: {str(e)}")
+        finally:
+            connections.close_all()
+
+
+def start_scheduler(**kwargs):
+    """Start the background sampler thread once per process (on its first request)"""
+    global _scheduler_started
+    if _scheduler_started or settings.STATS_INTERVAL <= 0:
+        return
+    with _scheduler_lock:
+        if _scheduler_started:
+            return
+        _scheduler_started = True
+    threading.Thread(target=_run_scheduler, name='stats-sampler', daemon=True).start()
+
+
+def connect_scheduler():
+    request_started.connect(start_scheduler, dispatch_uid='atlas_stats_sampler')
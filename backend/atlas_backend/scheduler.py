@@ -0,0 +1,329 @@
+"""
+Placement of challenge containers across Docker hosts.
+
+The hosts come from settings.DOCKER_HOSTS. What each host is running is
+derived from the database rather than asked of the daemons: Container and
+WarmContainer rows plus launches still in flight all carry the name of their
+host and reserve the CPU and memory limits of their challenge's resource
+profile. place() picks the host that is least loaded after adding one more
+container and that still has room for it.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from docker.errors import DockerException
+from docker.utils import parse_bytes
+
+from async_docker import get_client
+from docker_plugin import CONTAINER_RESOURCES, get_pool
+
+from .leases import parse_port_ranges
+from .models import Container, PortLease, ProvisionJob, WarmContainer
+
+logger = logging.getLogger('atlas_backend')
+
+
+CPU_PERIOD = CONTAINER_RESOURCES['cpu_period']
+MIB = 1024 * 1024
+
+
+def challenge_resources(challenge):
+    """run_container resources for the challenge's resource profile"""
+    return {
+        'cpu_quota': challenge.cpu_quota,
+        'cpu_period': CPU_PERIOD,
+        'memory': f'{challenge.memory_limit}m',
+        'pids_limit': challenge.pids_limit,
+        'cpuset_cpus': challenge.cpuset_cpus or None,
+        'tmpfs': challenge.tmpfs or None,
+    }
+
+
+def container_reservation(challenge=None):
+    """(cpus, memory bytes) reserved by one container of challenge, or a default one"""
+    if challenge is None:
+        cpus = CONTAINER_RESOURCES['cpu_quota'] / CPU_PERIOD
+        return cpus, parse_bytes(CONTAINER_RESOURCES['memory'])
+    return challenge.cpu_quota / CPU_PERIOD, challenge.memory_limit * MIB
+
+
+def _highest_cpu(cpuset):
+    """Highest CPU index named by a cpuset string like "0-3,6" """
+    return max(int(cpu) for part in cpuset.split(',') for cpu in part.split('-'))
+
+
+class DockerHost:
+    def __init__(self, name, url, key_file=None, ssh_host=None, probe_host=None, cpus=None, memory=None,
+                 ports=None):
+        self.name = name
+        self.url = url
+        self.key_file = key_file
+        self.ssh_host = ssh_host or settings.SSH_HOST_URL
+        self.probe_host = probe_host or settings.PROVISION_PROBE_HOST
+        self.cpus = float(cpus) if cpus else None
+        self.memory = parse_bytes(memory) if memory else None
+        self.port_ranges = parse_port_ranges(ports or settings.CONTAINER_PORT_RANGES)
+        self._capacity_lock = threading.Lock()
+
+    def connection(self):
+        return get_pool(
+            self.url,
+            self.key_file,
+            max_size=settings.DOCKER_POOL_SIZE,
+            health_check_interval=settings.DOCKER_HEALTH_CHECK_INTERVAL,
+        ).connection()
+
+    def async_client(self):
+        """asyncio client for the host on the running event loop, see async_docker.py"""
+        return get_client(self.url, self.key_file, max_size=settings.DOCKER_ASYNC_POOL_SIZE)
+
+    def capacity(self):
+        """(cpus, memory bytes) available on the host, or None if it cannot be reached"""
+        with self._capacity_lock:
+            if self.cpus is None or self.memory is None:
+                try:
+                    with self.connection() as client:
+                        info = client.info()
+                except (DockerException, OSError) as e:
+                    # Not cached, so the host is asked again once it is back
+                    logger.error(f"Docker host {self.name} is unreachable: {str(e)}")
+                    return None
+                if not info:
+                    return None
+                self.cpus = self.cpus or float(info['NCPU'])
+                self.memory = self.memory or int(info['MemTotal'])
+            return self.cpus, self.memory
+
+    def __repr__(self):
+        return f"DockerHost({self.name!r}, {self.url!r})"
+
+
+_hosts = None
+_hosts_lock = threading.Lock()
+
+
+def get_hosts():
+    global _hosts
+    with _hosts_lock:
+        if _hosts is None:
+            _hosts = [DockerHost(**host) for host in settings.DOCKER_HOSTS]
+        return _hosts
+
+
+def get_host(name=None):
+    """The named host; blank names (rows from before multi-host) map to the first one"""
+    hosts = get_hosts()
+    if not name:
+        return hosts[0]
+    for host in hosts:
+        if host.name == name:
+            return host
+    raise KeyError(f"Docker host {name} is not configured")
+
+
+def stored_names(host):
+    """docker_host values of rows on host; rows from before multi-host have a blank one and belong to the first host"""
+    return [host.name, ''] if host is get_host() else [host.name]
+
+
+def running_containers(hosts=None):
+    """
+    {host name: {container id: list entry}} of the managed containers running
+    on each host, from one list call per host made concurrently. Hosts that
+    could not be listed map to None.
+    """
+    hosts = hosts if hosts is not None else get_hosts()
+    if not hosts:
+        return {}
+
+    def listing(host):
+        try:
+            with host.connection() as client:
+                return client.list_managed_containers()
+        except Exception as e:
+            logger.error(f"Docker host {host.name} is unreachable: {str(e)}")
+            return None
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(hosts), thread_name_prefix='list') as executor:
+        for host, containers in zip(hosts, executor.map(listing, hosts)):
+            if containers is None:
+                logger.error(f"Could not list containers on Docker host {host.name}")
+                running[host.name] = None
+            else:
+                running[host.name] = {container['Id']: container for container in containers}
+    return running
+
+
+def usage():
+    """Containers placed on each host and the CPUs/memory bytes they reserve, including launches in flight"""
+    totals = {host.name: {'containers': 0, 'cpus': 0.0, 'memory': 0} for host in get_hosts()}
+    querysets = (
+        Container.objects.all(),
+        WarmContainer.objects.all(),
+        ProvisionJob.objects.filter(status__in=ProvisionJob.ACTIVE_STATUSES, container__isnull=True)
+        .exclude(docker_host=''),
+    )
+    for queryset in querysets:
+        rows = queryset.order_by().values('docker_host').annotate(
+            count=Count('pk'),
+            cpu_quota=Sum('challenge__cpu_quota'),
+            memory_limit=Sum('challenge__memory_limit'),
+        )
+        for row in rows:
+            name = row['docker_host'] or get_host().name
+            if name in totals:
+                totals[name]['containers'] += row['count']
+                totals[name]['cpus'] += (row['cpu_quota'] or 0) / CPU_PERIOD
+                totals[name]['memory'] += (row['memory_limit'] or 0) * MIB
+    return totals
+
+
+def host_report():
+    """Containers, reserved and total resources per host for the admin dashboard"""
+    totals = usage()
+    leased = dict(
+        PortLease.objects.order_by().values('docker_host').annotate(count=Count('pk'))
+        .values_list('docker_host', 'count')
+    )
+    report = []
+    for host in get_hosts():
+        capacity = host.capacity()
+        report.append({
+            'name': host.name,
+            'ssh_host': host.ssh_host,
+            'containers': totals[host.name]['containers'],
+            'reserved_cpus': round(totals[host.name]['cpus'], 2),
+            'reserved_memory': totals[host.name]['memory'],
+            'cpus': capacity[0] if capacity else None,
+            'memory': capacity[1] if capacity else None,
+            'reachable': capacity is not None,
+            'port_ranges': [f'{low}-{high}' for low, high in host.port_ranges],
+            'ports_leased': leased.get(host.name, 0),
+        })
+    return report
+
+
+def place(challenge=None):
+    """
+    Host for a new container of challenge, or None when no reachable host has
+    room for its resource profile. Load is the larger of the CPU and memory
+    fractions reserved once the new container is added; ties go to the host
+    with fewer containers.
+    """
+    cpus, memory = container_reservation(challenge)
+    cpuset = challenge.cpuset_cpus if challenge is not None else ''
+    totals = usage()
+    best, best_key = None, None
+    for host in get_hosts():
+        capacity = host.capacity()
+        if capacity is None:
+            logger.error(f"Docker host {host.name} is unreachable, skipping it")
+            continue
+        if cpuset and _highest_cpu(cpuset) >= capacity[0]:
+            continue
+        reserved_cpus = totals[host.name]['cpus'] + cpus
+        reserved_memory = totals[host.name]['memory'] + memory
+        if reserved_cpus > capacity[0] or reserved_memory > capacity[1]:
+            continue
+        key = (max(reserved_cpus / capacity[0], reserved_memory / capacity[1]), totals[host.name]['containers'])
+        if best_key is None or key < best_key:
+            best, best_key = host, key
+    return best
+
+
+def load_image(upload, progress=None, hosts=None):
+    """
+    Stream an uploaded image archive (any django File) to every host, or just
+    the given ones, so any of them can run it. progress(host_name, sent, size)
+    is called as chunks go out. Returns the image id, or None if no host
+    loaded it.
+    """
+    image_id = None
+    for host in hosts if hosts is not None else get_hosts():
+        with host.connection() as client:
+            loaded = client.load_image(
+                upload.chunks(settings.DOCKER_IMAGE_CHUNK_SIZE),
+                size=upload.size,
+                progress=partial(progress, host.name) if progress else None,
+            )
+        if loaded is None:
+            logger.error(f"Failed to load image {upload.name} on Docker host {host.name}")
+        image_id = image_id or loaded
+    return image_id
+
+
+def hosts_missing_image(image_id):
+    """Hosts that do not have the image yet (or could not be asked)"""
+    missing = []
+    for host in get_hosts():
+        with host.connection() as client:
+            if not client.has_image(image_id):
+                missing.append(host)
+    return missing
+
+
+def prewarm(images, concurrency=None):
+    """
+    Make every image present on every host before teams start launching
+    challenges. Missing images are copied from a host that has them (or pulled
+    when no host does), at most `concurrency` transfers at a time, and the id
+    each host ends up with is checked against the reference id. Returns
+    {image: {host_name: status}} with status one of 'ready' (already there),
+    'copied', 'pulled' or 'failed'.
+    """
+    concurrency = concurrency or settings.IMAGE_PREWARM_CONCURRENCY
+    hosts = get_hosts()
+    report = {image: dict.fromkeys(host.name for host in hosts) for image in images}
+
+    def image_id_on(host, image):
+        with host.connection() as client:
+            return client.get_image_id(image)
+
+    def transfer(host, image, source, expected_id):
+        with host.connection() as client:
+            if source is None:
+                return client.prewarm(image, expected_id=expected_id)
+            with source.connection() as source_client:
+                return client.prewarm(image, source=source_client, expected_id=expected_id)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='prewarm') as executor:
+        present = {
+            (image, host.name): executor.submit(image_id_on, host, image)
+            for image in images for host in hosts
+        }
+        present = {key: future.result() for key, future in present.items()}
+
+        transfers = {}
+        for image in images:
+            holders = [host for host in hosts if present[(image, host.name)]]
+            expected_id = present[(image, holders[0].name)] if holders else None
+            for host in hosts:
+                image_id = present[(image, host.name)]
+                if image_id and image_id == expected_id:
+                    report[image][host.name] = 'ready'
+                elif image_id:
+                    logger.error(f"Image {image} on Docker host {host.name} is {image_id}, expected {expected_id}")
+                    report[image][host.name] = 'failed'
+                elif image_id is None:
+                    report[image][host.name] = 'failed'
+                else:
+                    # Spread copies over the hosts that already have the image
+                    source = holders[len(transfers) % len(holders)] if holders else None
+                    transfers[(image, host.name)] = (
+                        executor.submit(transfer, host, image, source, expected_id),
+                        'copied' if source else 'pulled',
+                    )
+
+        for (image, host_name), (future, done_status) in transfers.items():
+            try:
+                ok = future.result()
+            except Exception as e:
+                logger.error(f"Prewarming {image} on Docker host {host_name} failed: {str(e)}")
+                ok = None
+            report[image][host_name] = done_status if ok else 'failed'
+    return report
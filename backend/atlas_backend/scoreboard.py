@@ -0,0 +1,104 @@
+"""
+Materialized scoreboard.
+
+Every team has a ScoreboardEntry row holding its score, solve count, last
+solve time and member count. Rows are updated when those values change
+(correct flag submissions, hint purchases, team membership changes) so that
+reading the ranked scoreboard is a single query.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from .models import ScoreboardEntry, Submission, Team, User
+
+RANK_ORDERING = ('-score', 'last_solve', 'team_id')
+
+
+def record_solve(team, points, solved_at=None):
+    """Apply a correct submission to the team's entry with atomic increments"""
+    solved_at = solved_at or timezone.now()
+    updated = ScoreboardEntry.objects.filter(team=team).update(
+        score=F('score') + points,
+        solve_count=F('solve_count') + 1,
+        last_solve=solved_at,
+    )
+    if not updated:
+        return refresh_team(team)
+    return ScoreboardEntry.objects.select_related('team').get(team=team)
+
+
+def refresh_team(team):
+    """Recompute a single team's entry from the source tables"""
+    team_id = team.id if isinstance(team, Team) else team
+    row = Team.objects.filter(id=team_id).values('team_score').first()
+    if row is None:
+        return None
+
+    solves = Submission.objects.filter(team_id=team_id, is_correct=True).aggregate(
+        solve_count=Count('id'),
+        last_solve=Max('timestamp'),
+    )
+    entry, _ = ScoreboardEntry.objects.update_or_create(
+        team_id=team_id,
+        defaults={
+            'score': row['team_score'],
+            'solve_count': solves['solve_count'],
+            'last_solve': solves['last_solve'],
+            'member_count': User.objects.filter(team_id=team_id).count(),
+        }
+    )
+    return entry
+
+
+def rebuild():
+    """Drop and regenerate every entry. Returns the number of rows written."""
+    teams = Team.objects.annotate(
+        member_total=Count('members', distinct=True),
+        solve_total=Count('submissions', filter=Q(submissions__is_correct=True), distinct=True),
+        last_solve_at=Max('submissions__timestamp', filter=Q(submissions__is_correct=True)),
+    ).values('id', 'team_score', 'member_total', 'solve_total', 'last_solve_at')
+
+    entries = [
+        ScoreboardEntry(
+            team_id=team['id'],
+            score=team['team_score'],
+            solve_count=team['solve_total'],
+            last_solve=team['last_solve_at'],
+            member_count=team['member_total'],
+        )
+        for team in teams
+    ]
+
+    with transaction.atomic():
+        ScoreboardEntry.objects.all().delete()
+        ScoreboardEntry.objects.bulk_create(entries, batch_size=500)
+    return len(entries)
+
+
+def delta(entry):
+    """Scoreboard row for a single entry, as pushed on the live feed"""
+    return {
+        'team_id': entry.team_id,
+        'team_name': entry.team.name,
+        'total_score': entry.score,
+        'member_count': entry.member_count,
+        'solved_challenges': entry.solve_count,
+        'last_solve': entry.last_solve,
+    }
+
+
+def get_rows():
+    """Return the ranked scoreboard as a list of dicts (one query)"""
+    entries = ScoreboardEntry.objects.order_by(*RANK_ORDERING).values(
+        'team_id', 'team__name', 'score', 'member_count', 'solve_count', 'last_solve'
+    )
+    return [{
+        'rank': rank,
+        'team_id': entry['team_id'],
+        'team_name': entry['team__name'],
+        'total_score': entry['score'],
+        'member_count': entry['member_count'],
+        'solved_challenges': entry['solve_count'],
+        'last_solve': entry['last_solve'],
+    } for rank, entry in enumerate(entries, 1)]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import User, Challenge, Team, Submission, Container
+from .models import User, Challenge, Team, Submission, SubmissionCounter, Container
 
 class UserSerializer(serializers.ModelSerializer):
     team_name = serializers.CharField(source='team.name',read_only=True)
@@ -39,10 +39,10 @@ class ChallengeSerializer(serializers.ModelSerializer):
         user_team = self.context.get('user_team')
         if not user_team:
             return False
-        return Submission.objects.filter(
+        return SubmissionCounter.objects.filter(
             team=user_team,
             challenge=obj,
-            is_correct=True
+            solved=True
         ).exists()
 
 class TeamSerializer(serializers.ModelSerializer):
@@ -0,0 +1,47 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from . import caching, leases, submissions
+from .models import Challenge, Container, HintPurchase, ScoreboardEntry, Submission, Team, WarmContainer
+
+# Cache namespaces affected by a change to each model
+caching.register(Challenge, lambda challenge: ['challenge_catalog'])
+caching.register(Team, lambda team: ['scoreboard'])
+caching.register(ScoreboardEntry, lambda entry: ['scoreboard'])
+# Only a solve moves the scoreboard; incorrect attempts are most submissions
+caching.register(Submission, lambda submission: [
+    f'team_progress:{submission.team_id}',
+    *(['scoreboard'] if submission.is_correct else []),
+])
+caching.register(HintPurchase, lambda purchase: [
+    f'team_hints:{purchase.team_id}:{purchase.challenge_id}',
+])
+
+
+def invalidate_cached(sender, instance, **kwargs):
+    caching.invalidate_instance(instance)
+
+
+for model in caching.registered_models():
+    post_save.connect(invalidate_cached, sender=model, dispatch_uid=f'invalidate_{model.__name__}_save')
+    post_delete.connect(invalidate_cached, sender=model, dispatch_uid=f'invalidate_{model.__name__}_delete')
+
+
+def release_port(sender, instance, **kwargs):
+    # claim() sets _keep_port when a warm container's id moves to a Container row
+    if instance.container_id and not getattr(instance, '_keep_port', False):
+        container_id = instance.container_id
+        transaction.on_commit(lambda: leases.release([container_id]))
+
+
+post_delete.connect(release_port, sender=Container, dispatch_uid='release_port_Container')
+post_delete.connect(release_port, sender=WarmContainer, dispatch_uid='release_port_WarmContainer')
+
+
+def recount_solves(sender, instance, **kwargs):
+    # Runs for each correct submission cascaded from a deleted team too
+    if instance.is_correct:
+        submissions.recount_challenge(instance.challenge_id)
+
+
+post_delete.connect(recount_solves, sender=Submission, dispatch_uid='recount_solves_Submission')
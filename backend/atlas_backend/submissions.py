@@ -0,0 +1,167 @@
+"""
+Flag submissions.
+
+Every (team, challenge) pair has a SubmissionCounter row. A submission
+reserves its attempt number with one conditional UPDATE of that row
+(attempts + 1, only while the challenge is unsolved and attempts are left).
+The UPDATE keeps the row locked until the transaction commits, so concurrent
+submissions from one team are numbered one after the other instead of
+colliding on the (team, challenge, attempt_number) constraint, and
+submissions from other teams never wait on it. Scores move with F()
+increments rather than read-modify-write.
+
+The same row holds the points the team's hints on the challenge cost, and
+Challenge rows hold their solve count and first blood (a team's solve count
+is on its ScoreboardEntry). All of them are updated with F() in the write's
+transaction, so reads never aggregate submissions or hint purchases. Deleting
+a correct submission, alone or with its team, recounts its challenge.
+
+Incorrect submissions can be written behind through journal.py.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import events, journal, scoreboard
+from .models import Challenge, HintPurchase, Submission, SubmissionCounter, Team
+
+logger = logging.getLogger('atlas_backend')
+
+
+class SubmissionRefused(Exception):
+    """No attempt was recorded: the challenge is solved or out of attempts"""
+
+    def __init__(self, solved):
+        self.solved = solved
+        super().__init__('Challenge already solved' if solved else 'No attempts left')
+
+
+def hints_deducted(team, challenge):
+    """Points team's hint purchases on challenge cost"""
+    return SubmissionCounter.objects.filter(team=team, challenge=challenge).values_list(
+        'hints_deducted', flat=True
+    ).first() or 0
+
+
+def record_hint(team, challenge, points_deducted):
+    """Add a hint purchase's cost to the team's total on challenge, returning the new total"""
+    counter, _ = SubmissionCounter.objects.get_or_create(team=team, challenge=challenge)
+    SubmissionCounter.objects.filter(pk=counter.pk).update(hints_deducted=F('hints_deducted') + points_deducted)
+    counter.refresh_from_db(fields=['hints_deducted'])
+    return counter.hints_deducted
+
+
+def submit(team, user, challenge, flag):
+    """
+    Record user's flag for challenge. Returns the Submission; on a correct
+    flag team.team_score is refreshed. Raises SubmissionRefused.
+    """
+    # Created outside the transaction so a first submission only races on this insert
+    counter, _ = SubmissionCounter.objects.get_or_create(team=team, challenge=challenge)
+    is_correct = challenge.flag == flag
+
+    with transaction.atomic():
+        reserved = SubmissionCounter.objects.filter(
+            pk=counter.pk, solved=False, attempts__lt=challenge.max_attempts
+        ).update(attempts=F('attempts') + 1, solved=is_correct)
+        counter.refresh_from_db()
+        if not reserved:
+            raise SubmissionRefused(counter.solved)
+
+        submission = Submission(
+            team=team,
+            challenge=challenge,
+            user=user,
+            flag_submitted=flag,
+            is_correct=is_correct,
+            points_awarded=max(0, challenge.max_points - counter.hints_deducted) if is_correct else 0,
+            attempt_number=counter.attempts,
+        )
+        write_behind = not is_correct and journal.enabled()
+        if not write_behind:
+            submission.save()
+        if is_correct:
+            _award(team, challenge, submission)
+
+    if write_behind:
+        # Appended once the attempt is committed, inserted by the journal's flusher
+        journal.append(submission)
+    return submission
+
+
+def _award(team, challenge, submission):
+    points_awarded = submission.points_awarded
+    logger.info(f"Flag submission: challenge={challenge.id}, " +
+                f"max_points={challenge.max_points}, awarded={points_awarded}")
+    team.challenges.add(challenge)
+    Team.objects.filter(id=team.id).update(
+        team_score=F('team_score') + points_awarded,
+        updated_at=timezone.now(),
+    )
+    team.team_score = Team.objects.values_list('team_score', flat=True).get(id=team.id)
+
+    entry = scoreboard.record_solve(team, points_awarded, submission.timestamp)
+    Challenge.objects.filter(id=challenge.id).update(solve_count=F('solve_count') + 1)
+    first_blood = Challenge.objects.filter(id=challenge.id, first_blood__isnull=True).update(
+        first_blood=team, first_blood_at=submission.timestamp
+    ) > 0
+    events.publish('solve', {
+        'team_id': team.id,
+        'team_name': team.name,
+        'challenge_id': challenge.id,
+        'challenge_title': challenge.title,
+        'points': points_awarded,
+        'first_blood': first_blood,
+        'timestamp': submission.timestamp,
+    })
+    events.publish('scoreboard', scoreboard.delta(entry))
+
+
+def recount_challenge(challenge_id):
+    """
+    Re-derive challenge's solve count and first blood from the correct
+    submissions left, after one was deleted (usually with its team).
+    """
+    with transaction.atomic():
+        # Locked so a solve landing meanwhile cannot be counted twice or lost
+        Challenge.objects.select_for_update().filter(id=challenge_id).first()
+        solves = Submission.objects.filter(challenge_id=challenge_id, is_correct=True)
+        first_team, first_at = solves.order_by('timestamp', 'id').values_list('team_id', 'timestamp').first() or (None, None)
+        Challenge.objects.filter(id=challenge_id).update(
+            solve_count=solves.count(), first_blood_id=first_team, first_blood_at=first_at
+        )
+
+
+def rebuild_aggregates():
+    """
+    Recompute hint totals, challenge solve counts and first bloods from the
+    source tables. Returns the number of challenges updated.
+    """
+    hint_totals = HintPurchase.objects.order_by().values('team_id', 'challenge_id').annotate(
+        total=Sum('points_deducted')
+    )
+    solves = Submission.objects.filter(is_correct=True).order_by('challenge_id', 'timestamp', 'id')
+
+    with transaction.atomic():
+        SubmissionCounter.objects.update(hints_deducted=0)
+        for row in hint_totals:
+            SubmissionCounter.objects.update_or_create(
+                team_id=row['team_id'], challenge_id=row['challenge_id'],
+                defaults={'hints_deducted': row['total']},
+            )
+
+        challenges = Challenge.objects.select_for_update().in_bulk()
+        for challenge in challenges.values():
+            challenge.solve_count, challenge.first_blood_id, challenge.first_blood_at = 0, None, None
+        for challenge_id, team_id, timestamp in solves.values_list('challenge_id', 'team_id', 'timestamp'):
+            challenge = challenges[challenge_id]
+            if not challenge.solve_count:
+                challenge.first_blood_id = team_id
+                challenge.first_blood_at = timestamp
+            challenge.solve_count += 1
+        Challenge.objects.bulk_update(
+            challenges.values(), ['solve_count', 'first_blood', 'first_blood_at'], batch_size=500
+        )
+    return len(challenges)
@@ -1,3 +1,463 @@
-from django.test import TestCase
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from threading import Barrier
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from async_docker import AsyncDockerPlugin
+
+from . import journal, provisioning, reaper, sampler, scheduler
+from .models import (
+    Challenge, Container, HintPurchase, ProvisionJob, ScoreboardEntry, Submission, SubmissionCounter, Team, User,
+)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+@override_settings(RATE_LIMITS={})
+class ConcurrentSubmissionTests(TransactionTestCase):
+    """
+    Flag submissions under contention. Needs a database with row locking
+    (PostgreSQL); SQLite serializes writers and is skipped.
+    """
+    SUBMITTERS = 200
+    TEAMS = 4
+    # Kept below PostgreSQL's default max_connections
+    WORKERS = 50
+
+    def setUp(self):
+        self.teams = [Team.objects.create(name=f'team{i}') for i in range(self.TEAMS)]
+        self.users = [
+            User.objects.create(
+                username=f'user{i}', email=f'user{i}@example.com', team=self.teams[i % self.TEAMS])
+            for i in range(self.SUBMITTERS)
+        ]
+
+    def _challenge(self, max_attempts):
+        return Challenge.objects.create(
+            title=f'challenge{max_attempts}', description='', category='web',
+            flag='flag{right}', max_points=100, max_attempts=max_attempts,
+        )
+
+    def _submit_all(self, challenge, flags):
+        url = reverse('submit_flag', args=[challenge.id])
+        barrier = Barrier(min(self.WORKERS, len(flags)))
+
+        def submit(args):
+            user, flag = args
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait(timeout=30)
+            except Exception:
+                pass
+            try:
+                response = client.post(url, {'flag_submitted': flag}, format='json')
+                return response.status_code
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as executor:
+            return list(executor.map(submit, zip(self.users, flags)))
+
+    def test_no_lost_attempts_or_points(self):
+        challenge = self._challenge(max_attempts=self.SUBMITTERS)
+        # A few submitters in every team have the right flag
+        flags = ['flag{right}' if i % 25 < self.TEAMS else f'flag{{wrong{i}}}' for i in range(self.SUBMITTERS)]
+        codes = self._submit_all(challenge, flags)
+
+        self.assertNotIn(500, codes)
+        self.assertEqual(set(codes) - {200, 400}, set())
+        for team in Team.objects.filter(id__in=[team.id for team in self.teams]):
+            attempts = list(Submission.objects.filter(team=team, challenge=challenge)
+                            .order_by('attempt_number').values_list('attempt_number', flat=True))
+            self.assertEqual(attempts, list(range(1, len(attempts) + 1)))
+            counter = SubmissionCounter.objects.get(team=team, challenge=challenge)
+            self.assertEqual(counter.attempts, len(attempts))
+            self.assertTrue(counter.solved)
+            self.assertEqual(Submission.objects.filter(team=team, challenge=challenge, is_correct=True).count(), 1)
+            self.assertEqual(team.team_score, 100)
+            self.assertEqual(team.scoreboard_entry.score, 100)
+            self.assertEqual(team.scoreboard_entry.solve_count, 1)
+        # Rejections are exactly the submissions made after the team's solve
+        self.assertEqual(codes.count(200), Submission.objects.filter(challenge=challenge).count())
+
+    def test_attempt_limit_holds(self):
+        challenge = self._challenge(max_attempts=5)
+        codes = self._submit_all(challenge, [f'flag{{wrong{i}}}' for i in range(self.SUBMITTERS)])
+
+        self.assertNotIn(500, codes)
+        self.assertEqual(codes.count(200), 5 * self.TEAMS)
+        self.assertEqual(codes.count(429), self.SUBMITTERS - 5 * self.TEAMS)
+        for team in self.teams:
+            self.assertEqual(Submission.objects.filter(team=team, challenge=challenge).count(), 5)
+
+
+class JournalTests(TransactionTestCase):
+    """Journaled submissions are inserted whatever was deleted since they were appended"""
+
+    def setUp(self):
+        self.teams = [Team.objects.create(name=f'team{i}') for i in range(2)]
+        self.users = [
+            User.objects.create(username=f'user{i}', email=f'user{i}@example.com', team=team)
+            for i, team in enumerate(self.teams)
+        ]
+        self.challenge = Challenge.objects.create(
+            title='challenge', description='', category='web', flag='flag{right}', max_points=100,
+        )
+
+    def _submission(self, team, user, attempt):
+        return Submission(
+            team_id=team.id, challenge_id=self.challenge.id, user_id=user.id, flag_submitted='flag{wrong}',
+            is_correct=False, points_awarded=0, attempt_number=attempt, timestamp=timezone.now(),
+        )
+
+    def test_rows_of_deleted_team_are_dropped(self):
+        submissions = [self._submission(team, user, 1) for team, user in zip(self.teams, self.users)]
+        self.teams[0].delete()
+        journal.insert(submissions)
+        self.assertEqual(list(Submission.objects.values_list('team_id', flat=True)), [self.teams[1].id])
+
+    def test_replayed_rows_are_skipped(self):
+        journal.insert([self._submission(self.teams[0], self.users[0], 1)])
+        journal.insert([self._submission(self.teams[0], self.users[0], 1), self._submission(self.teams[0], self.users[0], 2)])
+        self.assertEqual(Submission.objects.count(), 2)
+
+
+@override_settings(RATE_LIMITS={})
+class SolveAggregateTests(TestCase):
+    """Challenge solve counts and first bloods follow deleted teams"""
+
+    def setUp(self):
+        self.challenge = Challenge.objects.create(
+            title='challenge', description='', category='web', flag='flag{right}', max_points=100,
+        )
+        self.teams = [Team.objects.create(name=f'team{i}') for i in range(3)]
+        self.users = [
+            User.objects.create(username=f'user{i}', email=f'user{i}@example.com', team=team)
+            for i, team in enumerate(self.teams)
+        ]
+
+    def _solve(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(reverse('submit_flag', args=[self.challenge.id]), {'flag_submitted': 'flag{right}'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_solve_survives_failed_event(self):
+        with mock.patch('atlas_backend.models.LiveEvent.objects.create', side_effect=Exception('database is down')), \
+                self.captureOnCommitCallbacks(execute=True):
+            self._solve(self.users[0])
+        self.assertEqual(Submission.objects.filter(is_correct=True).count(), 1)
+
+    def test_deleting_first_blood_team(self):
+        self._solve(self.users[0])
+        self._solve(self.users[1])
+        self.teams[0].delete()
+        self.challenge.refresh_from_db()
+        self.assertEqual(self.challenge.solve_count, 1)
+        self.assertEqual(self.challenge.first_blood_id, self.teams[1].id)
+
+        self.teams[1].delete()
+        self.challenge.refresh_from_db()
+        self.assertEqual((self.challenge.solve_count, self.challenge.first_blood_id), (0, None))
+        self._solve(self.users[2])
+        self.challenge.refresh_from_db()
+        self.assertEqual((self.challenge.solve_count, self.challenge.first_blood_id), (1, self.teams[2].id))
+
+
+@override_settings(RATE_LIMITS={})
+class HintPurchaseTests(TestCase):
+    def setUp(self):
+        team = Team.objects.create(name='team')
+        self.challenge = Challenge.objects.create(
+            title='challenge', description='', category='web', flag='flag{right}', max_points=100,
+            hints=[{'content': 'look closer', 'cost': 10}],
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='user', email='user@example.com', team=team))
+
+    def test_purchase_behind_stale_cache(self):
+        url = reverse('purchase-hint', args=[self.challenge.id])
+        with mock.patch('atlas_backend.catalog.get_hint_purchases', return_value=[]):
+            first = self.client.post(url, {'hintIndex': 0}, format='json')
+            second = self.client.post(url, {'hintIndex': 0}, format='json')
+        self.assertEqual((first.status_code, first.data['alreadyPurchased']), (200, False))
+        self.assertEqual((second.status_code, second.data['alreadyPurchased']), (200, True))
+        self.assertEqual(second.data['remainingPoints'], 90)
+        self.assertEqual(HintPurchase.objects.count(), 1)
+
+
+class ProvisionJobTests(TestCase):
+    def setUp(self):
+        self.team = Team.objects.create(name='team')
+        self.challenge = Challenge.objects.create(
+            title='challenge', description='', category='web', flag='flag{right}', max_points=100,
+        )
+
+    def test_one_active_job_per_team(self):
+        started = []
+        job = provisioning.submit(self.team, self.challenge, runner=started.append)
+        self.assertEqual(provisioning.submit(self.team, self.challenge, runner=started.append), job)
+
+        ProvisionJob.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(days=1))
+        replacement = provisioning.submit(self.team, self.challenge, runner=started.append)
+        self.assertNotEqual(replacement, job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_concurrent_first_start(self):
+        # What a second request that raced past the select_for_update would do
+        job = provisioning.submit(self.team, self.challenge, runner=lambda job_id: None)
+        with mock.patch.object(ProvisionJob.objects, 'select_for_update', return_value=ProvisionJob.objects.none()):
+            self.assertEqual(provisioning.submit(self.team, self.challenge, runner=lambda job_id: None), job)
+        self.assertEqual(ProvisionJob.objects.count(), 1)
+
+
+@override_settings(DOCKER_HOSTS=[
+    {'name': 'down', 'url': 'unix:///nonexistent.sock'},
+    {'name': 'up', 'url': 'unix:///nonexistent-too.sock', 'cpus': 4, 'memory': '8g'},
+])
+class SchedulerTests(TestCase):
+    def setUp(self):
+        scheduler._hosts = None
+        self.addCleanup(setattr, scheduler, '_hosts', None)
+
+    def test_unreachable_host_is_skipped(self):
+        down, up = scheduler.get_hosts()
+        self.assertIsNone(down.capacity())
+        self.assertIsNone(down.cpus)
+        self.assertEqual(scheduler.place(), up)
+        report = {host['name']: host for host in scheduler.host_report()}
+        self.assertFalse(report['down']['reachable'])
+        self.assertTrue(report['up']['reachable'])
+
+
+class FakeDockerClient:
+    def __init__(self, running=(), on_list=None):
+        self.running = list(running)
+        self.on_list = on_list
+
+    def list_managed_containers(self):
+        if self.on_list:
+            self.on_list()
+        return [{'Id': container_id, 'Created': 0} for container_id in self.running]
+
+    def stop_container(self, container_id, timeout=None):
+        return True
+
+    def container_stats(self, container_id):
+        return {'memory_stats': {'usage': 1024, 'limit': 4096}}
+
+    def oom_events(self, since, until):
+        return []
+
+
+@override_settings(DOCKER_HOSTS=[
+    {'name': 'down', 'url': 'unix:///nonexistent.sock'},
+    {'name': 'up', 'url': 'unix:///nonexistent-too.sock'},
+])
+class ReaperTests(TestCase):
+    def setUp(self):
+        scheduler._hosts = None
+        self.addCleanup(setattr, scheduler, '_hosts', None)
+        self.team = Team.objects.create(name='team')
+        self.challenge = Challenge.objects.create(
+            title='challenge', description='', category='web', flag='flag{right}', max_points=100,
+        )
+
+    def _container(self, container_id):
+        return Container.objects.create(
+            team=self.team, challenge=self.challenge, container_id=container_id, docker_host='up',
+            ssh_host='localhost', ssh_port=22, ssh_user='ctf', ssh_password='',
+        )
+
+    def _reap(self, client):
+        @contextmanager
+        def connection():
+            yield client
+
+        with mock.patch.object(scheduler.get_host('up'), 'connection', connection):
+            return reaper.reap()
+
+    def test_unreachable_host_is_skipped(self):
+        self._container('gone')
+        stats = self._reap(FakeDockerClient())
+        self.assertEqual((stats['skipped_hosts'], stats['dead']), (1, 1))
+        self.assertFalse(Container.objects.exists())
+
+    def test_row_committed_during_listing_is_kept(self):
+        # Started and handed to the team just after the host was listed
+        stats = self._reap(FakeDockerClient(on_list=lambda: self._container('fresh')))
+        self.assertEqual(stats['dead'], 0)
+        self.assertTrue(Container.objects.filter(container_id='fresh').exists())
+
+
+@override_settings(DOCKER_HOSTS=[
+    {'name': 'down', 'url': 'unix:///nonexistent.sock'},
+    {'name': 'up', 'url': 'unix:///nonexistent-too.sock'},
+])
+class SamplerTests(TestCase):
+    def setUp(self):
+        scheduler._hosts = None
+        self.addCleanup(setattr, scheduler, '_hosts', None)
+
+    def test_unreachable_host_is_skipped(self):
+        self.assertIsNone(sampler.sample())
+
+        team = Team.objects.create(name='team')
+        challenge = Challenge.objects.create(
+            title='challenge', description='', category='web', flag='flag{right}', max_points=100,
+        )
+        Container.objects.create(
+            team=team, challenge=challenge, container_id='running', docker_host='up',
+            ssh_host='localhost', ssh_port=22, ssh_user='ctf', ssh_password='',
+        )
+
+        @contextmanager
+        def connection():
+            yield FakeDockerClient(running=['running'])
+
+        with mock.patch.object(scheduler.get_host('up'), 'connection', connection):
+            self.assertEqual(sampler.sample(), {'sampled': 1, 'oom_kills': 0})
+
+
+class AsyncDockerTests(SimpleTestCase):
+    def _daemon(self, pull_body=b'{"status": "Downloaded newer image for challenge:latest"}'):
+        """AsyncDockerPlugin whose daemon lacks every image until it is pulled"""
+        plugin = AsyncDockerPlugin('unix:///nonexistent.sock')
+        requests = []
+        pulled = set()
+
+        async def request(method, path, params=None, body=None, timeout=None):
+            requests.append((method, path))
+            if path == '/images/create':
+                if b'error' not in pull_body:
+                    pulled.add(params['fromImage'])
+                return 200, pull_body
+            if path == '/containers/create':
+                if body['Image'].split(':')[0] not in pulled:
+                    return 404, b'{"message": "No such image: challenge:latest"}'
+                return 201, json.dumps({'Id': 'c1'}).encode()
+            return 204, b''
+
+        plugin._request = request
+        return plugin, requests
+
+    def test_missing_image_is_pulled(self):
+        plugin, requests = self._daemon()
+        result = asyncio.run(plugin.run_container('challenge:latest', 22))
+        self.assertEqual(result[0], 'c1')
+        self.assertEqual(requests, [
+            ('POST', '/containers/create'), ('POST', '/images/create'),
+            ('POST', '/containers/create'), ('POST', '/containers/c1/start'),
+        ])
+
+    def test_failed_pull(self):
+        plugin, requests = self._daemon(pull_body=b'{"error": "manifest unknown"}')
+        self.assertIsNone(asyncio.run(plugin.run_container('challenge:latest', 22)))
+        self.assertEqual(requests, [('POST', '/containers/create'), ('POST', '/images/create')])
+
+
+@skipUnless(connection.vendor in ('postgresql', 'sqlite'), 'EXPLAIN output is only parsed for PostgreSQL and SQLite')
+class QueryPlanTests(TestCase):
+    """The hot queries are answered from indexes on a seeded dataset"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teams = Team.objects.bulk_create([Team(name=f'team{i}', team_score=i * 10) for i in range(40)])
+        ScoreboardEntry.objects.bulk_create([ScoreboardEntry(team=team, score=team.team_score) for team in cls.teams])
+        user = User.objects.create(username='player', email='player@example.com', team=cls.teams[0])
+        cls.challenges = Challenge.objects.bulk_create([
+            Challenge(title=f'challenge{i}', description='', category='web', flag='flag{right}', max_points=100)
+            for i in range(30)
+        ])
+        now = timezone.now()
+        Submission.objects.bulk_create([
+            Submission(
+                team=team, challenge=challenge, user=user, flag_submitted='flag{wrong}',
+                is_correct=attempt == 3 and challenge.id % 3 == 0, points_awarded=0,
+                attempt_number=attempt, timestamp=now - timedelta(minutes=attempt),
+            )
+            for team in cls.teams for challenge in cls.challenges for attempt in range(1, 4)
+        ], batch_size=1000)
+        Container.objects.bulk_create([
+            Container(team=team, challenge=challenge, container_id=f'{team.id}-{challenge.id}',
+                      ssh_host='localhost', ssh_port=22, ssh_user='ctf', ssh_password='')
+            for team in cls.teams for challenge in cls.challenges[:10]
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # The seeded tables are small enough that a sequential scan could still win
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), f'{index_names} not used:\n{plan}')
+
+    def indexes_on(self, model, *columns):
+        """Names of the indexes on model whose leading columns are columns, whatever Django named them"""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        return [
+            name for name, constraint in constraints.items()
+            if constraint['index'] or constraint['unique']
+            if tuple(constraint['columns'][:len(columns)]) == columns
+        ]
+
+    def test_scoreboard(self):
+        self.assertUsesIndex(ScoreboardEntry.objects.order_by('-score', 'last_solve')[:50], 'scoreboard_rank_idx')
+        self.assertUsesIndex(Team.objects.order_by('-team_score', 'created_at')[:50], 'team_rank_idx')
+        self.assertUsesIndex(Team.objects.filter(team_score__gt=200), 'team_rank_idx')
+
+    def test_challenge_list(self):
+        team, challenge = self.teams[0], self.challenges[0]
+        self.assertUsesIndex(
+            Submission.objects.filter(team=team).order_by().values('challenge_id').annotate(tries=Count('id')),
+            *self.indexes_on(Submission, 'team_id'),
+        )
+        self.assertUsesIndex(
+            Submission.objects.filter(team=team, challenge=challenge, is_correct=True),
+            *self.indexes_on(Submission, 'team_id'),
+        )
+        self.assertUsesIndex(
+            Submission.objects.filter(team=team, is_correct=True).order_by('-timestamp')[:5],
+            'submission_team_solves_idx',
+        )
+        self.assertUsesIndex(
+            Submission.objects.filter(challenge=challenge, is_correct=True).order_by('timestamp')[:1],
+            'submission_chal_solves_idx',
+        )
+
+    def test_submit(self):
+        team, challenge = self.teams[0], self.challenges[0]
+        self.assertUsesIndex(
+            SubmissionCounter.objects.filter(team=team, challenge=challenge),
+            # SQLite builds unnamed indexes for constraints declared with the table
+            'unique_submission_counter', 'sqlite_autoindex_atlas_backend_submissioncounter',
+        )
+        self.assertUsesIndex(
+            HintPurchase.objects.filter(team=team, challenge=challenge),
+            *self.indexes_on(HintPurchase, 'team_id', 'challenge_id'),
+        )
+        self.assertUsesIndex(Submission.objects.filter(challenge=challenge), 'submission_challenge_idx')
+
+    def test_container_lookup(self):
+        team, challenge = self.teams[0], self.challenges[0]
+        self.assertUsesIndex(
+            Container.objects.filter(team=team, challenge=challenge, created_at__gte=timezone.now() - timedelta(minutes=10)),
+            'container_team_chal_idx',
+        )
+        self.assertUsesIndex(Container.objects.order_by('-created_at', 'container_id')[:50], 'container_recent_idx')
@@ -0,0 +1,350 @@
+"""
+Upload handling for challenge Docker images.
+
+Images can be several gigabytes, so they are never read into memory: Django
+spools the upload to a temporary file and scheduler.load_image() streams it
+to the Docker hosts in chunks. ImageSizeLimitHandler stops the multipart
+parser as soon as an image goes over DOCKER_IMAGE_MAX_SIZE instead of
+spooling the rest of it to disk first.
+
+Clients that pass ?upload_id=<uuid> can poll the upload's progress (bytes
+received, then bytes loaded on each host) from the shared cache.
+
+Large images can also be sent as resumable uploads, see start(), append()
+and commit() below.
+"""
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.db import transaction
+from django.utils import timezone
+
+from . import orchestrator, provisioning, scheduler
+from .models import Challenge, ImageUpload
+
+logger = logging.getLogger('atlas_backend')
+
+IMAGE_FIELD = 'docker_image'
+PROGRESS_TIMEOUT = 60 * 60
+
+
+def _progress_key(upload_id):
+    return f'image_upload:{upload_id}'
+
+
+def get_progress(upload_id):
+    return cache.get(_progress_key(upload_id))
+
+
+class ProgressReporter:
+    """Records an upload's progress in the cache, at most once per percent"""
+
+    def __init__(self, upload_id):
+        try:
+            self.upload_id = uuid.UUID(str(upload_id)) if upload_id else None
+        except ValueError:
+            self.upload_id = None
+        self._last = None
+
+    def update(self, stage, done, total=None, host=None):
+        if self.upload_id is None:
+            return
+        percent = done * 100 // total if total else None
+        if (stage, host, percent) == self._last and done != total:
+            return
+        self._last = (stage, host, percent)
+        self._write({'stage': stage, 'host': host, 'done': done, 'total': total, 'percent': percent})
+
+    def receiving(self, received, total):
+        self.update('receiving', received, total)
+
+    def loading(self, host, sent, size):
+        self.update('loading', sent, size, host=host)
+
+    def finish(self, stage, **details):
+        if self.upload_id is not None:
+            self._write({'stage': stage, **details})
+
+    def _write(self, state):
+        try:
+            cache.set(_progress_key(self.upload_id), state, PROGRESS_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Upload progress not recorded: {str(e)}")
+
+
+class ImageSizeLimitHandler(FileUploadHandler):
+    """Placed first in request.upload_handlers; sets exceeded when the image is too large"""
+
+    def __init__(self, request=None, reporter=None):
+        super().__init__(request)
+        self.reporter = reporter
+        self.exceeded = False
+        self._tracking = False
+        self._received = 0
+        self._total = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self._total = content_length
+
+    def new_file(self, field_name, *args, **kwargs):
+        self._tracking = field_name == IMAGE_FIELD
+        self._received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if self._tracking:
+            self._received += len(raw_data)
+            if self._received > settings.DOCKER_IMAGE_MAX_SIZE:
+                self.exceeded = True
+                # The rest of the body is read and discarded so a 413 can still be sent
+                raise StopUpload(connection_reset=False)
+            if self.reporter is not None:
+                self.reporter.receiving(self._received, self._total)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def limit_image_size(request, reporter=None):
+    """Install the size limit on a request before its body is parsed"""
+    handler = ImageSizeLimitHandler(request, reporter)
+    request.upload_handlers.insert(0, handler)
+    return handler
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# Resumable uploads.
+#
+# An ImageUpload row tracks a session; its bytes are appended to a file in
+# IMAGE_UPLOAD_DIR by offset-checked PUTs, so an interrupted upload resumes
+# from the last offset the server acknowledged. The SHA-256 of the archive is
+# computed as chunks arrive. A worker that did not see the earlier chunks
+# rebuilds it from the spooled file. On commit, an archive whose digest was
+# loaded before is not loaded again on hosts that already have the image.
+
+HASHER_CACHE_SIZE = 32
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+def upload_path(upload):
+    return os.path.join(settings.IMAGE_UPLOAD_DIR, f'{upload.id}.tar')
+
+
+def _remove_file(upload):
+    try:
+        os.remove(upload_path(upload))
+    except FileNotFoundError:
+        pass
+
+
+def _take_hasher(upload):
+    """SHA-256 of the first upload.offset bytes, from this process's cache or the file"""
+    with _hashers_lock:
+        offset, hasher = _hashers.pop(upload.id, (None, None))
+    if offset == upload.offset:
+        return hasher
+
+    hasher = hashlib.sha256()
+    remaining = upload.offset
+    with open(upload_path(upload), 'rb') as spooled:
+        while remaining:
+            chunk = spooled.read(min(settings.DOCKER_IMAGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise UploadError('Spooled upload is shorter than its offset', status=500)
+            hasher.update(chunk)
+            remaining -= len(chunk)
+    return hasher
+
+
+def _keep_hasher(upload, hasher):
+    with _hashers_lock:
+        _hashers[upload.id] = (upload.offset, hasher)
+        while len(_hashers) > HASHER_CACHE_SIZE:
+            _hashers.popitem(last=False)
+
+
+def _known_image(sha256):
+    """Image id an archive with this digest was loaded as before"""
+    return ImageUpload.objects.filter(
+        sha256=sha256, status='committed'
+    ).exclude(image_id='').order_by('-updated_at').values_list('image_id', flat=True).first()
+
+
+def _link(upload):
+    if upload.challenge_id is None:
+        return
+    challenge = Challenge.objects.filter(id=upload.challenge_id).first()
+    if challenge is not None:
+        challenge.docker_image = upload.image_id
+        challenge.save(update_fields=['docker_image', 'updated_at'])
+        orchestrator.schedule_refill(challenge.id)
+
+
+def purge_expired():
+    """Drop unfinished uploads that have not been touched for IMAGE_UPLOAD_EXPIRY"""
+    expired = ImageUpload.objects.filter(
+        status__in=('uploading', 'failed'),
+        updated_at__lt=timezone.now() - settings.IMAGE_UPLOAD_EXPIRY,
+    )
+    for upload in expired:
+        _remove_file(upload)
+    expired.delete()
+
+
+def start(filename, size, challenge=None, sha256=''):
+    """
+    Open an upload session. When the client sends the archive's digest and an
+    identical archive is already loaded on every host, the session is
+    committed straight away and nothing needs to be uploaded.
+    """
+    if size <= 0:
+        raise UploadError('size must be positive')
+    if size > settings.DOCKER_IMAGE_MAX_SIZE:
+        raise UploadError(
+            f'Docker image exceeds the {settings.DOCKER_IMAGE_MAX_SIZE} byte limit', status=413
+        )
+    purge_expired()
+
+    sha256 = sha256.lower()
+    image_id = _known_image(sha256) if sha256 else None
+    if image_id and not scheduler.hosts_missing_image(image_id):
+        upload = ImageUpload.objects.create(
+            challenge=challenge, filename=filename, size=size, offset=size,
+            expected_sha256=sha256, sha256=sha256, image_id=image_id, status='committed',
+        )
+        _link(upload)
+        return upload
+
+    os.makedirs(settings.IMAGE_UPLOAD_DIR, exist_ok=True)
+    upload = ImageUpload.objects.create(
+        challenge=challenge, filename=filename, size=size, expected_sha256=sha256,
+    )
+    open(upload_path(upload), 'wb').close()
+    return upload
+
+
+def append(upload_id, offset, stream, length):
+    """
+    Write length bytes read from stream at offset. The offset must be the
+    one the server last acknowledged, so retried or out-of-order chunks are
+    rejected with a 409 carrying the offset to resume from.
+    """
+    if length <= 0 or length > settings.IMAGE_UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError(f'Chunks must be 1 to {settings.IMAGE_UPLOAD_MAX_CHUNK_SIZE} bytes')
+
+    with transaction.atomic():
+        upload = ImageUpload.objects.select_for_update().filter(id=upload_id).first()
+        if upload is None:
+            raise UploadError('Upload not found', status=404)
+        if upload.status != 'uploading':
+            raise UploadError(f'Upload is {upload.status}', status=409)
+        if offset != upload.offset:
+            raise UploadError(f'Expected offset {upload.offset}', status=409)
+        if offset + length > upload.size:
+            raise UploadError('Chunk runs past the declared size')
+
+        hasher = _take_hasher(upload)
+        received = 0
+        with open(upload_path(upload), 'r+b') as spooled:
+            spooled.seek(offset)
+            while received < length:
+                chunk = stream.read(min(settings.DOCKER_IMAGE_CHUNK_SIZE, length - received))
+                if not chunk:
+                    break
+                spooled.write(chunk)
+                hasher.update(chunk)
+                received += len(chunk)
+            # Drop anything an earlier, interrupted write left past this chunk
+            spooled.truncate()
+        if received != length:
+            raise UploadError(f'Chunk ended after {received} of {length} bytes; resume from {offset}')
+
+        upload.offset += received
+        upload.save(update_fields=['offset', 'updated_at'])
+    _keep_hasher(upload, hasher)
+    return upload
+
+
+def commit(upload_id):
+    """Check the finished upload's digest and load it in the background"""
+    with transaction.atomic():
+        upload = ImageUpload.objects.select_for_update().filter(id=upload_id).first()
+        if upload is None:
+            raise UploadError('Upload not found', status=404)
+        if upload.status in ('loading', 'committed'):
+            return upload
+        if upload.offset != upload.size:
+            raise UploadError(f'Upload is incomplete: {upload.offset} of {upload.size} bytes', status=409)
+
+        if not upload.sha256:
+            upload.sha256 = _take_hasher(upload).hexdigest()
+        if upload.expected_sha256 and upload.expected_sha256 != upload.sha256:
+            upload.status = 'failed'
+            upload.error = f'Digest mismatch: received {upload.sha256}'
+        else:
+            upload.status = 'loading'
+            upload.error = ''
+            transaction.on_commit(lambda: provisioning.run_in_background(_load, upload.id))
+        upload.save(update_fields=['sha256', 'status', 'error', 'updated_at'])
+
+    if upload.status == 'failed':
+        _remove_file(upload)
+        raise UploadError(upload.error)
+    return upload
+
+
+def _load(upload_id):
+    upload = ImageUpload.objects.get(id=upload_id)
+    reporter = ProgressReporter(upload.id)
+    try:
+        image_id = _known_image(upload.sha256)
+        hosts = scheduler.hosts_missing_image(image_id) if image_id else scheduler.get_hosts()
+        if hosts:
+            with open(upload_path(upload), 'rb') as spooled:
+                loaded = scheduler.load_image(File(spooled, name=upload.filename), reporter.loading, hosts)
+            if loaded is None:
+                raise Exception('No Docker host loaded the image')
+            image_id = loaded
+    except Exception as e:
+        logger.error(f"Loading upload {upload.id} failed: {str(e)}")
+        upload.status = 'failed'
+        upload.error = str(e)
+        upload.save(update_fields=['status', 'error', 'updated_at'])
+        reporter.finish('failed', error=str(e))
+        return
+
+    upload.image_id = image_id
+    upload.status = 'committed'
+    upload.save(update_fields=['image_id', 'status', 'updated_at'])
+    _remove_file(upload)
+    _link(upload)
+    reporter.finish('done', image_id=image_id)
+
+
+def upload_payload(upload):
+    return {
+        'upload_id': str(upload.id),
+        'challenge_id': upload.challenge_id,
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.offset,
+        'status': upload.status,
+        'sha256': upload.sha256 or None,
+        'image_id': upload.image_id or None,
+        'error': upload.error or None,
+        'chunk_size': settings.IMAGE_UPLOAD_MAX_CHUNK_SIZE,
+    }
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from rest_framework_simplejwt.views import TokenRefreshView
@@ -14,8 +15,9 @@ urlpatterns = [
     path('challenges', views.get_challenges, name='get_challenges'),
     path('challenges/<int:challenge_id>', views.get_challenge_by_id, name='get_challenge_by_id'),
     path('challenges/<int:challenge_id>/submit', views.submit_flag, name='submit_flag'),
-    path('challenges/<int:challenge_id>/start', views.start_challenge, name='start_challenge'),
-    path('challenges/<int:challenge_id>/stop', views.stop_challenge, name='stop_challenge'),
+    path('challenges/<int:challenge_id>/start', views.start_challenge_async if settings.DOCKER_ASYNC_VIEWS else views.start_challenge, name='start_challenge'),
+    path('challenges/<int:challenge_id>/stop', views.stop_challenge_async if settings.DOCKER_ASYNC_VIEWS else views.stop_challenge, name='stop_challenge'),
+    path('challenges/jobs/<uuid:job_id>', views.get_provision_job, name='get_provision_job'),
     path('challenges/<int:challenge_id>/purchase-hint', views.purchase_hint, name='purchase-hint'),
 
     # Team routes
@@ -31,6 +33,7 @@ urlpatterns = [
 
     # Scoreboard route
     path('scoreboard', views.get_scoreboard, name='get_scoreboard'),
+    path('events/stream', views.live_events, name='live_events'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
 
@@ -42,12 +45,20 @@ urlpatterns = [
     path('api/admin/challenges/<int:challenge_id>/delete', views.delete_challenge, name='delete_challenge'),
     path('api/admin/challenges/<int:challenge_id>', views.get_challenge_detail, name='get_challenge_detail'),
     path('api/admin/challenges/<int:challenge_id>/submissions', views.get_challenge_submissions, name='get_challenge_submissions'),
+    path('api/admin/uploads/<uuid:upload_id>', views.get_image_upload_progress, name='get_image_upload_progress'),
+    path('api/admin/image-uploads', views.create_image_upload, name='create_image_upload'),
+    path('api/admin/image-uploads/<uuid:upload_id>', views.image_upload_detail, name='image_upload_detail'),
+    path('api/admin/image-uploads/<uuid:upload_id>/commit', views.commit_image_upload, name='commit_image_upload'),
     path('api/admin/submissions', views.get_all_submissions, name='get_all_submissions'),
     path('api/admin/dashboard/stats', views.get_dashboard_stats, name='dashboard-stats'),
     path('api/admin/teams/<int:team_id>/delete', views.delete_team, name='delete-team'),
     path('api/admin/teams/<int:team_id>/update', views.update_team, name='update-team'),
     path('api/admin/containers', views.get_containers, name='get_containers'),
     path('api/admin/containers/<str:container_id>/stop', views.admin_stop_container, name='admin_stop_container'),
+    path('api/admin/containers/<str:container_id>/restart', views.admin_restart_container, name='admin_restart_container'),
+    path('api/admin/containers/<str:container_id>/logs', views.admin_container_logs, name='admin_container_logs'),
+    path('api/admin/docker-hosts', views.get_docker_hosts, name='get_docker_hosts'),
+    path('api/admin/warm-pools', views.get_warm_pools, name='get_warm_pools'),
     path('api/admin/teams/<int:team_id>', views.get_team_profile_admin, name='get_team_profile_admin'),
     path('api/admin/teams/<int:team_id>/submissions', views.get_team_submissions_admin, name='get_team_submissions_admin'),
 ]
\ No newline at end of file
@@ -1,8 +1,10 @@
 from django.shortcuts import get_object_or_404
 from django.conf import settings
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count, F, Q
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 from datetime import datetime, timedelta
+from django.utils import timezone
 import jwt
 import json
 import time
@@ -13,13 +15,17 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
-from django.core.cache import cache
-from django.db import transaction
-from django.http import QueryDict
-from .models import User, Challenge, Submission, Team, Container, HintPurchase, validate_team_name
+from django.db import IntegrityError, transaction
+from django.http import QueryDict, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from functools import partial
+import asyncio
+from .models import User, Challenge, Submission, Team, Container, HintPurchase, ImageUpload, ScoreboardEntry, validate_team_name
 from .serializers import SignupSerializer, ChallengeSerializer, TeamSerializer, SubmissionSerializer, UserSerializer
+from . import caching, catalog, events, logstream, orchestrator, provisioning, ratelimit, sampler, scheduler, scoreboard, submissions, uploads
 import re
-from docker_plugin import DockerPlugin
+from .provisioning import docker_connection
 import logging
 
 logger = logging.getLogger('atlas_backend')
@@ -27,6 +33,7 @@ logger = logging.getLogger('atlas_backend')
 # User Registration (Individual, without team)
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@ratelimit.limit('register', 'ip')
 def register(request):
     """User registration endpoint"""
     try:
@@ -131,6 +138,7 @@ def create_team_api(request):
         user = request.user
         user.team = team
         user.save()
+        scoreboard.refresh_team(team)
         
         # Generate new token with team information
         refresh = RefreshToken.for_user(user)
@@ -197,6 +205,7 @@ def join_team_api(request):
         # Add user to team
         user.team = team
         user.save()
+        scoreboard.refresh_team(team)
         
         # Generate new token with team information
         refresh = RefreshToken.for_user(user)
@@ -247,9 +256,12 @@ def leave_team_api(request):
         )
     
     try:
+        team_id = user.team.id
         success, message = user.leave_team()
         
         if success:
+            scoreboard.refresh_team(team_id)
+
             # Create a new token without team information
             refresh = RefreshToken.for_user(user)
             refresh['user_id'] = user.id
@@ -358,46 +370,22 @@ def update_team_api(request):
 @permission_classes([IsAuthenticated])
 def get_challenges(request):
     """Get all challenges available to the user"""
-    logger.info("=== GET /challenges ===")
-    
     # Check if user has a team
     if not request.user.team:
         return Response(
             {'error': 'You must be in a team to access challenges'},
             status=status.HTTP_403_FORBIDDEN
         )
-    
-    # Fetch only non-hidden challenges
-    challenges = Challenge.objects.filter(is_hidden=False).values(
-        'id',
-        'title',
-        'description',
-        'category',
-        'max_points',
-        'file_links',
-        'docker_image',
-        'max_attempts'
-    )
-    
-    # Convert QuerySet to list for JSON serialization
-    challenges_list = list(challenges)
 
-    submissions = list(Submission.objects.filter(team=request.user.team).values('challenge_id', 'is_correct', 'id'))
+    # Both come from the shared cache and are invalidated by model signals
+    progress = catalog.get_team_progress(request.user.team)
 
-    for sub in submissions:
-        for chal in challenges_list:
-            if sub['challenge_id'] == chal['id']:
-                chal['is_correct'] = sub['is_correct'] or chal.get('is_correct',False)
-                chal['tries'] = chal.get('tries',0) + 1
-                break
-            
-    # Add hint count information without revealing content
-    for chal in challenges_list:
-        challenge = Challenge.objects.get(id=chal['id'])
-        hints = challenge.hints if isinstance(challenge.hints, list) else json.loads(challenge.hints)
-        chal['hint_count'] = len(hints)
+    challenges_list = []
+    for chal in catalog.get_public_catalog():
+        tries, is_correct = progress.get(chal['id'], (0, False))
+        challenges_list.append({**chal, 'tries': tries, 'is_correct': is_correct})
 
-    logger.info(f"Challenges: {challenges_list}")
+    logger.debug(f"Challenges listed for team {request.user.team.id}: {len(challenges_list)}")
 
     return Response(challenges_list)
 
@@ -419,12 +407,8 @@ def get_challenge_by_id(request, challenge_id):
         total_points_deducted = 0
         
         if request.user.team:
-            hint_purchases = HintPurchase.objects.filter(
-                team=request.user.team,
-                challenge=challenge
-            )
-            purchased_hints = hint_purchases.values_list('hint_index', flat=True)
-            total_points_deducted = sum(ph.points_deducted for ph in hint_purchases)
+            purchased_hints = set(catalog.get_hint_purchases(request.user.team, challenge))
+            total_points_deducted = submissions.hints_deducted(request.user.team, challenge)
 
         # Prepare hints with purchase status but hide content for unpurchased hints
         hints = challenge.hints
@@ -471,6 +455,7 @@ def get_challenge_by_id(request, challenge_id):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@ratelimit.limit('submit_flag', 'user', 'team')
 def submit_flag(request, challenge_id):
     try:
         if not request.user.team:
@@ -494,67 +479,20 @@ def submit_flag(request, challenge_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Get submission count for attempt limiting
-        submission_count = Submission.objects.filter(
-            team=request.user.team,
-            challenge=challenge
-        ).count()
-
-        if submission_count >= challenge.max_attempts:
-            return Response(
-                {'error': f'Maximum {challenge.max_attempts} attempts allowed for this challenge'},
-                status=status.HTTP_429_TOO_MANY_REQUESTS
-            )
-
-        with transaction.atomic():
-            if Submission.objects.filter(
-                team=request.user.team,
-                challenge=challenge,
-                is_correct=True
-            ).exists():
+        try:
+            submission = submissions.submit(request.user.team, request.user, challenge, flag)
+        except submissions.SubmissionRefused as e:
+            if e.solved:
                 return Response(
                     {'error': 'Challenge already solved'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-
-            attempt_number = submission_count + 1
-            is_correct = challenge.flag == flag
-
-            # Calculate points after hint deductions
-            points_awarded = challenge.max_points
-            if is_correct:
-                # Get all purchased hints for this challenge
-                hint_purchases = HintPurchase.objects.filter(
-                    team=request.user.team,
-                    challenge=challenge
-                )
-                
-                # Calculate total points to deduct (direct deduction)
-                total_points_deducted = sum(purchase.points_deducted for purchase in hint_purchases)
-                
-                # Calculate final points
-                points_awarded = max(0, challenge.max_points - total_points_deducted)
-                
-                # Log the point calculation for debugging
-                logger.info(f"Flag submission: challenge={challenge_id}, " +
-                           f"max_points={challenge.max_points}, " +
-                           f"total_deducted={total_points_deducted}, " +
-                           f"awarded={points_awarded}")
-
-            submission = Submission.objects.create(
-                team=request.user.team,
-                challenge=challenge,
-                user=request.user,
-                flag_submitted=flag,
-                is_correct=is_correct,
-                points_awarded=points_awarded if is_correct else 0,
-                attempt_number=attempt_number
+            return Response(
+                {'error': f'Maximum {challenge.max_attempts} attempts allowed for this challenge'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
             )
-
-            if is_correct:
-                request.user.team.challenges.add(challenge)
-                request.user.team.team_score += points_awarded
-                request.user.team.save()
+        is_correct = submission.is_correct
+        attempt_number = submission.attempt_number
 
         return Response({
             'message': 'Correct flag!' if is_correct else 'Incorrect flag',
@@ -574,84 +512,75 @@ def submit_flag(request, challenge_id):
         )
 
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def start_challenge(request, challenge_id):
-    if not request.user.team:
-        return Response(
-            {'error': 'You must be in a team to start challenges'},
-            status=status.HTTP_403_FORBIDDEN
-        )
+def _team_error(team):
+    """(payload, status) refusing a launch for the requesting team, if any"""
+    if not team:
+        return {'error': 'You must be in a team to start challenges'}, status.HTTP_403_FORBIDDEN
+    if team.is_banned:
+        return {'error': 'Your team has been banned'}, status.HTTP_403_FORBIDDEN
+    return None
 
-    if request.user.team.is_banned:
-        return Response(
-            {'error': 'Your team has been banned'},
-            status=status.HTTP_403_FORBIDDEN
-        )
-        
-    challenge = get_object_or_404(Challenge, id=challenge_id)
+
+def _resolve_start(team, challenge):
+    """
+    What start_challenge answers without launching anything, as (payload,
+    status, headers): the team's shared instance or its running container.
+    None when a container has to be claimed or started.
+    """
+    if challenge.instance_mode != 'per_team':
+        # Stateless challenges are served by containers shared between teams
+        shared_container = (
+            Container.objects.filter(challenge=challenge, shared=True, teams=team).first()
+            or orchestrator.assign_shared(team, challenge)
+        )
+        if shared_container is None:
+            return (
+                {'error': 'Challenge instances are starting, try again shortly'},
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                {'Retry-After': '5'},
+            )
+        return provisioning.container_details(shared_container), status.HTTP_200_OK, None
 
     existing_container = Container.objects.filter(
-        team=request.user.team,
+        team=team,
         challenge=challenge,
-        created_at__gte=datetime.now() - timedelta(minutes=10)
+        created_at__gte=timezone.now() - settings.CONTAINER_TTL
     ).first()
 
     if existing_container:
-        return Response({
+        return {
             'host': existing_container.ssh_host,
             'port': existing_container.ssh_port,
             'ssh_user': existing_container.ssh_user,
             'ssh_password': existing_container.ssh_password,
             'created_at': existing_container.created_at,
-        })
+        }, status.HTTP_200_OK, None
+    return None
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def start_challenge(request, challenge_id):
+    error = _team_error(request.user.team)
+    if error:
+        return Response(error[0], status=error[1])
+
+    challenge = get_object_or_404(Challenge, id=challenge_id)
 
     try:
-        client = DockerPlugin(base_url=settings.DOCKER_HOST,key_file=settings.SSH_KEY_FILE)
-
-        container_id, password = client.run_container(
-            challenge.docker_image,
-            port=challenge.port,
-            container_name=f"{request.user.team.name.replace(' ', '_')}-{challenge.title.replace(' ', '_')}"
-        )
-
-        import time
-        timeout = 30
-        start_time = time.time()
-        while True:
-            ports = client.get_container_ports(container_id)
-            if ports:
-                break
-            time.sleep(1)
-            if time.time() - start_time > timeout:
-                return Response(
-                    {'error': 'Timeout waiting for container ports'},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-        container = Container.objects.create(
-            team=request.user.team,
-            challenge=challenge,
-            container_id=container_id,
-            ssh_host=settings.SSH_HOST_URL,
-            ssh_port=ports[f'{challenge.port}/tcp'][0]['HostPort'],
-            ssh_user=challenge.ssh_user,
-            ssh_password=password,
-        )
+        resolved = _resolve_start(request.user.team, challenge)
+        if resolved:
+            payload, code, headers = resolved
+            return Response(payload, status=code, headers=headers)
 
-        if challenge.ssh_user:
-            return Response({
-                'host': container.ssh_host,
-                'port': container.ssh_port,
-                'ssh_user': container.ssh_user,
-                'ssh_password': container.ssh_password,
-                'created_at': container.created_at
-            })
-        else:
-            return Response({
-                'host': container.ssh_host,
-                'port': container.ssh_port,
-                'created_at': container.created_at
-            })
+        # A pre-started container from the challenge's warm pool is handed out immediately
+        warm_container = orchestrator.claim(request.user.team, challenge)
+        if warm_container:
+            return Response(provisioning.container_details(warm_container))
+
+        # Otherwise the launch runs in the background, clients poll the job or listen on the live stream
+        job = provisioning.submit(request.user.team, challenge)
+        return Response(provisioning.job_payload(job), status=status.HTTP_202_ACCEPTED)
 
     except Exception as e:
         return Response(
@@ -660,6 +589,42 @@ def start_challenge(request, challenge_id):
         )
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_provision_job(request, job_id):
+    """Status of a container launch started through start_challenge"""
+    if not request.user.team:
+        return Response(
+            {'error': 'You must be in a team to start challenges'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    job = provisioning.get_job(job_id, request.user.team)
+    if job is None:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(provisioning.job_payload(job))
+
+
+def _container_to_stop(team, challenge):
+    """
+    The team's running container for challenge. A shared container is not
+    stopped, since other teams keep using it; the team is only unassigned and
+    'released' is returned instead.
+    """
+    shared_container = Container.objects.filter(
+        challenge=challenge, shared=True, teams=team
+    ).first()
+    if shared_container:
+        shared_container.teams.remove(team)
+        return 'released'
+
+    return Container.objects.filter(
+        team=team,
+        challenge=challenge,
+        created_at__gte=timezone.now() - settings.CONTAINER_TTL
+    ).first()
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def stop_challenge(request, challenge_id):
@@ -672,15 +637,13 @@ def stop_challenge(request, challenge_id):
 
         challenge = get_object_or_404(Challenge, id=challenge_id)
 
-        existing_container = Container.objects.filter(
-            team=request.user.team,
-            challenge=challenge,
-            created_at__gte=datetime.now() - timedelta(minutes=10)
-        ).first()
+        existing_container = _container_to_stop(request.user.team, challenge)
+        if existing_container == 'released':
+            return Response({'message': 'Container released'}, status=status.HTTP_200_OK)
 
         if existing_container:
-            client = DockerPlugin(base_url=settings.DOCKER_HOST,key_file=settings.SSH_KEY_FILE)
-            client.stop_container(existing_container.container_id)
+            with docker_connection(existing_container.docker_host) as client:
+                client.stop_container(existing_container.container_id)
             existing_container.delete()
             return Response({'message': 'Container stopped'}, status=status.HTTP_200_OK)
         else:
@@ -689,21 +652,108 @@ def stop_challenge(request, challenge_id):
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# Async start/stop, routed instead of the views above when DOCKER_ASYNC_VIEWS is
+# set and the app is served through backend.asgi. Docker calls are awaited on
+# the event loop (async_docker) rather than holding a thread, and cold starts
+# run as tasks on the same loop. Responses are the same as the sync views'.
+
+async def _authenticate(request):
+    # The JWT authentication the DRF views and the live event stream use
+    return await sync_to_async(events.authenticate_stream)(request)
+
+
+def _team_and_challenge(user, challenge_id):
+    team = user.team
+    challenge = Challenge.objects.filter(id=challenge_id).first()
+    return team, challenge
+
+
+@csrf_exempt
+async def start_challenge_async(request, challenge_id):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse(
+            {'error': 'Authentication credentials were not provided or are invalid'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    team, challenge = await sync_to_async(_team_and_challenge)(user, challenge_id)
+    error = _team_error(team)
+    if error:
+        return JsonResponse(error[0], status=error[1])
+    if challenge is None:
+        return JsonResponse({'error': 'Challenge not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        resolved = await sync_to_async(_resolve_start)(team, challenge)
+        if resolved:
+            payload, code, headers = resolved
+            return JsonResponse(payload, status=code, headers=headers)
+
+        warm_container = await orchestrator.claim_async(team, challenge)
+        if warm_container:
+            return JsonResponse(provisioning.container_details(warm_container))
+
+        runner = partial(provisioning.run_on_loop, asyncio.get_running_loop())
+        job = await sync_to_async(provisioning.submit)(team, challenge, runner)
+        return JsonResponse(provisioning.job_payload(job), status=status.HTTP_202_ACCEPTED)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+async def stop_challenge_async(request, challenge_id):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse(
+            {'error': 'Authentication credentials were not provided or are invalid'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    try:
+        team, challenge = await sync_to_async(_team_and_challenge)(user, challenge_id)
+        if not team:
+            return JsonResponse(
+                {'error': 'You must be in a team to start challenges'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        if challenge is None:
+            return JsonResponse({'error': 'Challenge not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        existing_container = await sync_to_async(_container_to_stop)(team, challenge)
+        if existing_container == 'released':
+            return JsonResponse({'message': 'Container released'}, status=status.HTTP_200_OK)
+
+        if existing_container:
+            client = scheduler.get_host(existing_container.docker_host).async_client()
+            await client.stop_container(existing_container.container_id)
+            await existing_container.adelete()
+            return JsonResponse({'message': 'Container stopped'}, status=status.HTTP_200_OK)
+        else:
+            return JsonResponse({'message': 'No active container found'}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_teams(request):
     # Only show non-hidden teams for regular users
+    # Solve counts are kept on the teams' scoreboard entries
     teams = Team.objects.filter(is_hidden=False).annotate(
         member_count=Count('members', distinct=True),
-        solved_count=Count('submissions', filter=Q(
-            submissions__is_correct=True), distinct=True)
+        solved_count=Coalesce(F('scoreboard_entry__solve_count'), 0)
     ).order_by('-team_score', 'created_at')
 
     if request.user.is_superuser:
         teams = Team.objects.annotate(
             member_count=Count('members', distinct=True),
-            solved_count=Count('submissions', filter=Q(
-                submissions__is_correct=True), distinct=True)
+            solved_count=Coalesce(F('scoreboard_entry__solve_count'), 0)
         ).order_by('-team_score', 'created_at')
     response_data = [{
         'id': team.id,
@@ -826,28 +876,8 @@ def get_scoreboard(request):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        teams = Team.objects.annotate(
-            member_count=Count('members', distinct=True),
-            solved_count=Count('submissions', filter=Q(
-                submissions__is_correct=True))
-        ).order_by('-team_score')  # Use team_score field directly
-
-        scoreboard_data = []
-        for rank, team in enumerate(teams, 1):
-            team_data = {
-                'rank': rank,
-                'team_id': team.id,
-                'team_name': team.name,
-                'total_score': team.team_score, 
-                'member_count': team.member_count,
-                'solved_challenges': team.solved_count,
-                'last_solve': team.submissions.filter(
-                    is_correct=True
-                ).order_by('-timestamp').first().timestamp if team.solved_count > 0 else None
-            }
-            scoreboard_data.append(team_data)
-
-        return Response(scoreboard_data)
+        # Served from the materialized table, see scoreboard.py
+        return Response(caching.get_or_build('scoreboard', scoreboard.get_rows))
     except Exception as e:
         return Response(
             {'error': str(e)},
@@ -855,6 +885,30 @@ def get_scoreboard(request):
         )
 
 
+async def live_events(request):
+    """
+    Server-Sent Events stream of scoreboard updates and solves.
+    Clients resume after a disconnect by sending Last-Event-ID.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    user = await sync_to_async(events.authenticate_stream)(request)
+    if user is None:
+        return JsonResponse(
+            {'error': 'Authentication credentials were not provided or are invalid'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    response = StreamingHttpResponse(
+        events.stream(user.team_id, events.parse_last_event_id(request)),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def request_password_reset(request):
@@ -942,6 +996,47 @@ def reset_password(request):
         )
 
 
+RESOURCE_FIELDS = ('cpu_quota', 'memory_limit', 'pids_limit', 'cpuset_cpus', 'tmpfs')
+CPUSET_PATTERN = re.compile(r'^\d+(-\d+)?(,\d+(-\d+)?)*$')
+
+
+def parse_resource_profile(data):
+    """Validated resource profile fields present in challenge form data"""
+    profile = {}
+    try:
+        if data.get('cpu_quota') not in (None, ''):
+            profile['cpu_quota'] = int(data['cpu_quota'])
+        if data.get('memory_limit') not in (None, ''):
+            profile['memory_limit'] = int(data['memory_limit'])
+        if 'pids_limit' in data:
+            profile['pids_limit'] = int(data['pids_limit']) if data['pids_limit'] not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValidationError("cpu_quota, memory_limit and pids_limit must be integers")
+    if profile.get('cpu_quota', 1000) < 1000 or profile.get('memory_limit', 6) < 6 or (profile.get('pids_limit') or 1) < 1:
+        raise ValidationError("cpu_quota must be at least 1000, memory_limit at least 6 and pids_limit at least 1")
+
+    if 'cpuset_cpus' in data:
+        cpuset = (data['cpuset_cpus'] or '').replace(' ', '')
+        if cpuset and not CPUSET_PATTERN.match(cpuset):
+            raise ValidationError('cpuset_cpus must look like "0-3" or "0,2"')
+        profile['cpuset_cpus'] = cpuset
+
+    if 'tmpfs' in data:
+        tmpfs = data['tmpfs'] or {}
+        if isinstance(tmpfs, str):
+            try:
+                tmpfs = json.loads(tmpfs)
+            except json.JSONDecodeError:
+                raise ValidationError("tmpfs must be a JSON object")
+        if not isinstance(tmpfs, dict) or not all(
+            isinstance(path, str) and path.startswith('/') and isinstance(options, str)
+            for path, options in tmpfs.items()
+        ):
+            raise ValidationError('tmpfs must map absolute paths to mount options, e.g. {"/tmp": "size=64m"}')
+        profile['tmpfs'] = tmpfs
+    return profile
+
+
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
 def create_challenge(request):
@@ -951,8 +1046,16 @@ def create_challenge(request):
             status=status.HTTP_403_FORBIDDEN
         )
 
+    reporter = uploads.ProgressReporter(request.GET.get('upload_id'))
+    size_limit = uploads.limit_image_size(request, reporter)
     try:
         data = request.data
+        if size_limit.exceeded:
+            reporter.finish('failed', error='Docker image is too large')
+            return Response(
+                {"error": f"Docker image exceeds the {settings.DOCKER_IMAGE_MAX_SIZE} byte limit"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
 
         # Validate required fields
         required_fields = ['title', 'description', 'category', 'flag', 'max_points']
@@ -973,15 +1076,23 @@ def create_challenge(request):
         image_id = None
         if request.FILES.get('docker_image'):
             try:
-                client = DockerPlugin(base_url=settings.DOCKER_HOST,key_file=settings.SSH_KEY_FILE)
-                image_id = client.add_image(request.FILES['docker_image'].read())
+                # Streamed from the spooled upload, never read into memory
+                image_id = scheduler.load_image(request.FILES['docker_image'], progress=reporter.loading)
+                if image_id is None:
+                    raise Exception("No Docker host loaded the image")
             except Exception as e:
+                reporter.finish('failed', error=str(e))
                 return Response(
                     {"error": "Failed to add Docker image", "exception": f"{str(e)}"},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
+            reporter.finish('done', image_id=image_id)
 
         max_attempts = data.get('max_attempts')
+        resource_profile = parse_resource_profile(data)
+        instance_mode = data.get('instance_mode') or 'per_team'
+        if instance_mode not in dict(Challenge.INSTANCE_MODE_CHOICES):
+            return Response({"error": "Invalid instance_mode"}, status=status.HTTP_400_BAD_REQUEST)
         # Create challenge
         challenge = Challenge.objects.create(
             title=title,
@@ -997,7 +1108,12 @@ def create_challenge(request):
             file_links=data.get('file_links', []),
             port=data.get('port', 22),
             ssh_user=data.get('ssh_user', None),
+            warm_pool_size=int(data.get('warm_pool_size') or 0),
+            instance_mode=instance_mode,
+            replica_count=max(1, int(data.get('replica_count') or 1)),
+            **resource_profile,
         )
+        orchestrator.schedule_refill(challenge.id)
 
         return Response({
             "message": "Challenge created successfully",
@@ -1020,9 +1136,17 @@ def update_challenge(request, challenge_id):
             {"error": "Only administrators can update challenges"},
             status=status.HTTP_403_FORBIDDEN
         )
+    reporter = uploads.ProgressReporter(request.GET.get('upload_id'))
+    size_limit = uploads.limit_image_size(request, reporter)
     try:
         challenge = Challenge.objects.get(id=challenge_id)
         data = request.data
+        if size_limit.exceeded:
+            reporter.finish('failed', error='Docker image is too large')
+            return Response(
+                {"error": f"Docker image exceeds the {settings.DOCKER_IMAGE_MAX_SIZE} byte limit"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
 
         # Handle form data properly
         if isinstance(data, QueryDict):
@@ -1055,12 +1179,15 @@ def update_challenge(request, challenge_id):
         # Handle docker image file if present
         if request.FILES.get('docker_image'):
             try:
-                client = DockerPlugin(base_url=settings.DOCKER_HOST,key_file=settings.SSH_KEY_FILE)
-                image_id = client.add_image(request.FILES['docker_image'].read())
+                image_id = scheduler.load_image(request.FILES['docker_image'], progress=reporter.loading)
+                if image_id is None:
+                    raise Exception("No Docker host loaded the image")
                 data['docker_image'] = image_id
             except Exception as e:
                 logger.error(f"Docker image upload error: {str(e)}")
+                reporter.finish('failed', error=str(e))
                 raise Exception("Failed to upload docker image")
+            reporter.finish('done', image_id=image_id)
 
         if 'ssh_user' in data:
             try:
@@ -1079,7 +1206,27 @@ def update_challenge(request, challenge_id):
                 data['max_attempts'] = int(data['max_attempts'])
             except Exception as e:
                 raise Exception("Failed to upload max attempts :" + str(e))
-        
+
+        if 'warm_pool_size' in data:
+            try:
+                data['warm_pool_size'] = max(0, int(data['warm_pool_size'] or 0))
+            except Exception as e:
+                raise Exception("Failed to upload warm pool size :" + str(e))
+
+        if 'instance_mode' in data and data['instance_mode'] not in dict(Challenge.INSTANCE_MODE_CHOICES):
+            raise ValidationError("Invalid instance_mode")
+
+        if 'replica_count' in data:
+            try:
+                data['replica_count'] = max(1, int(data['replica_count'] or 1))
+            except Exception as e:
+                raise Exception("Failed to upload replica count :" + str(e))
+
+        # Blank resource fields keep their current value
+        resource_profile = parse_resource_profile(data)
+        for field in RESOURCE_FIELDS:
+            data.pop(field, None)
+        data.update(resource_profile)
 
         # Update fields
         for field, value in data.items():
@@ -1087,6 +1234,11 @@ def update_challenge(request, challenge_id):
                 setattr(challenge, field, value)
 
         challenge.save()
+        orchestrator.schedule_refill(challenge.id)
+        if not challenge.is_hidden and challenge.docker_image:
+            # Published: get the image onto every host before the first launch needs it
+            image = challenge.docker_image
+            transaction.on_commit(lambda: provisioning.run_in_background(scheduler.prewarm, [image]))
         return Response({"message": "Challenge updated successfully"})
 
     except Challenge.DoesNotExist:
@@ -1172,6 +1324,7 @@ def team_profile(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@ratelimit.limit('signin', 'ip')
 def signin(request):
     """Authenticate user and return JWT tokens"""
     try:
@@ -1243,7 +1396,7 @@ def admin_get_challenges(request):
         )
 
     try:
-        challenges = Challenge.objects.all()
+        challenges = Challenge.objects.select_related('first_blood')
         data = []
         for challenge in challenges:
             data.append({
@@ -1259,6 +1412,13 @@ def admin_get_challenges(request):
                 'is_hidden': challenge.is_hidden,
                 'hints': challenge.hints,
                 'file_links': challenge.file_links,
+                'warm_pool_size': challenge.warm_pool_size,
+                'solve_count': challenge.solve_count,
+                'first_blood': {
+                    'id': challenge.first_blood.id,
+                    'name': challenge.first_blood.name,
+                    'solved_at': challenge.first_blood_at,
+                } if challenge.first_blood_id else None,
                 'created_at': challenge.created_at,
                 'updated_at': challenge.updated_at
             })
@@ -1292,6 +1452,14 @@ def get_challenge_detail(request, challenge_id):
             'file_links': challenge.file_links,
             'ssh_user' : challenge.ssh_user,
             'port' : challenge.port,
+            'warm_pool_size': challenge.warm_pool_size,
+            'instance_mode': challenge.instance_mode,
+            'replica_count': challenge.replica_count,
+            'cpu_quota': challenge.cpu_quota,
+            'memory_limit': challenge.memory_limit,
+            'pids_limit': challenge.pids_limit,
+            'cpuset_cpus': challenge.cpuset_cpus,
+            'tmpfs': challenge.tmpfs,
         }
         return Response(data)
     except Challenge.DoesNotExist:
@@ -1400,9 +1568,18 @@ def get_all_submissions(request):
         )
 
 
+CONTAINER_STATUSES = ('running', 'missing', 'unknown')
+
+
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def get_containers(request):
+    """
+    Paginated container listing, reconciled with what is running. Each row's
+    status is 'running', 'missing' (its container is gone from the host) or
+    'unknown' (the host could not be listed). Filters: team, challenge, host
+    and status; pagination: page and page_size.
+    """
     if not request.user.is_superuser:
         return Response(
             {"error": "Only administrators can access this"},
@@ -1410,31 +1587,272 @@ def get_containers(request):
         )
 
     try:
-        containers = Container.objects.all()
+        page = max(int(request.GET.get('page', 1)), 1)
+        page_size = min(max(int(request.GET.get('page_size', 50)), 1), 500)
+        team_id = int(request.GET['team']) if request.GET.get('team') else None
+        challenge_id = int(request.GET['challenge']) if request.GET.get('challenge') else None
+    except ValueError:
+        return Response(
+            {"error": "page, page_size, team and challenge must be integers"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    status_filter = request.GET.get('status')
+    if status_filter and status_filter not in CONTAINER_STATUSES:
+        return Response(
+            {"error": f"status must be one of {', '.join(CONTAINER_STATUSES)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        hosts = [scheduler.get_host(request.GET['host'])] if request.GET.get('host') else scheduler.get_hosts()
+    except KeyError as e:
+        return Response({"error": str(e).strip("'")}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        containers = Container.objects.filter(
+            docker_host__in=[name for host in hosts for name in scheduler.stored_names(host)]
+        )
+        if team_id is not None:
+            # Shared containers list the teams assigned to them instead of owning one
+            containers = containers.filter(
+                Q(team_id=team_id) | Q(pk__in=Container.teams.through.objects.filter(team_id=team_id).values('container_id'))
+            )
+        if challenge_id is not None:
+            containers = containers.filter(challenge_id=challenge_id)
+
+        # One list call per host, merged with the rows below
+        running = scheduler.running_containers(hosts)
+        if status_filter:
+            matched = Q(pk__in=[])
+            for host in hosts:
+                on_host = Q(docker_host__in=scheduler.stored_names(host))
+                running_ids = running[host.name]
+                if running_ids is None:
+                    if status_filter == 'unknown':
+                        matched |= on_host
+                elif status_filter == 'running':
+                    matched |= on_host & Q(container_id__in=list(running_ids))
+                elif status_filter == 'missing':
+                    matched |= on_host & ~Q(container_id__in=list(running_ids))
+            containers = containers.filter(matched)
+
+        count = containers.count()
+        offset = (page - 1) * page_size
+        rows = containers.select_related('team', 'challenge', 'stats').annotate(
+            team_count=Count('teams')
+        ).order_by('-created_at', 'container_id')[offset:offset + page_size]
+
         data = []
-        for container in containers:
+        for container in rows:
+            host_name = container.docker_host or scheduler.get_host().name
+            running_ids = running.get(host_name)
+            listed = running_ids.get(container.container_id) if running_ids else None
+            if running_ids is None:
+                container_status = 'unknown'
+            else:
+                container_status = 'running' if listed else 'missing'
             data.append({
                 'team': {
                     'id': container.team.id,
                     'name': container.team.name
-                },
+                } if container.team_id else None,
+                'shared': container.shared,
+                'shared_team_count': container.team_count,
                 'challenge': {
                     'id': container.challenge.id,
                     'title': container.challenge.title
                 },
                 'container_id': container.container_id,
+                'docker_host': host_name,
+                'status': container_status,
+                'docker_status': listed.get('Status') if listed else None,
                 'ssh_host': container.ssh_host,
                 'ssh_port': container.ssh_port,
                 'ssh_user': container.ssh_user,
                 'ssh_password': container.ssh_password,
                 'created_at': container.created_at,
-                'updated_at': container.updated_at
+                'updated_at': container.updated_at,
+                'stats': sampler.stats_payload(container.stats) if hasattr(container, 'stats') else None,
             })
-        return Response(data)
+        return Response({
+            'count': count,
+            'page': page,
+            'page_size': page_size,
+            'unreachable_hosts': [name for name, ids in running.items() if ids is None],
+            'results': data,
+        })
     except Exception as e:
         return Response(
             {"error": f"Failed to fetch containers: {str(e)}"},
-            status=status.HTTP_500_internal_server_error
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_warm_pools(request):
+    """Warm pool sizes, hit/miss counters and refill latency per challenge"""
+    if not request.user.is_superuser:
+        return Response(
+            {"error": "Only administrators can access this"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    try:
+        challenges = list(Challenge.objects.filter(warm_pool_size__gt=0).values('id', 'title', 'warm_pool_size'))
+        metrics = orchestrator.get_metrics([challenge['id'] for challenge in challenges])
+        data = [{
+            'challenge': {
+                'id': challenge['id'],
+                'title': challenge['title']
+            },
+            'target_size': challenge['warm_pool_size'],
+            **metrics[challenge['id']]
+        } for challenge in challenges]
+        return Response(data)
+    except Exception as e:
+        return Response(
+            {"error": f"Failed to fetch warm pools: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_docker_hosts(request):
+    """Containers placed and CPU/memory reserved on each Docker host"""
+    if not request.user.is_superuser:
+        return Response(
+            {"error": "Only administrators can access this"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    try:
+        return Response(scheduler.host_report())
+    except Exception as e:
+        return Response(
+            {"error": f"Failed to fetch Docker hosts: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_image_upload_progress(request, upload_id):
+    """Progress of a challenge image upload started with ?upload_id="""
+    if not request.user.is_superuser:
+        return Response(
+            {"error": "Only administrators can access this"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    progress = uploads.get_progress(upload_id)
+    if progress is None:
+        return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(progress)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def create_image_upload(request):
+    """Start a resumable challenge image upload"""
+    if not request.user.is_superuser:
+        return Response(
+            {"error": "Only administrators can upload images"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    try:
+        filename = request.data.get('filename')
+        if not filename:
+            return Response({"error": "filename is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({"error": "size is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        challenge = None
+        if request.data.get('challenge_id'):
+            challenge = get_object_or_404(Challenge, id=request.data.get('challenge_id'))
+
+        upload = uploads.start(filename, size, challenge=challenge, sha256=request.data.get('sha256') or '')
+        return Response(uploads.upload_payload(upload), status=status.HTTP_201_CREATED)
+    except uploads.UploadError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except Exception as e:
+        logger.error(f"Error starting image upload: {str(e)}")
+        return Response(
+            {"error": f"Failed to start upload: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET', 'PUT'])
+@permission_classes([IsAdminUser])
+def image_upload_detail(request, upload_id):
+    """
+    GET returns the upload's state, including the offset to resume from.
+    PUT appends the raw request body at the offset in the Upload-Offset header.
+    """
+    if not request.user.is_superuser:
+        return Response(
+            {"error": "Only administrators can upload images"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    if request.method == 'GET':
+        upload = ImageUpload.objects.filter(id=upload_id).first()
+        if upload is None:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(uploads.upload_payload(upload))
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.headers.get('Content-Length', ''))
+    except ValueError:
+        return Response(
+            {"error": "Upload-Offset and Content-Length headers are required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        # The body is read straight from the request stream, never parsed into memory
+        upload = uploads.append(upload_id, offset, request, length)
+        return Response(uploads.upload_payload(upload))
+    except uploads.UploadError as e:
+        upload = ImageUpload.objects.filter(id=upload_id).first()
+        return Response(
+            {"error": str(e), "offset": upload.offset if upload else None},
+            status=e.status
+        )
+    except Exception as e:
+        logger.error(f"Error appending to image upload: {str(e)}")
+        return Response(
+            {"error": f"Failed to store chunk: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def commit_image_upload(request, upload_id):
+    """Finish an upload; the image is loaded on the Docker hosts in the background"""
+    if not request.user.is_superuser:
+        return Response(
+            {"error": "Only administrators can upload images"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    try:
+        upload = uploads.commit(upload_id)
+        return Response(uploads.upload_payload(upload), status=status.HTTP_202_ACCEPTED)
+    except uploads.UploadError as e:
+        return Response({"error": str(e)}, status=e.status)
+    except Exception as e:
+        logger.error(f"Error committing image upload: {str(e)}")
+        return Response(
+            {"error": f"Failed to commit upload: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
@@ -1449,8 +1867,8 @@ def admin_stop_container(request, container_id):
             )
 
         container = Container.objects.get(container_id=container_id)
-        client = DockerPlugin(base_url=settings.DOCKER_HOST,key_file=settings.SSH_KEY_FILE)
-        client.stop_container(container.container_id)
+        with docker_connection(container.docker_host) as client:
+            client.stop_container(container.container_id)
         container.delete()
         return Response({"message": "Container stopped successfully"}, status=status.HTTP_200_OK)
     except Container.DoesNotExist:
@@ -1465,6 +1883,81 @@ def admin_stop_container(request, container_id):
         )
 
 
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def admin_restart_container(request, container_id):
+    try:
+        if not request.user.is_superuser:
+            return Response(
+                {"error": "Only administrators can access this"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        container = Container.objects.get(container_id=container_id)
+        with docker_connection(container.docker_host) as client:
+            restarted = client.restart_container(container.container_id)
+        if not restarted:
+            return Response(
+                {"error": "Failed to restart container"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response({"message": "Container restarted successfully"}, status=status.HTTP_200_OK)
+    except Container.DoesNotExist:
+        return Response(
+            {"error": "Container not found"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except Exception as e:
+        return Response(
+            {"error": f"Failed to restart container: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+async def admin_container_logs(request, container_id):
+    """
+    Stream a container's logs as Server-Sent Events, or as plain text with
+    ?format=text. Query parameters: follow (default true), tail (lines or
+    "all"), since (unix timestamp or ISO 8601) and timestamps. EventSource
+    clients pass the access token as ?token= and should close on the "end"
+    event, sent once the container's output ends.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse(
+            {'error': 'Authentication credentials were not provided or are invalid'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    if not user.is_superuser:
+        return JsonResponse({'error': 'Only administrators can access this'}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        options = logstream.parse_options(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    docker_host = await sync_to_async(logstream.find_host)(container_id)
+    if docker_host is None:
+        return JsonResponse({'error': 'Container not found'}, status=status.HTTP_404_NOT_FOUND)
+    client = scheduler.get_host(docker_host).async_client()
+    if await client.inspect_container(container_id) is None:
+        return JsonResponse(
+            {'error': 'Container is not running on its Docker host'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    sse = request.GET.get('format') != 'text'
+    response = StreamingHttpResponse(
+        logstream.stream(client, container_id, options, sse=sse),
+        content_type='text/event-stream' if sse else 'text/plain; charset=utf-8'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def get_dashboard_stats(request):
@@ -1483,17 +1976,18 @@ def get_dashboard_stats(request):
             'challenges': {
                 'total': Challenge.objects.count(),
                 'active': Challenge.objects.filter(is_hidden=False).count(),
-                'solved': Challenge.objects.filter(submissions__is_correct=True).distinct().count()
+                'solved': Challenge.objects.filter(solve_count__gt=0).count()
             },
             'containers': {
                 'total': Container.objects.count(),
-                'running': Container.objects.filter(created_at__gte=datetime.now() - timedelta(minutes=10)).count()
+                'running': Container.objects.filter(created_at__gte=timezone.now() - settings.CONTAINER_TTL).count()
             },
             'submissions': {
                 'total': Submission.objects.count(),
                 'correct': Submission.objects.filter(is_correct=True).count(),
                 'last_24h': Submission.objects.filter(timestamp__gte=datetime.now() - timedelta(days=1)).count()
-            }
+            },
+            'rate_limited': ratelimit.get_metrics(),
         }
         return Response(stats)
     except Exception as e:
@@ -1580,6 +2074,7 @@ def update_team(request, team_id):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@ratelimit.limit('purchase_hint', 'user')
 def purchase_hint(request, challenge_id):
     try:
         challenge = Challenge.objects.get(id=challenge_id)
@@ -1591,22 +2086,8 @@ def purchase_hint(request, challenge_id):
         hints = challenge.hints if isinstance(challenge.hints, list) else json.loads(challenge.hints)
         hint = hints[hint_index]
         
-        # Check if hint already purchased
-        hint_key = f"hint_{request.user.team.id}_{challenge.id}_{hint_index}"
-        hint_purchase = HintPurchase.objects.filter(
-            team=request.user.team,
-            challenge=challenge,
-            hint_index=hint_index
-        ).first()
-        
-        if hint_purchase or cache.get(hint_key):
-            # Get all purchased hints
-            purchased_hints = HintPurchase.objects.filter(
-                team=request.user.team,
-                challenge=challenge
-            )
-            # Calculate total points deducted directly
-            total_points_deducted = sum(ph.points_deducted for ph in purchased_hints)
+        def already_purchased():
+            total_points_deducted = submissions.hints_deducted(request.user.team, challenge)
             remaining_points = max(0, challenge.max_points - total_points_deducted)
             
             return Response({
@@ -1617,27 +2098,36 @@ def purchase_hint(request, challenge_id):
                 "pointsDeducted": total_points_deducted
             })
 
-        with transaction.atomic():
-            # Direct point deduction - hint cost is the number of points to deduct
-            points_deducted = hint['cost']
+        # Check if hint already purchased (shared cache, invalidated on HintPurchase writes)
+        purchased_hints = catalog.get_hint_purchases(request.user.team, challenge)
+        
+        if hint_index in purchased_hints:
+            return already_purchased()
 
-            HintPurchase.objects.create(
-                team=request.user.team,
-                challenge=challenge, 
-                hint_index=hint_index,
-                hint_cost_percentage=hint['cost'],  # Keep for backward compatibility
-                points_deducted=points_deducted
-            )
-            
-            cache.set(hint_key, True)
+        try:
+            with transaction.atomic():
+                # The cache can be stale, so the purchase is checked again against the table
+                if HintPurchase.objects.filter(
+                    team=request.user.team, challenge=challenge, hint_index=hint_index
+                ).exists():
+                    return already_purchased()
 
-            # Calculate total points deducted
-            purchased_hints = HintPurchase.objects.filter(
-                team=request.user.team,
-                challenge=challenge
-            )
-            total_points_deducted = sum(ph.points_deducted for ph in purchased_hints)
-            remaining_points = max(0, challenge.max_points - total_points_deducted)
+                # Direct point deduction - hint cost is the number of points to deduct
+                points_deducted = hint['cost']
+
+                HintPurchase.objects.create(
+                    team=request.user.team,
+                    challenge=challenge, 
+                    hint_index=hint_index,
+                    hint_cost_percentage=hint['cost'],  # Keep for backward compatibility
+                    points_deducted=points_deducted
+                )
+
+                total_points_deducted = submissions.record_hint(request.user.team, challenge, points_deducted)
+                remaining_points = max(0, challenge.max_points - total_points_deducted)
+        except IntegrityError:
+            # A concurrent request (a double click) bought it first
+            return already_purchased()
 
         # Log the hint purchase details for debugging
         logger.info(f"Hint purchased: challenge={challenge_id}, hint_index={hint_index}, " +
@@ -1728,10 +2218,9 @@ def get_team_profile_admin(request, team_id):
         team_members = User.objects.filter(team=team)
 
         # Get team statistics
-        solved_challenges = Challenge.objects.filter(
-            submissions__team=team,
-            submissions__is_correct=True,
-        ).distinct().count()
+        solved_challenges = ScoreboardEntry.objects.filter(team=team).values_list(
+            'solve_count', flat=True
+        ).first() or 0
 
         # Get team rank
         team_rank = Team.objects.filter(
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
 from dotenv import load_dotenv
 from datetime import timedelta
@@ -34,6 +35,61 @@ DOCKER_HOST_URL = os.getenv('DOCKER_HOST_URL', "unix://var/run/docker.sock")
 SSH_HOST_URL = os.getenv('DOCKER_HOST_URL', HOST_URL)
 KEY_FILE_PATH = os.getenv('KEY_FILE_PATH', None)
 
+# Docker connections are pooled per host, see docker_plugin.DockerPool
+DOCKER_HOST = DOCKER_HOST_URL
+SSH_KEY_FILE = KEY_FILE_PATH
+DOCKER_POOL_SIZE = int(os.getenv('DOCKER_POOL_SIZE', 8))
+DOCKER_HEALTH_CHECK_INTERVAL = 30  # seconds a connection may sit idle before it is pinged
+# Under ASGI, start/stop can await Docker on the event loop instead (see async_docker.py)
+DOCKER_ASYNC_VIEWS = os.getenv('DOCKER_ASYNC_VIEWS', '').lower() in ('1', 'true')
+DOCKER_ASYNC_POOL_SIZE = int(os.getenv('DOCKER_ASYNC_POOL_SIZE', 32))  # concurrent requests per host and event loop
+
+# Docker hosts challenge containers are scheduled on, see atlas_backend/scheduler.py.
+# DOCKER_HOSTS is a JSON list of {"name", "url", "key_file", "ssh_host", "probe_host",
+# "cpus", "memory", "ports"}; cpus/memory cap what is reserved on the host and default to
+# what the daemon reports. Without it the single DOCKER_HOST_URL host is used.
+DOCKER_HOSTS = json.loads(os.getenv('DOCKER_HOSTS') or 'null') or [{
+    'name': 'default',
+    'url': DOCKER_HOST,
+    'key_file': SSH_KEY_FILE,
+    'ssh_host': SSH_HOST_URL,
+}]
+# Host ports challenge containers are published on, unless a host sets its own "ports"
+CONTAINER_PORT_RANGES = os.getenv('CONTAINER_PORT_RANGES', '30000-39999')
+
+# Challenge image uploads are streamed to the Docker hosts, see atlas_backend/uploads.py
+DOCKER_IMAGE_MAX_SIZE = int(os.getenv('DOCKER_IMAGE_MAX_SIZE', 4 * 1024 ** 3))  # bytes
+DOCKER_IMAGE_CHUNK_SIZE = 1024 * 1024  # bytes sent to the daemon per chunk
+# Resumable uploads are spooled here until they are committed
+IMAGE_UPLOAD_DIR = os.getenv('IMAGE_UPLOAD_DIR', str(BASE_DIR / 'uploads'))
+IMAGE_UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024  # bytes accepted per PUT
+IMAGE_UPLOAD_EXPIRY = timedelta(days=1)  # unfinished uploads are discarded after this
+IMAGE_PREWARM_CONCURRENCY = int(os.getenv('IMAGE_PREWARM_CONCURRENCY', 4))  # image transfers between hosts at a time
+
+# Background container provisioning, see atlas_backend/provisioning.py
+PROVISION_WORKERS = int(os.getenv('PROVISION_WORKERS', 8))
+PROVISION_TIMEOUT = 30  # seconds to wait for a container's ports
+# Host used to check a new container's port accepts connections (unset to skip the probe)
+PROVISION_PROBE_HOST = os.getenv('PROVISION_PROBE_HOST') or None
+
+# Challenge containers are stopped once they are older than CONTAINER_TTL
+CONTAINER_TTL = timedelta(minutes=10)
+REAPER_INTERVAL = int(os.getenv('REAPER_INTERVAL', 60))  # seconds between in-process reaper runs, 0 disables
+REAPER_BATCH_SIZE = 50  # containers stopped concurrently per batch
+REAPER_STOP_TIMEOUT = 5  # seconds Docker waits before killing a stopping container
+
+# Resource usage sampling of running containers, see atlas_backend/sampler.py
+STATS_INTERVAL = int(os.getenv('STATS_INTERVAL', 30))  # seconds between samples, 0 disables
+STATS_CONCURRENCY = 20  # stats calls in flight per host
+STATS_SMOOTHING = 0.3  # weight of the newest sample in the rolling averages
+
+# Write-behind journal for incorrect flag submissions, see atlas_backend/journal.py
+SUBMISSION_JOURNAL_DIR = os.getenv('SUBMISSION_JOURNAL_DIR', '')  # unset inserts every submission synchronously
+SUBMISSION_JOURNAL_FLUSH_INTERVAL = 1.0  # seconds between bulk inserts
+SUBMISSION_JOURNAL_BATCH_SIZE = 500  # rows per insert; a full batch is flushed early
+# fsync every append so journaled attempts also survive a power loss, not only a crash
+SUBMISSION_JOURNAL_FSYNC = os.getenv('SUBMISSION_JOURNAL_FSYNC', 'false').lower() in ('1', 'true')
+
 ALLOWED_HOSTS = [HOST_URL]
 
 # Application definition
@@ -195,9 +251,48 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Security settings
 # CSRF_TRUSTED_ORIGINS = ["https://yourfrontenddomain.com"]  # Update with your frontend domain
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# Shared cache used across workers. Without REDIS_URL a per-process
+# in-memory cache stands in (tests and single-process development).
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'atlas',
+            'TIMEOUT': 300,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
     }
+
+# Live event stream (Server-Sent Events)
+LIVE_EVENTS_POLL_INTERVAL = float(os.getenv('LIVE_EVENTS_POLL_INTERVAL', 1.0))  # seconds between feed polls
+LIVE_EVENTS_HEARTBEAT = int(os.getenv('LIVE_EVENTS_HEARTBEAT', 15))  # seconds between keep-alive comments
+LIVE_EVENTS_BUFFER = 1000  # recent events kept in memory for Last-Event-ID replay
+LIVE_EVENTS_QUEUE_SIZE = 200  # per-subscriber backlog before a slow client is disconnected
+LIVE_EVENTS_RETENTION = timedelta(hours=6)
+LIVE_EVENTS_GAP_TIMEOUT = float(os.getenv('LIVE_EVENTS_GAP_TIMEOUT', 5.0))  # seconds to wait for a missing id to commit
+
+# Admin container log streams, see atlas_backend/logstream.py
+LOG_STREAM_DEFAULT_TAIL = 100  # lines of history sent before following
+LOG_STREAM_BUFFER = 1000  # lines queued per viewer before reading from Docker pauses
+LOG_STREAM_MAX_LINE = 16 * 1024  # bytes; longer lines are sent in pieces
+LOG_STREAM_HEARTBEAT = 15  # seconds between keep-alive comments
+
+# Token bucket budgets, see atlas_backend/ratelimit.py: '<endpoint>:<user|team|ip>'
+# -> (burst, seconds to refill the burst). Endpoints without a budget are not limited.
+RATE_LIMITS = {
+    'submit_flag:user': (10, 60),
+    'submit_flag:team': (30, 60),
+    'purchase_hint:user': (10, 60),
+    'signin:ip': (10, 60),
+    'register:ip': (5, 600),
 }
+# Request header holding the client address when behind a proxy, e.g. HTTP_X_FORWARDED_FOR
+RATE_LIMIT_IP_HEADER = os.getenv('RATE_LIMIT_IP_HEADER', '')
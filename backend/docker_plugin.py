@@ -1,8 +1,18 @@
 from docker import DockerClient, APIClient
 from docker.transport import SSHHTTPAdapter
+import os
+import re
 import secrets
+import shlex
+import socket
 import logging
-from docker.errors import APIError
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from docker.errors import APIError, DockerException
+from docker.utils import parse_repository_tag
+from requests.exceptions import ConnectionError as RequestsConnectionError
 
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s", level=logging.ERROR
@@ -12,6 +22,23 @@ ALLOWED_CHARACTERS = (
     "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
 )
 
+# Label set on every container started through the plugin
+MANAGED_LABEL = "atlas.managed"
+
+# Limits applied to challenge containers unless run_container is given others
+CONTAINER_RESOURCES = {
+    "cpu_quota": 50000,  # 50% of a single core
+    "cpu_period": 100000,  # 100% of a single core
+    "memory": "128m",
+    "pids_limit": None,
+    "cpuset_cpus": None,
+    "tmpfs": None,
+}
+
+
+def generate_password(length: int = 16):
+    return "".join(secrets.choice(ALLOWED_CHARACTERS) for _ in range(length))
+
 
 class DockerPlugin:
     def __init__(self, base_url: str = "unix://var/run/docker.sock", key_file: str = None):
@@ -34,6 +61,27 @@ class DockerPlugin:
             api_client.mount("http+docker://ssh", ssh_client)
             self.docker_client.api = api_client
 
+    def ping(self):
+        try:
+            return self.docker_client.ping()
+        except (DockerException, RequestsConnectionError, OSError, EOFError) as error:
+            logging.error(error)
+        return False
+
+    def info(self):
+        """Daemon information, including its NCPU and MemTotal"""
+        try:
+            return self.docker_client.info()
+        except (DockerException, RequestsConnectionError, OSError, EOFError) as error:
+            logging.error(error)
+        return None
+
+    def close(self):
+        try:
+            self.docker_client.close()
+        except Exception as error:
+            logging.error(error)
+
     def add_image(self, data: bytes):
         try:
             images = self.docker_client.images.load(data)
@@ -42,17 +90,90 @@ class DockerPlugin:
             logging.error(error)
         return None
 
-    def run_container(self, image: str, port: int, container_name: str = None):
+    def load_image(self, chunks, size: int = None, progress=None):
+        """
+        Stream an image archive to the daemon chunk by chunk and return the
+        loaded image's id. chunks is any iterable of bytes, so the archive is
+        never held in memory; progress(sent, size) is called after each chunk.
+        """
+        def body():
+            sent = 0
+            for chunk in chunks:
+                yield chunk
+                sent += len(chunk)
+                if progress is not None:
+                    progress(sent, size)
+
         try:
-            password = "".join(
-                secrets.choice(ALLOWED_CHARACTERS) for _ in range(16)
-            )
+            image_ref = None
+            for message in self.docker_client.api.load_image(body()):
+                if "error" in message:
+                    logging.error(message["error"])
+                    return None
+                match = re.match(r"Loaded image(?: ID)?: (.+)", message.get("stream", "").strip())
+                if match:
+                    image_ref = match.group(1)
+            if image_ref is None:
+                logging.error("Docker did not report a loaded image")
+                return None
+            return self.docker_client.api.inspect_image(image_ref)["Id"]
+        except APIError as error:
+            logging.error(error)
+        return None
 
-            resources = {
-                "cpu_quota": 50000,  # 50% of a single core
-                "cpu_period": 100000,  # 100% of a single core
-                "memory": "128m",
-            }
+    def has_image(self, image_id: str):
+        """Whether the daemon already has the image, None if it could not be asked"""
+        image_id = self.get_image_id(image_id)
+        return None if image_id is None else bool(image_id)
+
+    def get_image_id(self, image: str):
+        """Id of a local image by id or reference, "" if it is missing, None on errors"""
+        try:
+            return self.docker_client.api.inspect_image(image)["Id"]
+        except APIError as error:
+            if error.status_code == 404:
+                return ""
+            logging.error(error)
+        return None
+
+    def export_image(self, image: str, chunk_size: int = 1024 * 1024):
+        """Stream of the image's archive (docker save), for load_image on another host"""
+        return self.docker_client.api.get_image(image, chunk_size=chunk_size)
+
+    def prewarm(self, image: str, source=None, expected_id: str = None):
+        """
+        Make sure image is present on this host, copying it from source (another
+        DockerPlugin) or, without one, pulling it from its registry. With
+        expected_id the local image id must match it. Returns the image id, or
+        None if the image could not be made available.
+        """
+        image_id = self.get_image_id(image)
+        if image_id is None:
+            return None
+        if not image_id:
+            if source is not None:
+                image_id = self.load_image(source.export_image(image))
+            elif not image.startswith("sha256:"):
+                try:
+                    repository, tag = parse_repository_tag(image)
+                    self.docker_client.api.pull(repository, tag=tag or "latest")
+                    image_id = self.get_image_id(image)
+                except APIError as error:
+                    logging.error(error)
+                    return None
+            else:
+                logging.error(f"Image {image} is not on this host and has no source to copy it from")
+                return None
+        if image_id and expected_id and image_id != expected_id:
+            logging.error(f"Image {image} has id {image_id}, expected {expected_id}")
+            return None
+        return image_id or None
+
+    def run_container(self, image: str, port: int, container_name: str = None, labels: dict = None,
+                      resources: dict = None, host_port: int = None):
+        try:
+            password = generate_password()
+            resources = {**CONTAINER_RESOURCES, **(resources or {})}
 
             container = self.docker_client.containers.run(
                 image,
@@ -60,22 +181,83 @@ class DockerPlugin:
                 auto_remove=True,
                 tty=True,
                 name=container_name,
+                labels={MANAGED_LABEL: "true", **(labels or {})},
                 environment={"PASS": password},
-                ports={f"{port}/tcp": None},
+                # None lets the daemon pick an ephemeral port
+                ports={f"{port}/tcp": host_port},
                 cpu_quota=resources["cpu_quota"],
                 cpu_period=resources["cpu_period"],
                 mem_limit=resources["memory"],
+                pids_limit=resources["pids_limit"],
+                cpuset_cpus=resources["cpuset_cpus"],
+                tmpfs=resources["tmpfs"],
             )
             return container.id, password
         except APIError as error:
             logging.error(error)
         return None
 
-    def stop_container(self, container_id: str):
+    def stop_container(self, container_id: str, timeout: int = None):
         try:
-            container = self.docker_client.containers.get(container_id)
-            container.stop()
+            # Stop by id directly rather than inspecting the container first
+            self.docker_client.api.stop(container_id, timeout=timeout)
             return True
+        except APIError as error:
+            if error.status_code == 404:
+                return True
+            logging.error(error)
+        return False
+
+    def list_managed_containers(self):
+        """Running containers started by this plugin, from a single list call"""
+        try:
+            return self.docker_client.api.containers(
+                filters={"label": f"{MANAGED_LABEL}=true"}
+            )
+        except APIError as error:
+            logging.error(error)
+        return None
+
+    def container_stats(self, container_id: str):
+        """
+        A single stats snapshot, without waiting for the daemon to take a
+        second one for CPU deltas (callers compute those between snapshots)
+        """
+        try:
+            return self.docker_client.api.stats(container_id, stream=False, one_shot=True)
+        except APIError as error:
+            if error.status_code != 404:
+                logging.error(error)
+        return None
+
+    def oom_events(self, since: int, until: int):
+        """Ids of managed containers the kernel OOM-killed a process in, once per kill"""
+        try:
+            events = self.docker_client.api.events(
+                since=since,
+                until=until,
+                filters={"type": "container", "event": "oom", "label": f"{MANAGED_LABEL}=true"},
+                decode=True,
+            )
+            try:
+                return [event.get("id") or event.get("Actor", {}).get("ID") for event in events]
+            finally:
+                events.close()
+        except APIError as error:
+            logging.error(error)
+        return None
+
+    def set_password(self, container_id: str, user: str, password: str):
+        """Change a user's password inside a running container"""
+        try:
+            container = self.docker_client.containers.get(container_id)
+            result = container.exec_run(
+                ["sh", "-c", f"echo {shlex.quote(f'{user}:{password}')} | chpasswd"],
+                user="root",
+            )
+            if result.exit_code == 0:
+                return True
+            logging.error(f"chpasswd failed in {container_id}: {result.output}")
         except APIError as error:
             logging.error(error)
         return False
@@ -103,6 +285,86 @@ class DockerPlugin:
             logging.error(error)
         return None
 
+    def wait_until_ready(self, container_id: str, port: int, timeout: float = 30,
+                         probe_host: str = None, banner: bytes = None, host_port: int = None):
+        """
+        Block until the container's port is mapped (and, with probe_host, accepting
+        connections) and return its port mapping, or None on timeout or exit.
+
+        Instead of re-inspecting on an interval this inspects once and otherwise
+        waits on the daemon's event stream for the container's start event. When
+        the container was run with a fixed host_port the mapping is already known
+        and only the probe is left.
+        """
+        deadline = time.time() + timeout
+        if host_port is not None:
+            ports = {f"{port}/tcp": [{"HostIp": "0.0.0.0", "HostPort": str(host_port)}]}
+        else:
+            ports = self.get_container_ports(container_id)
+            if not ports:
+                ports = self._wait_for_start(container_id, deadline)
+        if not ports:
+            return None
+
+        if probe_host:
+            mapping = ports.get(f"{port}/tcp") or []
+            if not mapping:
+                return None
+            host_port = int(mapping[0]["HostPort"])
+            if not self._probe(probe_host, host_port, deadline, banner):
+                return None
+        return ports
+
+    def _wait_for_start(self, container_id: str, deadline: float):
+        # Events since a few seconds ago are replayed, so a start that happened
+        # between the inspect above and subscribing is not missed
+        try:
+            stream = self.docker_client.api.events(
+                since=int(time.time()) - 5,
+                until=int(deadline) + 1,
+                filters={"type": "container", "container": container_id},
+                decode=True,
+            )
+        except APIError as error:
+            logging.error(error)
+            return None
+
+        try:
+            for event in stream:
+                action = event.get("Action") or event.get("status")
+                if action == "start":
+                    ports = self.get_container_ports(container_id)
+                    if ports:
+                        return ports
+                elif action in ("die", "destroy", "oom"):
+                    return None
+                if time.time() > deadline:
+                    break
+        finally:
+            stream.close()
+        return None
+
+    def _probe(self, host: str, port: int, deadline: float, banner: bytes = None):
+        """
+        Wait for host:port to accept connections. With a banner (b"SSH-" for sshd)
+        the service must also greet us, since Docker's port proxy accepts
+        connections before the process inside the container is listening.
+        """
+        delay = 0.05
+        while time.time() < deadline:
+            try:
+                with socket.create_connection((host, port), timeout=0.5) as sock:
+                    if banner is None:
+                        return True
+                    sock.settimeout(0.5)
+                    if sock.recv(len(banner)).startswith(banner):
+                        return True
+            except OSError:
+                pass
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+        return False
+
     def get_container_logs(self, container_id: str, stream: bool = True):
         try:
             container = self.docker_client.containers.get(container_id)
@@ -110,3 +372,92 @@ class DockerPlugin:
         except APIError as error:
             logging.error(error)
         return None
+
+
+# Errors that mean the underlying HTTP/SSH connection is unusable
+CONNECTION_ERRORS = (RequestsConnectionError, ConnectionError, EOFError)
+
+
+class DockerPool:
+    """
+    Thread-safe pool of DockerPlugin connections to a single host.
+
+    Idle connections are reused most-recently-used first so SSH sessions stay
+    warm. A connection idle for longer than health_check_interval is pinged
+    before it is handed out, and one that fails mid-use is discarded so the
+    next checkout reconnects.
+    """
+
+    def __init__(self, base_url: str, key_file: str = None, max_size: int = 8,
+                 health_check_interval: float = 30):
+        self.base_url = base_url
+        self.key_file = key_file
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _create(self):
+        return DockerPlugin(base_url=self.base_url, key_file=self.key_file)
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                return self._create()
+
+            plugin, last_used = entry
+            if time.monotonic() - last_used < self.health_check_interval or plugin.ping():
+                return plugin
+            logging.error(f"Discarding unhealthy Docker connection to {self.base_url}")
+            plugin.close()
+
+    def _checkin(self, plugin):
+        with self._lock:
+            self._idle.append((plugin, time.monotonic()))
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"No Docker connection to {self.base_url} available")
+        plugin = None
+        try:
+            plugin = self._checkout()
+            yield plugin
+        except CONNECTION_ERRORS:
+            if plugin is not None:
+                plugin.close()
+                plugin = None
+            raise
+        finally:
+            if plugin is not None:
+                self._checkin(plugin)
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for plugin, _ in idle:
+            plugin.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def get_pool(base_url: str, key_file: str = None, **kwargs):
+    """Process-wide DockerPool for a host, created on first use"""
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # Connections must not be shared with a forked parent
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get((base_url, key_file))
+        if pool is None:
+            pool = DockerPool(base_url, key_file, **kwargs)
+            _pools[(base_url, key_file)] = pool
+        return pool
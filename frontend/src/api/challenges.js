@@ -45,13 +45,37 @@ export const submitFlag = async (challengeId, flag) => {
 
 
 
-export const startChallenge = async (challengeId) => {
+// Container launches run in the background, poll the job until it settles
+const waitForProvisionJob = async (jobId, attempts = 60) => {
+  for (let i = 0; i < attempts; i++) {
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+    const response = await apiClient.get(`/challenges/jobs/${jobId}`);
+    if (response.data.status === 'ready') {
+      return response.data.container;
+    }
+    if (response.data.status === 'failed') {
+      throw new Error(response.data.error || 'Failed to start container');
+    }
+  }
+  throw new Error('Timed out waiting for container');
+};
+
+export const startChallenge = async (challengeId, attempts = 6) => {
   try{
     const response=await apiClient.post(`/challenges/${challengeId}/start`,{
       challengeId
     });
+    if (response.status === 202) {
+      return await waitForProvisionJob(response.data.job_id);
+    }
     return response.data;
   }catch(error){
+    // Shared challenge instances are still starting
+    if (error.response?.status === 503 && attempts > 1) {
+      const retryAfter = Number(error.response.headers['retry-after']) || 5;
+      await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+      return startChallenge(challengeId, attempts - 1);
+    }
     console.error("Failed to start container");
     throw error;
   }
@@ -68,9 +92,34 @@ export const getAdminChallenges = async () => {
   }
 };
 
-export const createChallenge = async (challengeData) => {
+// Runs request with an upload id and, while it is pending, reports the server-side
+// image upload progress ({stage, host, done, total, percent}) to onProgress
+const withImageUploadProgress = async (request, onProgress) => {
+  if (!onProgress) {
+    return request({});
+  }
+  const uploadId = crypto.randomUUID();
+  const timer = setInterval(async () => {
+    try {
+      const response = await apiClient.get(`api/admin/uploads/${uploadId}`);
+      onProgress(response.data);
+    } catch {
+      // Not started yet
+    }
+  }, 1000);
+  try {
+    return await request({ params: { upload_id: uploadId } });
+  } finally {
+    clearInterval(timer);
+  }
+};
+
+export const createChallenge = async (challengeData, onProgress) => {
   try {
-    const response = await apiClient.post('api/admin/challenges/create', challengeData);
+    const response = await withImageUploadProgress(
+      (config) => apiClient.post('api/admin/challenges/create', challengeData, config),
+      onProgress
+    );
     return response.data;
   } catch (error) {
     console.error('Error creating challenge:', error);
@@ -79,11 +128,11 @@ export const createChallenge = async (challengeData) => {
 };
 
 
-export const updateChallenge = async (challengeId, challengeData) => {
+export const updateChallenge = async (challengeId, challengeData, onProgress) => {
   try {
-    const response = await apiClient.patch(
-      `api/admin/challenges/${challengeId}/update`,
-      challengeData
+    const response = await withImageUploadProgress(
+      (config) => apiClient.patch(`api/admin/challenges/${challengeId}/update`, challengeData, config),
+      onProgress
     );
     return response.data;
   } catch (error) {
@@ -135,4 +184,47 @@ export const purchaseHint = async (challengeId, hintIndex) => {
     console.error('Error purchasing hint:', error);
     throw error;
   }
-};
\ No newline at end of file
+};
+// Resumable image upload: the file is sent in chunks and, after a failed chunk,
+// resumes from the offset the server acknowledged. Resolves with the finished upload.
+export const uploadChallengeImage = async (file, { challengeId, onProgress, retries = 5 } = {}) => {
+  const start = await apiClient.post('api/admin/image-uploads', {
+    filename: file.name,
+    size: file.size,
+    challenge_id: challengeId,
+  });
+  let upload = start.data;
+  let failures = 0;
+
+  while (upload.status === 'uploading' && upload.offset < upload.size) {
+    const chunk = file.slice(upload.offset, upload.offset + upload.chunk_size);
+    try {
+      const response = await apiClient.put(`api/admin/image-uploads/${upload.upload_id}`, chunk, {
+        headers: { 'Content-Type': 'application/octet-stream', 'Upload-Offset': upload.offset },
+      });
+      upload = response.data;
+      failures = 0;
+      onProgress?.({ stage: 'uploading', done: upload.offset, total: upload.size });
+    } catch (error) {
+      if (++failures > retries) {
+        console.error('Error uploading image:', error);
+        throw error;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000 * failures));
+      upload = (await apiClient.get(`api/admin/image-uploads/${upload.upload_id}`)).data;
+    }
+  }
+
+  if (upload.status === 'uploading') {
+    upload = (await apiClient.post(`api/admin/image-uploads/${upload.upload_id}/commit`)).data;
+  }
+  while (upload.status === 'loading') {
+    await new Promise((resolve) => setTimeout(resolve, 2000));
+    upload = (await apiClient.get(`api/admin/image-uploads/${upload.upload_id}`)).data;
+    onProgress?.({ stage: 'loading' });
+  }
+  if (upload.status === 'failed') {
+    throw new Error(upload.error);
+  }
+  return upload;
+};
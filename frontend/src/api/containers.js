@@ -1,15 +1,13 @@
-import apiClient from './config';
+import apiClient, { API_URL } from './config';
 
-// Get all containers
-export const getContainers = async () => {
+// Get a page of containers, optionally filtered by team, challenge, host or status
+export const getContainers = async (params = {}) => {
   try {
-    
-    const response = await apiClient.get('/api/admin/containers');
-    // console.log(response.data);
+    const response = await apiClient.get('/api/admin/containers', { params });
     return response.data;
   } catch (error) {
     console.error('Error fetching containers:', error);
-    return []; // Return empty array on error
+    return { count: 0, results: [] }; // Return an empty page on error
   }
 };
 
@@ -24,6 +22,26 @@ export const stopContainer = async (containerId) => {
   }
 };
 
+// Restart a container on the Docker host it runs on
+export const restartContainer = async (containerId) => {
+  try {
+    const response = await apiClient.post(`/api/admin/containers/${containerId}/restart`);
+    return response.data;
+  } catch (error) {
+    console.error('Error restarting container:', error);
+    throw error;
+  }
+};
+
+// URL of a container's live log stream, for an EventSource (which cannot send headers)
+export const containerLogsUrl = (containerId, { follow = true, tail = 100, since } = {}) => {
+  const params = new URLSearchParams({ follow, tail });
+  if (since) params.set('since', since);
+  const tokenString = localStorage.getItem('token');
+  if (tokenString) params.set('token', JSON.parse(tokenString).access);
+  return `${API_URL}/api/admin/containers/${containerId}/logs?${params}`;
+};
+
 // Start a container
 export const startContainer = async (containerId) => {
   try {
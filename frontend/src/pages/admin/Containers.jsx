@@ -4,18 +4,25 @@ import { Link } from 'react-router-dom';
 
 function AdminContainers() {
   const [containers, setContainers] = useState([]);
+  const [page, setPage] = useState(1);
+  const [count, setCount] = useState(0);
+  const [statusFilter, setStatusFilter] = useState('');
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const pageSize = 50;
 
   useEffect(() => {
     fetchContainers();
-  }, []);
+  }, [page, statusFilter]);
 
   const fetchContainers = async () => {
     try {
-      const data = await getContainers();
-      // Ensure data is an array
-      setContainers(Array.isArray(data) ? data : []);
+      const params = { page, page_size: pageSize };
+      if (statusFilter) params.status = statusFilter;
+      const data = await getContainers(params);
+      // Ensure results is an array
+      setContainers(Array.isArray(data?.results) ? data.results : []);
+      setCount(data?.count || 0);
       setError(null);
     } catch (err) {
       setError('Failed to fetch containers');
@@ -41,8 +48,10 @@ function AdminContainers() {
       case 'running':
         return 'bg-green-100 text-green-800';
       case 'stopped':
+      case 'unknown':
         return 'bg-yellow-100 text-yellow-800';
       case 'exited':
+      case 'missing':
         return 'bg-red-100 text-red-800';
       default:
         return 'bg-gray-100 text-gray-800';
@@ -62,6 +71,19 @@ function AdminContainers() {
             {error}
           </div>
         )}
+        <div className="mt-4 flex items-center gap-4">
+          <select
+            value={statusFilter}
+            onChange={(e) => { setStatusFilter(e.target.value); setPage(1); }}
+            className="px-3 py-1 border rounded-lg"
+          >
+            <option value="">All statuses</option>
+            <option value="running">Running</option>
+            <option value="missing">Missing</option>
+            <option value="unknown">Unknown</option>
+          </select>
+          <span className="text-sm text-gray-700">{count} containers</span>
+        </div>
       </div>
 
       <div className="overflow-x-auto bg-white rounded-lg shadow">
@@ -77,6 +99,9 @@ function AdminContainers() {
               <th className="px-6 py-3 text-left text-xs font-medium text-gray-900 uppercase tracking-wider">
                 Challenge
               </th>
+              <th className="px-6 py-3 text-left text-xs font-medium text-gray-900 uppercase tracking-wider">
+                Status
+              </th>
               <th className="px-6 py-3 text-left text-xs font-medium text-gray-900 uppercase tracking-wider">
                 SSH Details
               </th>
@@ -88,7 +113,7 @@ function AdminContainers() {
           <tbody className="bg-[#FFF7ED] divide-y divide-gray-200">
             {containers.length > 0 ? (
               containers.map((container) => (
-                <tr key={container.id}>
+                <tr key={container.container_id}>
                   <td className="px-6 py-4 whitespace-nowrap">
                     <span className="font-mono text-sm text-gray-900">{container.container_id}</span>
                   </td>
@@ -108,6 +133,12 @@ function AdminContainers() {
                       {container.challenge?.title || 'N/A'}
                     </Link>
                   </td>
+                  <td className="px-6 py-4 whitespace-nowrap">
+                    <span className={`px-2 py-1 rounded-full text-xs ${getStatusBadgeClass(container.status)}`}>
+                      {container.status}
+                    </span>
+                    <p className="mt-1 text-xs text-gray-700">{container.docker_host}</p>
+                  </td>
                   <td className="px-6 py-4 whitespace-nowrap">
                     <div className="text-sm text-gray-900">
                       <p>Host: {container.ssh_host || 'N/A'}</p>
@@ -136,6 +167,28 @@ function AdminContainers() {
           </tbody>
         </table>
       </div>
+
+      {count > pageSize && (
+        <div className="mt-4 flex justify-end items-center gap-2">
+          <button
+            onClick={() => setPage(page - 1)}
+            disabled={page === 1}
+            className="px-3 py-1 bg-gray-200 rounded-lg disabled:opacity-50"
+          >
+            Previous
+          </button>
+          <span className="text-sm text-gray-700">
+            Page {page} of {Math.ceil(count / pageSize)}
+          </span>
+          <button
+            onClick={() => setPage(page + 1)}
+            disabled={page * pageSize >= count}
+            className="px-3 py-1 bg-gray-200 rounded-lg disabled:opacity-50"
+          >
+            Next
+          </button>
+        </div>
+      )}
     </div>
   );
 }